@@ -0,0 +1,112 @@
+"""
+Single-flight coalescing for prompt generation.
+WHAT: Concurrent requests with the same (genre, mood, preferences, template) share one
+      upstream call.
+WHY: Traffic spikes send many identical /prompt requests at once, and each one
+     would otherwise pay for its own completion.
+HOW: The first request opens a "flight" and waits a few milliseconds (or until the
+     fan-in limit is reached) for identical requests to join. One completion is then
+     made with n = number of waiters, and each waiter gets its own choice, so users
+     still see different prompts while system/user prompt tokens are paid once.
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+# fetch(n) -> up to n results (prompt texts, or (text, usage) pairs)
+Fetch = Callable[[int], Awaitable[List[Any]]]
+
+
+class _Flight:
+    def __init__(self):
+        self.waiters: List[asyncio.Future] = []
+        self.full = asyncio.Event()
+        self.closed = False
+
+
+class PromptCoalescer:
+    """Per-worker single-flight groups keyed on the normalized prompt request."""
+
+    def __init__(self, max_fan_in: int = 8, window_seconds: float = 0.01):
+        self.max_fan_in = max_fan_in
+        self.window_seconds = window_seconds
+        self._open: Dict[Hashable, _Flight] = {}
+        # The loop only keeps weak references to tasks; hold running flights until they finish
+        self._running: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.flights = 0
+        self.largest_flight = 0
+
+    async def get(self, key: Hashable, fetch: Fetch) -> Any:
+        """
+        Join (or start) the flight for key and return this caller's result.
+        fetch(n) is only called by the flight leader and must return up to n results.
+        """
+        self.requests += 1
+        flight = self._open.get(key)
+        leader = flight is None or flight.closed
+        if leader:
+            flight = _Flight()
+            self._open[key] = flight
+
+        future = asyncio.get_running_loop().create_future()
+        flight.waiters.append(future)
+        if len(flight.waiters) >= self.max_fan_in:
+            self._close(key, flight)
+            flight.full.set()
+        if leader:
+            task = asyncio.create_task(self._run(key, flight, fetch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        return await future
+
+    def _close(self, key: Hashable, flight: _Flight) -> None:
+        flight.closed = True
+        if self._open.get(key) is flight:
+            del self._open[key]
+
+    async def _run(self, key: Hashable, flight: _Flight, fetch: Fetch) -> None:
+        try:
+            await asyncio.wait_for(flight.full.wait(), timeout=self.window_seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._close(key, flight)
+
+        waiters = [f for f in flight.waiters if not f.done()]
+        if not waiters:
+            return
+        self.flights += 1
+        self.largest_flight = max(self.largest_flight, len(waiters))
+        try:
+            prompts = await fetch(len(waiters))
+            if not prompts:
+                raise RuntimeError("Upstream returned no choices")
+        except Exception as e:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for i, waiter in enumerate(waiters):
+            if not waiter.done():
+                waiter.set_result(prompts[i % len(prompts)])
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "upstream_calls": self.flights,
+            "coalesced": self.requests - self.flights,
+            "largest_flight": self.largest_flight,
+            "max_fan_in": self.max_fan_in,
+            "window_ms": self.window_seconds * 1000,
+        }
+
+
+def create_prompt_coalescer() -> Optional[PromptCoalescer]:
+    """Build from PROMPT_COALESCE_* settings; PROMPT_COALESCE_ENABLED=false disables it."""
+    if os.getenv("PROMPT_COALESCE_ENABLED", "true").lower() != "true":
+        return None
+    return PromptCoalescer(
+        max_fan_in=int(os.getenv("PROMPT_COALESCE_MAX_FAN_IN", "8")),
+        window_seconds=float(os.getenv("PROMPT_COALESCE_WINDOW_MS", "10")) / 1000,
+    )
@@ -7,16 +7,19 @@ writing history, preferences, and current stage in their book development.
 The system adapts over time to help users develop more comprehensive and
 cohesive narratives that can form chapters in their book.
 """
+import asyncio
+import heapq
 import json
 import logging
 import random
 from datetime import datetime
 from enum import Enum
-from typing import Dict, List, Optional, Union
+from typing import Awaitable, Callable, ClassVar, Dict, Iterable, List, Optional, Union
 
-import azure.ai.openai as openai
 from pydantic import BaseModel
 
+from ai.story_history import StoryHistory
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -41,6 +44,141 @@ class StoryMetadata(BaseModel):
     characters: Optional[List[str]] = []
     sentiment: Optional[str] = None
 
+class StoryRef(BaseModel):
+    """Lightweight pointer to one of the user's stories"""
+    story_id: str
+    title: Optional[str] = None
+    created_at: Optional[datetime] = None  # None in summaries stored before it was tracked
+
+class UserHistorySummary(BaseModel):
+    """
+    Incrementally maintained digest of a user's writing history.
+
+    Updated once per story write, so stage determination and prompt building
+    never need to load or re-parse the full content history. Stories may be
+    folded in out of order (analysis finishes in worker/sweep/import order), so
+    "latest" and "recent" follow created_at, not the order of apply() calls.
+    """
+    user_id: str
+    story_count: int = 0
+    latest_story_id: Optional[str] = None
+    latest_title: Optional[str] = None
+    latest_content_preview: Optional[str] = None
+    latest_completion_status: Optional[float] = None
+    latest_themes: List[str] = []
+    latest_created_at: Optional[datetime] = None
+    theme_counts: Dict[str, int] = {}
+    character_counts: Dict[str, int] = {}
+    recent_stories: List[StoryRef] = []  # oldest to newest by created_at, bounded by RECENT_STORIES_LIMIT
+    version: int = 0  # bumped on every change to the user's stories
+
+    RECENT_STORIES_LIMIT: ClassVar[int] = 20
+
+    def apply(self, story: StoryMetadata) -> "UserHistorySummary":
+        """Fold one new story into the summary (O(themes + characters))."""
+        self.story_count += 1
+        self.version += 1
+        if self.latest_created_at is None or story.created_at >= self.latest_created_at:
+            self.latest_story_id = story.story_id
+            self.latest_title = story.title
+            self.latest_content_preview = story.content_preview
+            self.latest_completion_status = story.completion_status
+            self.latest_themes = list(story.themes or [])
+            self.latest_created_at = story.created_at
+        for theme in story.themes or []:
+            self.theme_counts[theme] = self.theme_counts.get(theme, 0) + 1
+        for character in story.characters or []:
+            self.character_counts[character] = self.character_counts.get(character, 0) + 1
+        # Insert after every ref created no later than this story (refs without a date sort first)
+        position = len(self.recent_stories)
+        while position and self._later(self.recent_stories[position - 1].created_at, story.created_at):
+            position -= 1
+        self.recent_stories.insert(
+            position, StoryRef(story_id=story.story_id, title=story.title, created_at=story.created_at)
+        )
+        del self.recent_stories[:-self.RECENT_STORIES_LIMIT]
+        return self
+
+    def revise(self, old: StoryMetadata, new: StoryMetadata) -> "UserHistorySummary":
+        """Replace an edited story's earlier analysis with its new one."""
+        self.version += 1
+        for theme in old.themes or []:
+            self._decrement(self.theme_counts, theme)
+        for character in old.characters or []:
+            self._decrement(self.character_counts, character)
+        for theme in new.themes or []:
+            self.theme_counts[theme] = self.theme_counts.get(theme, 0) + 1
+        for character in new.characters or []:
+            self.character_counts[character] = self.character_counts.get(character, 0) + 1
+        if self.latest_story_id == new.story_id:
+            self.latest_title = new.title
+            self.latest_content_preview = new.content_preview
+            self.latest_completion_status = new.completion_status
+            self.latest_themes = list(new.themes or [])
+        for ref in self.recent_stories:
+            if ref.story_id == new.story_id:
+                ref.title = new.title
+        return self
+
+    @staticmethod
+    def _later(created_at: Optional[datetime], than: datetime) -> bool:
+        return created_at is not None and created_at > than
+
+    @staticmethod
+    def _decrement(counts: Dict[str, int], key: str) -> None:
+        if counts.get(key, 0) > 1:
+            counts[key] -= 1
+        else:
+            counts.pop(key, None)
+
+    @classmethod
+    def from_history(cls, user_id: str, history: Iterable[StoryMetadata]) -> "UserHistorySummary":
+        """
+        Summary of a whole history, equal to apply() on each story in turn. Folds
+        into locals and builds the model once, so it is one cheap pass per story.
+        """
+        count = 0
+        latest = None
+        theme_counts: Dict[str, int] = {}
+        character_counts: Dict[str, int] = {}
+        recent = []  # min-heap of (created_at, position, story_id, title), the newest stories
+        for position, story in enumerate(history):
+            count += 1
+            created_at = story.created_at
+            if latest is None or created_at >= latest.created_at:
+                latest = story
+            for theme in story.themes or []:
+                theme_counts[theme] = theme_counts.get(theme, 0) + 1
+            for character in story.characters or []:
+                character_counts[character] = character_counts.get(character, 0) + 1
+            entry = (created_at, position, story.story_id, story.title)
+            if len(recent) < cls.RECENT_STORIES_LIMIT:
+                heapq.heappush(recent, entry)
+            elif entry > recent[0]:
+                heapq.heapreplace(recent, entry)
+        if latest is None:
+            return cls(user_id=user_id)
+        return cls(
+            user_id=user_id,
+            story_count=count,
+            version=count,
+            latest_story_id=latest.story_id,
+            latest_title=latest.title,
+            latest_content_preview=latest.content_preview,
+            latest_completion_status=latest.completion_status,
+            latest_themes=list(latest.themes or []),
+            latest_created_at=latest.created_at,
+            theme_counts=theme_counts,
+            character_counts=character_counts,
+            recent_stories=[
+                StoryRef(story_id=story_id, title=title, created_at=created_at)
+                for created_at, _, story_id, title in sorted(recent)
+            ],
+        )
+
+    def top_themes(self, limit: int = 5) -> List[str]:
+        return sorted(self.theme_counts, key=lambda t: (-self.theme_counts[t], t))[:limit]
+
 class UserProfile(BaseModel):
     """Information about the user to personalize prompts"""
     user_id: str
@@ -51,6 +189,32 @@ class UserProfile(BaseModel):
     genre_selected: bool = False
     title_selected: bool = False
 
+class HistoryAnalysis(BaseModel):
+    """AI analyses of a user's history; deterministic for a given history version"""
+    suggested_genres: List[str]
+    suggested_titles: List[str]
+    themes: List[str]
+    fallback: bool = False  # True if any analysis used defaults because generation failed
+
+# search(query, limit) -> matching story documents (dicts with "id" and "title"), best first
+StorySearch = Callable[[str, int], List[Dict]]
+
+# complete(system_prompt, user_prompt) -> completion text
+Completion = Callable[[str, str], Awaitable[str]]
+
+DEFAULT_GENRES = ["Memoir", "Personal Development", "Travel Writing", "Coming of Age"]
+DEFAULT_TITLES = [
+    "Echoes of Memory: A Personal Journey",
+    "Between the Lines of Life",
+    "Moments That Defined Me",
+    "The Tapestry of Experience"
+]
+
+ANALYSIS_INSTRUCTION = (
+    "You analyze a writer's collection of personal stories. {TASK} "
+    "Reply with a JSON array of at most {COUNT} short strings and nothing else."
+)
+
 class ProgressivePromptingSystem:
     """
     A system that provides intelligent writing prompts based on user's 
@@ -61,7 +225,10 @@ class ProgressivePromptingSystem:
         self,
         openai_client,
         user_profile: Dict,
-        content_history: List[Dict] = None
+        content_history: Union[List[Dict], StoryHistory] = None,
+        history_summary: Optional[UserHistorySummary] = None,
+        story_search: Optional[StorySearch] = None,
+        complete: Optional[Completion] = None
     ):
         """
         Initialize the prompting system with user information and content history.
@@ -69,23 +236,54 @@ class ProgressivePromptingSystem:
         Args:
             openai_client: Azure OpenAI client for generating personalized prompts
             user_profile: Information about the user
-            content_history: List of user's previous stories/entries
+            content_history: List of user's previous stories/entries, or a
+                StoryHistory (kept as-is, without building a model per entry;
+                the stage is read from its columns and the summary built on demand)
+            history_summary: Precomputed summary of the history; when given, the
+                full content history is not needed (or parsed) at all
+            story_search: Ranked search over the user's stories, used to pick
+                the most relevant story for refinement/continuation prompts
+            complete: Async chat completion (system, user) -> text used for the
+                history analyses; without it the analyses return defaults
         """
         self.openai_client = openai_client
+        self.story_search = story_search
+        self.complete = complete
+        self.analysis: Optional[HistoryAnalysis] = None
         self.user_profile = UserProfile(**user_profile)
         self.content_history = []
+        self._history_summary = history_summary
         
-        # Process content history if provided
-        if content_history:
-            for story in content_history:
-                if isinstance(story, dict):
-                    self.content_history.append(StoryMetadata(**story))
-                else:
-                    self.content_history.append(story)
+        if history_summary is None:
+            # Process content history if provided
+            if isinstance(content_history, StoryHistory):
+                # Summarized lazily: the stage is read straight from the columns
+                self.content_history = content_history
+            else:
+                for story in content_history or []:
+                    if isinstance(story, dict):
+                        self.content_history.append(StoryMetadata(**story))
+                    else:
+                        self.content_history.append(story)
+                self._history_summary = UserHistorySummary.from_history(self.user_profile.user_id, self.content_history)
         
         # Determine the current prompting stage based on user history
         self.prompting_stage = self._determine_prompting_stage()
-        logger.info(f"Initialized prompting system in stage: {self.prompting_stage}")
+        logger.debug("Initialized prompting system in stage: %s", self.prompting_stage)
+    
+    @property
+    def history_summary(self) -> UserHistorySummary:
+        """Summary of the history; built on first use for a columnar StoryHistory."""
+        if self._history_summary is None:
+            self._history_summary = UserHistorySummary.from_history(self.user_profile.user_id, self.content_history)
+        return self._history_summary
+    
+    def _stage_inputs(self):
+        """(story count, latest completion status), in O(1) for a not yet summarized StoryHistory."""
+        if self._history_summary is None:
+            latest = self.content_history.latest()
+            return len(self.content_history), latest.completion_status if latest else None
+        return self._history_summary.story_count, self._history_summary.latest_completion_status
     
     def _determine_prompting_stage(self) -> PromptType:
         """
@@ -95,33 +293,88 @@ class ProgressivePromptingSystem:
         Returns:
             PromptType: The appropriate prompt type for the user's current state
         """
+        story_count, latest_completion_status = self._stage_inputs()
+        
         # If no content yet, start with a new topic
-        if not self.content_history:
+        if story_count == 0:
             return PromptType.NEW_TOPIC
         
-        # Get most recent story
-        recent_entry = self.content_history[-1]
-        
         # If the most recent story is incomplete, suggest continuing it
-        if recent_entry.completion_status < 0.8:
+        if latest_completion_status is not None and latest_completion_status < 0.8:
             return PromptType.CONTINUATION
         
         # Suggest genre after enough stories have been written
-        if len(self.content_history) >= 10 and not self.user_profile.genre_selected:
+        if story_count >= 10 and not self.user_profile.genre_selected:
             return PromptType.GENRE_SUGGESTION
         
         # Suggest title after genre is selected and more content is available
-        if (len(self.content_history) >= 15 and 
+        if (story_count >= 15 and 
             self.user_profile.genre_selected and 
             not self.user_profile.title_selected):
             return PromptType.TITLE_RECOMMENDATION
         
         # Alternate between new topics and refinement based on content amount
-        if len(self.content_history) % 3 == 0:
+        if story_count % 3 == 0:
             return PromptType.REFINEMENT
         else:
             return PromptType.NEW_TOPIC
     
+    # Stages whose prompts draw on the AI history analyses
+    ANALYSIS_STAGES = (PromptType.GENRE_SUGGESTION, PromptType.TITLE_RECOMMENDATION, PromptType.REFINEMENT)
+    
+    @property
+    def needs_analysis(self) -> bool:
+        return self.analysis is None and self.prompting_stage in self.ANALYSIS_STAGES
+    
+    async def analyze_history(self) -> HistoryAnalysis:
+        """
+        Run the genre, title and theme analyses concurrently. Each one falls back
+        to defaults on failure, so this never raises.
+        """
+        summary = self.history_summary
+        (genres, genres_ok), (titles, titles_ok), (themes, themes_ok) = await asyncio.gather(
+            self._ask_list("Suggest book genres that fit the collection.", 4, DEFAULT_GENRES),
+            self._ask_list("Suggest titles for a book made from these stories.", 4, DEFAULT_TITLES),
+            self._ask_list("List the recurring themes across the stories.", 5, summary.top_themes(5)),
+        )
+        return HistoryAnalysis(
+            suggested_genres=genres,
+            suggested_titles=titles,
+            themes=themes,
+            fallback=not (genres_ok and titles_ok and themes_ok)
+        )
+    
+    def _history_digest(self) -> str:
+        """Bounded description of the history sent to the analyses (not the full text)."""
+        summary = self.history_summary
+        lines = [f"Stories written: {summary.story_count}"]
+        if summary.theme_counts:
+            lines.append(f"Frequent themes: {', '.join(summary.top_themes(10))}")
+        if summary.character_counts:
+            characters = sorted(summary.character_counts, key=lambda c: -summary.character_counts[c])[:10]
+            lines.append(f"Recurring people: {', '.join(characters)}")
+        titles = [ref.title for ref in summary.recent_stories if ref.title]
+        if titles:
+            lines.append(f"Recent story titles: {'; '.join(titles)}")
+        if summary.latest_content_preview:
+            lines.append(f"Latest story opening: {summary.latest_content_preview}")
+        return "\n".join(lines)
+    
+    async def _ask_list(self, task: str, count: int, fallback: List[str]):
+        """One analysis completion parsed as a list of strings; returns (items, succeeded)."""
+        if self.complete is None:
+            return list(fallback), True
+        system_prompt = ANALYSIS_INSTRUCTION.format(TASK=task, COUNT=count)
+        try:
+            text = await self.complete(system_prompt, self._history_digest())
+            items = json.loads(text)
+            if not isinstance(items, list) or not items:
+                raise ValueError("expected a non-empty JSON array")
+            return [str(item).strip() for item in items][:count], True
+        except Exception as e:
+            logger.warning(f"History analysis failed ({task}): {e}")
+            return list(fallback), False
+    
     async def generate_next_prompt(self) -> Dict:
         """
         Generates the most appropriate next prompt for the user based on 
@@ -131,6 +384,9 @@ class ProgressivePromptingSystem:
             Dict: The generated prompt with metadata
         """
         try:
+            if self.needs_analysis:
+                self.analysis = await self.analyze_history()
+            
             # Determine which type of prompt to generate
             if self.prompting_stage == PromptType.CONTINUATION:
                 result = await self._create_continuation_prompt()
@@ -164,21 +420,26 @@ class ProgressivePromptingSystem:
     
     async def _create_continuation_prompt(self) -> Dict:
         """Generate a prompt to continue the user's most recent story"""
-        if not self.content_history:
-            return self._create_new_topic_prompt()
-        
-        recent_story = self.content_history[-1]
+        summary = self.history_summary
+        if not summary.story_count:
+            return await self._create_new_topic_prompt()
         
         # In a real implementation, you would use the OpenAI client to generate 
         # a personalized continuation prompt based on the recent story content
         # For this example, we'll return a templated response
         
-        prompt = f"What happens next in your story about {recent_story.content_preview}?"
-        
-        return {
+        prompt = f"What happens next in your story about {summary.latest_content_preview}?"
+        result = {
             "prompt": prompt,
-            "related_topics": recent_story.themes or ["narrative", "development", "continuation"]
+            "related_topics": summary.latest_themes or ["narrative", "development", "continuation"]
         }
+        
+        # Point the writer at earlier stories that touch the same ground
+        query = " ".join(summary.latest_themes) or summary.latest_title or ""
+        related = [s for s in await self._search_stories(query, 4) if s["id"] != summary.latest_story_id]
+        if related:
+            result["additional_context"] = {"related_story_ids": [s["id"] for s in related[:3]]}
+        return result
     
     async def _create_new_topic_prompt(self) -> Dict:
         """Generate a prompt for a new story topic"""
@@ -202,11 +463,7 @@ class ProgressivePromptingSystem:
     
     async def _suggest_genres(self) -> Dict:
         """Analyze existing stories and suggest potential genres for the book"""
-        # In a real implementation, you would analyze the content history
-        # using Azure OpenAI to identify common themes and suggest genres
-        
-        # For this example, we'll provide a mock response
-        suggested_genres = ["Memoir", "Personal Development", "Travel Writing", "Coming of Age"]
+        suggested_genres = self.analysis.suggested_genres if self.analysis else DEFAULT_GENRES
         
         prompt = f"Which genre speaks to you most: {', '.join(suggested_genres)}?"
         
@@ -220,16 +477,7 @@ class ProgressivePromptingSystem:
     
     async def _recommend_titles(self) -> Dict:
         """Suggest potential book titles based on content analysis"""
-        # For a real implementation, this would analyze themes and content
-        # using Azure OpenAI to generate appropriate title suggestions
-        
-        # Mock response
-        suggested_titles = [
-            "Echoes of Memory: A Personal Journey",
-            "Between the Lines of Life",
-            "Moments That Defined Me",
-            "The Tapestry of Experience"
-        ]
+        suggested_titles = self.analysis.suggested_titles if self.analysis else DEFAULT_TITLES
         
         prompt = f"Which potential title resonates most: {', '.join(suggested_titles)}?"
         
@@ -243,26 +491,42 @@ class ProgressivePromptingSystem:
     
     async def _create_refinement_prompt(self) -> Dict:
         """Generate a prompt to refine or expand an existing story"""
-        if not self.content_history:
-            return self._create_new_topic_prompt()
-        
-        # In a real implementation, this would select a story that could benefit
-        # from refinement based on AI analysis of the content
+        recent_stories = self.history_summary.recent_stories
+        if not recent_stories:
+            return await self._create_new_topic_prompt()
         
-        # For this example, choose a random story from the user's history
-        story_to_refine = random.choice(self.content_history)
+        # Prefer the story most relevant to the user's recurring themes;
+        # fall back to a random recent story when nothing matches
+        themes = self.analysis.themes if self.analysis else self.history_summary.top_themes(3)
+        hits = await self._search_stories(" ".join(themes[:3]), 1)
+        if hits:
+            story_id, title = hits[0]["id"], hits[0]["title"]
+        else:
+            story_to_refine = random.choice(recent_stories)
+            story_id, title = story_to_refine.story_id, story_to_refine.title
         
-        prompt = f"What sensory details would make your story about {story_to_refine.title or 'your experience'} more vivid?"
+        prompt = f"What sensory details would make your story about {title or 'your experience'} more vivid?"
         
         return {
             "prompt": prompt,
             "related_topics": ["editing", "enhancement", "detail"],
             "additional_context": {
-                "story_id": story_to_refine.story_id
+                "story_id": story_id
             }
         }
     
-    def _create_reflection_prompt(self) -> Dict:
+    async def _search_stories(self, query: str, limit: int) -> List[Dict]:
+        """Ranked story search, or [] when no search is configured or the query is empty."""
+        if self.story_search is None or not query.strip():
+            return []
+        try:
+            # The search reads the story store; keep it off the event loop
+            return await asyncio.to_thread(self.story_search, query, limit)
+        except Exception as e:
+            logger.warning(f"Story search failed: {e}")
+            return []
+    
+    async def _create_reflection_prompt(self) -> Dict:
         """Generate a prompt asking the user to reflect on their stories"""
         prompt = "What patterns do you notice in your stories?"
         
@@ -0,0 +1,60 @@
+"""
+Versioned per-user memoization for history analyses.
+WHAT: Caches one async result per user, tagged with the version of the user's
+      story history it was computed from.
+WHY: Genre/title/theme analyses run Azure OpenAI over the user's history. For a given
+     history the answer doesn't change, so recomputing it on every /prompt/next call
+     only burns tokens and latency.
+HOW: get(user, version, compute) returns the stored result while the version matches
+     and recomputes once it changes (i.e. the user wrote or edited a story). Concurrent
+     callers for the same user and version share one in-flight computation.
+     Entries are kept in LRU order up to max_users.
+"""
+
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class VersionedMemo:
+    """Per-worker LRU of (version, task) per key."""
+
+    def __init__(self, max_users: int = 1000):
+        self.max_users = max_users
+        self._entries: "OrderedDict[str, Tuple[Hashable, asyncio.Future]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: str, version: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            self._entries.move_to_end(user_id)
+            future = entry[1]
+        else:
+            self.misses += 1
+            future = asyncio.ensure_future(compute())
+            self._entries[user_id] = (version, future)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        try:
+            # shield: one caller going away must not cancel the shared computation
+            return await asyncio.shield(future)
+        except Exception:
+            self.invalidate(user_id, version)
+            raise
+
+    def invalidate(self, user_id: str, version: Hashable = None) -> None:
+        """Drop the user's entry (only if it is for version, when one is given)."""
+        entry = self._entries.get(user_id)
+        if entry is not None and (version is None or entry[0] == version):
+            del self._entries[user_id]
+
+    def stats(self) -> Dict:
+        return {"users": len(self._entries), "max_users": self.max_users, "hits": self.hits, "misses": self.misses}
+
+
+def create_analysis_memo() -> VersionedMemo:
+    return VersionedMemo(max_users=int(os.getenv("PROMPT_ANALYSIS_MEMO_MAX_USERS", "1000")))
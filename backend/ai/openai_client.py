@@ -0,0 +1,78 @@
+"""
+Process-wide async Azure OpenAI client.
+WHAT: One lazily created AsyncAzureOpenAI client per worker process.
+WHY: Building a client (and a fresh HTTPS connection) per request adds a TLS
+     handshake to every prompt and ties up a threadpool thread per completion.
+HOW: The client wraps a pooled httpx.AsyncClient (HTTP/2 when `h2` is installed,
+     keep-alive, env-configurable limits) and is closed from the app lifespan.
+"""
+
+import os
+from typing import Optional, Tuple
+
+import httpx
+
+_client = None
+_deployment: Optional[str] = None
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """Pooled transport shared by every completion made from this worker."""
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30")),
+    )
+    http2 = os.getenv("OPENAI_HTTP2", "true").lower() == "true" and _http2_available()
+    timeout = httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT", "30")), connect=5.0)
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+
+
+def get_async_openai_client() -> Tuple[Optional[object], Optional[str]]:
+    """
+    Return the worker's shared (client, deployment_name), creating it on first use.
+    Returns (None, None) if Azure OpenAI is not configured.
+    """
+    global _client, _deployment
+    if _client is not None:
+        return _client, _deployment
+
+    endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not endpoint:
+        return None, None
+    if not api_key:
+        print("Warning: OPENAI_API_KEY not found in environment")
+        return None, None
+
+    try:
+        from openai import AsyncAzureOpenAI
+
+        _client = AsyncAzureOpenAI(
+            azure_endpoint=endpoint,
+            api_key=api_key,
+            api_version=os.getenv("OPENAI_API_VERSION", "2024-08-01-preview"),
+            http_client=build_http_client(),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+        )
+        _deployment = os.getenv("OPENAI_DEPLOYMENT", "gpt-4o-mini")
+    except Exception as e:
+        print(f"Warning: Could not initialize Azure OpenAI: {e}")
+        return None, None
+    return _client, _deployment
+
+
+async def close_async_openai_client() -> None:
+    """Close pooled connections; called once on worker shutdown."""
+    global _client, _deployment
+    if _client is not None:
+        await _client.close()
+    _client, _deployment = None, None
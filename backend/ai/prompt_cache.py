@@ -0,0 +1,243 @@
+"""
+Generated-prompt cache.
+WHAT: Bounded TTL/LRU cache of AI prompts keyed on (genre, mood, preferences, template).
+WHY: resolve_mood collapses input to five moods and most traffic is
+     genre=memoir without preferences, so most /prompt calls ask the LLM the
+     same question again.
+HOW: Each key holds a few prompt variants. A configurable share of requests is
+     served from cache; the rest still go upstream and add a fresh variant, which
+     keeps prompts varied. The SQLite backend shares one cache across workers.
+"""
+
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from storage.sqlite import DEFAULT_DB_PATH, SQLiteDatabase
+
+CacheKey = Tuple[str, str, str, int]
+
+
+def preferences_hash(preferences: Optional[str]) -> str:
+    """Stable short hash of free-text preferences ('' when absent)."""
+    if not preferences:
+        return ""
+    normalized = " ".join(preferences.lower().split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def make_cache_key(genre: str, mood_key: str, preferences: Optional[str], template_index: int) -> CacheKey:
+    return (genre.strip().lower(), mood_key, preferences_hash(preferences), template_index)
+
+
+class PromptCache(ABC):
+    """
+    Base cache: serve-ratio sampling and hit/miss counters.
+    Subclasses store variants via _variants/_store.
+
+    Counters are kept per worker process.
+    """
+
+    backend = "none"
+
+    def __init__(self, max_keys: int = 512, variants_per_key: int = 8, ttl_seconds: float = 3600,
+                 serve_ratio: float = 0.7):
+        self.max_keys = max_keys
+        self.variants_per_key = variants_per_key
+        self.ttl_seconds = ttl_seconds
+        self.serve_ratio = serve_ratio
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        """
+        Return a cached variant for the key, or None if the caller should go upstream.
+        Even when variants exist, (1 - serve_ratio) of lookups bypass the cache so new
+        variants keep flowing in.
+        """
+        variants = self._variants(key)
+        if not variants:
+            self.misses += 1
+            return None
+        if random.random() >= self.serve_ratio:
+            self.bypasses += 1
+            return None
+        self.hits += 1
+        return random.choice(variants)
+
+    def put(self, key: CacheKey, prompt: str) -> None:
+        self._store(key, prompt)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses + self.bypasses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": self.size(),
+            "max_keys": self.max_keys,
+            "ttl_seconds": self.ttl_seconds,
+            "serve_ratio": self.serve_ratio,
+        }
+
+    @abstractmethod
+    def _variants(self, key: CacheKey) -> List[str]:
+        """Fresh variants stored for the key (marks the key as recently used)."""
+
+    @abstractmethod
+    def _store(self, key: CacheKey, prompt: str) -> None:
+        """Add a variant, evicting old variants and least recently used keys."""
+
+    @abstractmethod
+    def size(self) -> int:
+        """Number of keys currently cached."""
+
+
+class InMemoryPromptCache(PromptCache):
+    """Per-worker cache: OrderedDict in LRU order, each key holding (created_at, prompt) variants."""
+
+    backend = "memory"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._entries: "OrderedDict[CacheKey, List[Tuple[float, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _variants(self, key: CacheKey) -> List[str]:
+        cutoff = time.monotonic() - self.ttl_seconds
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries is None:
+                return []
+            fresh = [(ts, p) for ts, p in entries if ts >= cutoff]
+            if not fresh:
+                del self._entries[key]
+                return []
+            self._entries[key] = fresh
+            self._entries.move_to_end(key)
+            return [p for _, p in fresh]
+
+    def _store(self, key: CacheKey, prompt: str) -> None:
+        with self._lock:
+            entries = self._entries.setdefault(key, [])
+            if prompt not in (p for _, p in entries):
+                entries.append((time.monotonic(), prompt))
+                del entries[:-self.variants_per_key]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class SQLitePromptCache(PromptCache):
+    """Cache shared by every gunicorn worker on the host through the SQLite file."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, touch_seconds: float = 60.0, **kwargs):
+        super().__init__(**kwargs)
+        self.touch_seconds = touch_seconds
+        self.db = SQLiteDatabase(path)
+        conn = self.db.connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS prompt_cache (
+                cache_key TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (cache_key, prompt)
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_cache_access ON prompt_cache (last_access)")
+
+    @staticmethod
+    def _encode(key: CacheKey) -> str:
+        return "|".join(str(part) for part in key)
+
+    def _variants(self, key: CacheKey) -> List[str]:
+        now = time.time()
+        conn = self.db.connect()
+        rows = conn.execute(
+            "SELECT prompt, last_access FROM prompt_cache WHERE cache_key = ? AND created_at >= ?",
+            (self._encode(key), now - self.ttl_seconds),
+        ).fetchall()
+        # Lookups are reads: refresh the LRU position at most every touch_seconds,
+        # under the same write lock as every other writer, and never fail a hit over it
+        if rows and now - max(row["last_access"] for row in rows) >= self.touch_seconds:
+            try:
+                with self.db.transaction() as tx:
+                    tx.execute("UPDATE prompt_cache SET last_access = ? WHERE cache_key = ?",
+                               (now, self._encode(key)))
+            except sqlite3.OperationalError:
+                pass
+        return [row["prompt"] for row in rows]
+
+    def _store(self, key: CacheKey, prompt: str) -> None:
+        now = time.time()
+        encoded = self._encode(key)
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO prompt_cache (cache_key, prompt, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (encoded, prompt, now, now),
+            )
+            # Keep the newest variants for this key
+            conn.execute(
+                """
+                DELETE FROM prompt_cache WHERE cache_key = ? AND prompt NOT IN (
+                    SELECT prompt FROM prompt_cache WHERE cache_key = ? ORDER BY created_at DESC LIMIT ?
+                )
+                """,
+                (encoded, encoded, self.variants_per_key),
+            )
+            conn.execute("DELETE FROM prompt_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            # LRU across keys: drop the least recently used keys beyond max_keys
+            evicted = [row["cache_key"] for row in conn.execute(
+                """
+                SELECT cache_key FROM prompt_cache GROUP BY cache_key
+                ORDER BY MAX(last_access) DESC LIMIT -1 OFFSET ?
+                """,
+                (self.max_keys,),
+            )]
+            conn.executemany("DELETE FROM prompt_cache WHERE cache_key = ?", [(k,) for k in evicted])
+        self.evictions += len(evicted)
+
+    def size(self) -> int:
+        row = self.db.connect().execute("SELECT COUNT(DISTINCT cache_key) AS n FROM prompt_cache").fetchone()
+        return row["n"]
+
+
+def create_prompt_cache() -> Optional[PromptCache]:
+    """
+    Build the cache selected by PROMPT_CACHE_BACKEND ("memory" by default, "sqlite", or "off").
+    """
+    backend = os.getenv("PROMPT_CACHE_BACKEND", "memory").lower()
+    if backend == "off":
+        return None
+    options = dict(
+        max_keys=int(os.getenv("PROMPT_CACHE_MAX_KEYS", "512")),
+        variants_per_key=int(os.getenv("PROMPT_CACHE_VARIANTS", "8")),
+        ttl_seconds=float(os.getenv("PROMPT_CACHE_TTL_SECONDS", "3600")),
+        serve_ratio=float(os.getenv("PROMPT_CACHE_SERVE_RATIO", "0.7")),
+    )
+    if backend == "memory":
+        return InMemoryPromptCache(**options)
+    if backend == "sqlite":
+        return SQLitePromptCache(path=os.getenv("PROMPT_CACHE_DB_PATH", os.getenv("STORY_DB_PATH", DEFAULT_DB_PATH)),
+                                 **options)
+    raise ValueError(f"Unknown PROMPT_CACHE_BACKEND: {backend}")
@@ -0,0 +1,122 @@
+"""
+Near-duplicate detection for prompts shown to a user.
+WHAT: A per-user memory of recently served prompts, used to reject a new prompt that
+      is (nearly) the same question the user has already seen.
+WHY: The system prompts ask the model to "avoid repeating concepts used in previous
+     prompts", but the model never sees earlier prompts, and pooled/cached variants
+     are shared, so users regularly got the same question twice.
+HOW: Each prompt becomes a small L2-normalized vector of signed, hashed character
+     trigrams (no model call). A user's recent vectors sit in one float32 NumPy
+     matrix (a ring buffer), so checking a candidate is a single matrix-vector
+     product: well under a millisecond for a few thousand remembered prompts.
+     Memory: a remembered prompt costs dim * 4 bytes (2 KiB at dim=512). A user's
+     matrix starts at INITIAL_ROWS and doubles when full, so it is at most twice
+     the prompts they have been shown (8 KiB for a new user), capped at capacity
+     rows (4 MiB at the default 2000). The worst case per worker process is
+     max_users * capacity * dim * 4 bytes; stats() reports the current total.
+"""
+
+import os
+import re
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+INITIAL_ROWS = 4  # per-user matrix rows before the first doubling
+
+
+class _UserPrompts:
+    """Ring buffer of one user's prompt vectors, grown on demand up to capacity."""
+
+    __slots__ = ("vectors", "count", "next")
+
+    def __init__(self, dim: int, rows: int):
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.count = 0
+        self.next = 0
+
+
+class PromptMemory:
+    """Per-worker recent-prompt vectors for each user, with LRU eviction of users."""
+
+    def __init__(self, dim: int = 512, ngram: int = 3, capacity: int = 2000,
+                 threshold: float = 0.8, max_users: int = 10000):
+        self.dim = dim
+        self.ngram = ngram
+        self.capacity = capacity
+        self.threshold = threshold
+        self.max_users = max_users
+        self._users: "OrderedDict[str, _UserPrompts]" = OrderedDict()
+        self.checks = 0
+        self.repeats = 0
+
+    def vectorize(self, text: str) -> np.ndarray:
+        """Signed feature-hashed character n-grams of the normalized text, unit length."""
+        normalized = " " + _NON_WORD.sub(" ", text.lower()).strip() + " "
+        n = self.ngram
+        hashes = np.fromiter(
+            (zlib.crc32(normalized[i:i + n].encode("utf-8")) for i in range(max(1, len(normalized) - n + 1))),
+            dtype=np.uint32,
+        )
+        # Low bits pick the bucket, the top bit the sign (reduces collision bias)
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        vector = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim).astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def similarity(self, user_id: str, vector: np.ndarray) -> float:
+        """Highest cosine similarity between vector and the user's remembered prompts."""
+        prompts = self._users.get(user_id)
+        if prompts is None or prompts.count == 0:
+            return 0.0
+        return float(np.max(prompts.vectors[:prompts.count] @ vector))
+
+    def is_repeat(self, user_id: str, text: str) -> bool:
+        self.checks += 1
+        repeat = self.similarity(user_id, self.vectorize(text)) >= self.threshold
+        if repeat:
+            self.repeats += 1
+        return repeat
+
+    def remember(self, user_id: str, text: str) -> None:
+        prompts = self._users.get(user_id)
+        if prompts is None:
+            prompts = self._users[user_id] = _UserPrompts(self.dim, min(INITIAL_ROWS, self.capacity))
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+
+        rows = len(prompts.vectors)
+        if prompts.count == rows and rows < self.capacity:
+            grown = np.zeros((min(rows * 2, self.capacity), self.dim), dtype=np.float32)
+            grown[:rows] = prompts.vectors
+            prompts.vectors = grown
+            prompts.next = rows
+        prompts.vectors[prompts.next] = self.vectorize(text)
+        prompts.next = (prompts.next + 1) % len(prompts.vectors)
+        prompts.count = min(prompts.count + 1, len(prompts.vectors))
+
+    def stats(self) -> Dict:
+        return {
+            "users": len(self._users),
+            "checks": self.checks,
+            "repeats": self.repeats,
+            "threshold": self.threshold,
+            "capacity_per_user": self.capacity,
+            "vector_bytes": sum(prompts.vectors.nbytes for prompts in self._users.values()),
+        }
+
+
+def create_prompt_memory() -> Optional[PromptMemory]:
+    """Build from PROMPT_DEDUP_* settings; PROMPT_DEDUP_ENABLED=false disables it."""
+    if os.getenv("PROMPT_DEDUP_ENABLED", "true").lower() != "true":
+        return None
+    return PromptMemory(
+        capacity=int(os.getenv("PROMPT_DEDUP_CAPACITY", "2000")),
+        threshold=float(os.getenv("PROMPT_DEDUP_THRESHOLD", "0.8")),
+        max_users=int(os.getenv("PROMPT_DEDUP_MAX_USERS", "10000")),
+    )
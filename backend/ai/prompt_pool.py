@@ -0,0 +1,161 @@
+"""
+Pre-generated prompt pools.
+WHAT: A warm pool of ready AI prompts for every (genre, mood) combination.
+WHY: Users otherwise wait for a full chat completion on every "new prompt" click.
+HOW: A background task tops each pool up to the high watermark whenever it drops
+     below the low watermark. Upstream calls share a semaphore, and the task
+     backs off exponentially when Azure OpenAI answers 429.
+"""
+
+import asyncio
+import logging
+import os
+import random
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, str]  # (genre, mood key)
+Generator = Callable[[str, str], Awaitable[str]]
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """True for upstream 429s (openai.RateLimitError or anything carrying status_code 429)."""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class PromptPool:
+    """
+    Per-worker pools of ready prompts, one deque per (genre, mood).
+
+    pop() is O(1) and never waits on the upstream; an empty pool returns None
+    so the caller can fall through to a live completion.
+    """
+
+    def __init__(
+        self,
+        generate: Generator,
+        keys: Iterable[PoolKey],
+        high_watermark: int = 3,
+        low_watermark: int = 1,
+        concurrency: int = 2,
+        check_interval: float = 30.0,
+        max_backoff: float = 60.0,
+    ):
+        self.generate = generate
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.check_interval = check_interval
+        self.max_backoff = max_backoff
+        self._pools: Dict[PoolKey, Deque[str]] = {key: deque() for key in keys}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._backoff = 0.0
+        self.served = 0
+        self.empty = 0
+        self.generated = 0
+        self.rate_limited = 0
+        self.failures = 0
+
+    def pop(self, genre: str, mood_key: str) -> Optional[str]:
+        pool = self._pools.get((genre.strip().lower(), mood_key))
+        if pool is None:
+            return None
+        if not pool:
+            self.empty += 1
+            self._wake.set()
+            return None
+        prompt = pool.popleft()
+        self.served += 1
+        if len(pool) < self.low_watermark:
+            self._wake.set()
+        return prompt
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            low = [key for key, pool in self._pools.items() if len(pool) < self.low_watermark]
+            if low:
+                produced = sum(await asyncio.gather(*(self._refill(key) for key in low)))
+                if produced == 0 or self._backoff:
+                    # Nothing landed (upstream down or throttling us): wait before retrying
+                    delay = max(self._backoff, 1.0)
+                    self._backoff = min(max(self._backoff * 2, 1.0), self.max_backoff)
+                    await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+                continue
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refill(self, key: PoolKey) -> int:
+        """Top one pool up to the high watermark; returns how many prompts were added."""
+        needed = self.high_watermark - len(self._pools[key])
+        results = await asyncio.gather(*(self._generate_one(key) for _ in range(needed)))
+        return sum(results)
+
+    async def _generate_one(self, key: PoolKey) -> int:
+        async with self._semaphore:
+            try:
+                prompt = await self.generate(*key)
+            except Exception as e:
+                if is_rate_limited(e):
+                    self.rate_limited += 1
+                    self._backoff = max(self._backoff, retry_after_seconds(e) or 1.0)
+                else:
+                    self.failures += 1
+                    logger.warning(f"Prompt pool refill failed for {key}: {e}")
+                return 0
+        self._pools[key].append(prompt)
+        self.generated += 1
+        self._backoff = 0.0
+        return 1
+
+    def stats(self) -> Dict:
+        return {
+            "served": self.served,
+            "empty": self.empty,
+            "generated": self.generated,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "backoff_seconds": self._backoff,
+            "sizes": {f"{genre}/{mood}": len(pool) for (genre, mood), pool in self._pools.items()},
+        }
+
+
+def create_prompt_pool(generate: Generator, keys: Iterable[PoolKey]) -> Optional[PromptPool]:
+    """Build the pool from PROMPT_POOL_* settings; PROMPT_POOL_ENABLED=false disables it."""
+    if os.getenv("PROMPT_POOL_ENABLED", "true").lower() != "true":
+        return None
+    return PromptPool(
+        generate,
+        keys,
+        high_watermark=int(os.getenv("PROMPT_POOL_HIGH_WATERMARK", "3")),
+        low_watermark=int(os.getenv("PROMPT_POOL_LOW_WATERMARK", "1")),
+        concurrency=int(os.getenv("PROMPT_POOL_CONCURRENCY", "2")),
+        check_interval=float(os.getenv("PROMPT_POOL_CHECK_INTERVAL", "30")),
+    )
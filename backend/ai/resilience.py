@@ -0,0 +1,222 @@
+"""
+Resilience around Azure OpenAI calls.
+WHAT: Per-request deadline, circuit breaker and optional hedged requests.
+WHY: Without a timeout a degraded upstream holds each prompt request until the
+     SDK gives up, tying up workers for tens of seconds before the static
+     fallback kicks in.
+HOW: UpstreamGuard.call() rejects immediately while the breaker is open, bounds
+     each call by a deadline and, once enough latency samples exist, fires a
+     second request after the observed p95 and takes whichever answers first.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the upstream while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker with half-open probing.
+
+    closed     -> every call allowed; failures (errors or calls slower than
+                  slow_call_seconds) are counted
+    open       -> calls rejected until open_seconds have passed
+    half_open  -> a single probe call is allowed; success closes, failure re-opens
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, slow_call_seconds: float = 6.0, open_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, ok: bool, latency: float = 0.0) -> None:
+        if ok and latency <= self.slow_call_seconds:
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            self._probe_in_flight = False
+            return
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self._trip()
+
+    def release(self) -> None:
+        """Forget an in-flight probe whose caller was cancelled before it could report."""
+        self._probe_in_flight = False
+
+    def _trip(self) -> None:
+        if self.state != self.OPEN:
+            self.times_opened += 1
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+
+class LatencyWindow:
+    """Recent successful call latencies for percentile estimates."""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class UpstreamGuard:
+    """Deadline + breaker + hedging wrapper shared by every completion in a worker."""
+
+    def __init__(
+        self,
+        deadline_seconds: float = 8.0,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge_enabled: bool = False,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.05,
+    ):
+        self.deadline_seconds = deadline_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.calls = 0
+        self.deadline_exceeded = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """Delay before a hedged request, or None if hedging is off or not yet calibrated."""
+        if not self.hedge_enabled or len(self.latency) < self.hedge_min_samples:
+            return None
+        return max(self.latency.percentile(0.95), self.hedge_min_delay)
+
+    async def call(self, make_call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run make_call() under the guard. make_call must start a fresh upstream
+        request each time it is invoked (it is invoked twice when hedging).
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("Azure OpenAI circuit is open")
+        self.calls += 1
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(self._hedged(make_call), timeout=self.deadline_seconds)
+        except asyncio.TimeoutError:
+            self.deadline_exceeded += 1
+            self.breaker.record(False)
+            raise
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record(False)
+            raise
+        elapsed = time.monotonic() - start
+        self.latency.add(elapsed)
+        self.breaker.record(True, elapsed)
+        return result
+
+    async def _hedged(self, make_call: Callable[[], Awaitable[T]]) -> T:
+        delay = self.hedge_delay()
+        if delay is None:
+            return await make_call()
+
+        primary = asyncio.ensure_future(make_call())
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            self.hedges_sent += 1
+            hedge = asyncio.ensure_future(make_call())
+            pending = {primary, hedge}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Also runs when the deadline cancels us: never leave a request behind
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict:
+        p50, p95 = self.latency.percentile(0.5), self.latency.percentile(0.95)
+        return {
+            "breaker": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.consecutive_failures,
+                "times_opened": self.breaker.times_opened,
+                "rejected": self.breaker.rejected,
+            },
+            "calls": self.calls,
+            "deadline_seconds": self.deadline_seconds,
+            "deadline_exceeded": self.deadline_exceeded,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedging": {
+                "enabled": self.hedge_enabled,
+                "delay_ms": round(self.hedge_delay() * 1000, 1) if self.hedge_delay() else None,
+                "sent": self.hedges_sent,
+                "wins": self.hedge_wins,
+                "win_rate": round(self.hedge_wins / self.hedges_sent, 4) if self.hedges_sent else 0.0,
+            },
+        }
+
+
+def create_upstream_guard() -> UpstreamGuard:
+    """Build the guard from OPENAI_DEADLINE_SECONDS, BREAKER_* and OPENAI_HEDGE_* settings."""
+    return UpstreamGuard(
+        deadline_seconds=float(os.getenv("OPENAI_DEADLINE_SECONDS", "8")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+            slow_call_seconds=float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "6")),
+            open_seconds=float(os.getenv("BREAKER_OPEN_SECONDS", "30")),
+        ),
+        hedge_enabled=os.getenv("OPENAI_HEDGE_ENABLED", "false").lower() == "true",
+        hedge_min_samples=int(os.getenv("OPENAI_HEDGE_MIN_SAMPLES", "20")),
+    )
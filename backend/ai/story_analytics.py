@@ -0,0 +1,398 @@
+"""
+Write-time story analytics.
+WHAT: Computes StoryMetadata (word count, preview, completion estimate, themes,
+      characters, sentiment) for every saved story and stores it next to the story.
+WHY: create_story computed none of these, so anything that wanted them (history
+     summaries, prompt selection, search tags) had to re-scan full story text at
+     prompt time.
+HOW: create_story and patch_story hand the saved document to a bounded queue
+     drained by a small pool of worker threads. Each result is written to the repository, folded into
+     the user's history summary and indexed as search tags, so prompt generation
+     only ever reads precomputed metadata. When the queue stays full the story is
+     left unanalyzed (it is already saved); each process sweeps such stories back
+     into spare queue capacity at startup and then every STORY_ANALYTICS_SWEEP_SECONDS.
+     The reprocess command does the same in one pass and can rebuild summaries:
+
+    python -m ai.story_analytics            # stories missing or with stale metadata
+    python -m ai.story_analytics --all      # re-analyze everything (e.g. new heuristics)
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from ai.content_safety import StoryMetadata, UserHistorySummary
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_CHARS = 200
+COMPLETE_WORD_COUNT = 250  # Stories shorter than this read as drafts
+MAX_THEMES = 3
+MAX_CHARACTERS = 5
+
+_WORD = re.compile(r"[A-Za-z']+")
+_NAME = re.compile(r"(?<![.!?]\s)(?<!^)\b([A-Z][a-z]{2,})\b")
+_UNFINISHED_ENDING = re.compile(r"(\.\.\.|…|\b(tbc|todo|to be continued)\b)\W*$", re.IGNORECASE)
+
+THEME_KEYWORDS: Dict[str, set] = {
+    "family": {"family", "mother", "father", "mum", "mom", "dad", "gran", "grandma", "grandpa",
+               "grandmother", "grandfather", "brother", "sister", "aunt", "uncle", "cousin", "parents"},
+    "childhood": {"child", "childhood", "kid", "kids", "young", "toy", "toys", "playground", "grew"},
+    "school": {"school", "teacher", "class", "classroom", "exam", "homework", "university", "college"},
+    "work": {"work", "job", "office", "boss", "career", "colleague", "colleagues", "shift", "promotion"},
+    "travel": {"travel", "trip", "journey", "train", "flight", "plane", "road", "abroad", "drove", "holiday"},
+    "home": {"home", "house", "kitchen", "garden", "moved", "neighbour", "neighbor", "street"},
+    "love": {"love", "loved", "wedding", "married", "kiss", "romance", "husband", "wife", "partner"},
+    "friendship": {"friend", "friends", "friendship", "mate", "mates", "together", "laughed"},
+    "loss": {"died", "death", "funeral", "grief", "lost", "loss", "missed", "goodbye", "passed"},
+    "nature": {"sea", "beach", "forest", "river", "lake", "mountain", "snow", "rain", "sun", "summer", "winter"},
+    "food": {"food", "cook", "cooking", "cooked", "meal", "dinner", "bread", "cake", "recipe", "baked"},
+    "music": {"music", "song", "songs", "sang", "sing", "band", "piano", "guitar", "concert", "dance"},
+    "adventure": {"adventure", "explore", "explored", "climbed", "escape", "danger", "brave", "wild"},
+    "health": {"hospital", "doctor", "ill", "illness", "sick", "nurse", "recovery", "surgery"},
+    "faith": {"church", "faith", "prayer", "prayed", "god", "temple", "mosque", "belief"},
+}
+
+CHARACTER_WORDS = {
+    "mum", "mom", "mother", "dad", "father", "gran", "grandma", "grandpa", "grandmother", "grandfather",
+    "brother", "sister", "aunt", "uncle", "wife", "husband", "son", "daughter", "teacher", "friend",
+}
+
+POSITIVE_WORDS = {
+    "happy", "joy", "love", "loved", "laugh", "laughed", "smile", "smiled", "fun", "proud", "warm",
+    "beautiful", "wonderful", "kind", "hope", "grateful", "excited", "peace", "best", "favourite", "favorite",
+}
+NEGATIVE_WORDS = {
+    "sad", "cry", "cried", "angry", "afraid", "scared", "fear", "lonely", "lost", "died", "pain", "hurt",
+    "worst", "hate", "hated", "grief", "sorry", "worried", "ashamed", "alone", "dark",
+}
+
+# Capitalized words that are not names
+_NOT_NAMES = {
+    "the", "and", "but", "then", "when", "after", "before", "that", "this", "there", "they", "she", "his",
+    "her", "our", "one", "every", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday",
+    "sunday", "january", "february", "march", "april", "june", "july", "august", "september", "october",
+    "november", "december", "christmas", "easter",
+}
+
+
+def estimate_completion(content: str, word_count: int) -> float:
+    """
+    0..1 guess at how finished a story is: short texts and texts that stop
+    mid-sentence (or trail off with "...", "TBC") read as drafts.
+    """
+    if word_count == 0:
+        return 0.0
+    status = min(1.0, word_count / COMPLETE_WORD_COUNT)
+    text = content.rstrip()
+    if _UNFINISHED_ENDING.search(text[-40:]):
+        return round(min(status, 0.5), 2)
+    if text[-1] not in ".!?\"'”’)":
+        status *= 0.7
+    return round(status, 2)
+
+
+def detect_themes(words: List[str]) -> List[str]:
+    counts = Counter()
+    for word in words:
+        for theme, keywords in THEME_KEYWORDS.items():
+            if word in keywords:
+                counts[theme] += 1
+    return [theme for theme, _ in sorted(counts.items(), key=lambda t: (-t[1], t[0]))[:MAX_THEMES]]
+
+
+def detect_characters(content: str, words: List[str]) -> List[str]:
+    """Relations ("Gran") plus capitalized mid-sentence words that occur more than once."""
+    counts = Counter(match for match in _NAME.findall(content) if match.lower() not in _NOT_NAMES)
+    names = [name for name, n in counts.most_common() if n > 1]
+    relations = sorted({word for word in words if word in CHARACTER_WORDS})
+    return (names + [r.capitalize() for r in relations if r.capitalize() not in names])[:MAX_CHARACTERS]
+
+
+def detect_sentiment(words: List[str]) -> str:
+    positive = sum(word in POSITIVE_WORDS for word in words)
+    negative = sum(word in NEGATIVE_WORDS for word in words)
+    if positive == negative == 0:
+        return "neutral"
+    score = (positive - negative) / (positive + negative)
+    if score > 0.3:
+        return "positive"
+    if score < -0.3:
+        return "negative"
+    return "mixed"
+
+
+def analyze_story(doc: Dict, preview_chars: int = PREVIEW_CHARS) -> StoryMetadata:
+    """Metadata for a stored story document (one pass over the text, no model calls)."""
+    content = doc["content"]
+    word_count = len(content.split())
+    words = [w.lower().strip("'") for w in _WORD.findall(content)]
+    return StoryMetadata(
+        story_id=doc["id"],
+        title=doc["title"],
+        content_preview=content[:preview_chars],
+        created_at=doc["createdAt"],
+        word_count=word_count,
+        completion_status=estimate_completion(content, word_count),
+        themes=detect_themes(words),
+        characters=detect_characters(content, words),
+        sentiment=detect_sentiment(words),
+    )
+
+
+def process_story(doc: Dict, stories, summaries) -> StoryMetadata:
+    """
+    Analyze one story and publish the result: metadata row, search index and
+    the owner's history summary (folded in on first analysis, revised after edits).
+    """
+    metadata = analyze_story(doc)
+    previous = stories.save_metadata(doc["userId"], metadata, doc["updatedAt"])
+    if doc["updatedAt"] != doc["createdAt"]:
+        # Edits don't touch the search index on the request path
+        stories.reindex(doc)
+    stories.set_tags(doc["userId"], doc["id"], metadata.themes + metadata.characters)
+    if previous is None:
+        summaries.apply(doc["userId"], metadata)
+    elif previous != metadata:
+        summaries.revise(doc["userId"], previous, metadata)
+    # An unchanged analysis (the same version processed twice, e.g. by a sweep in
+    # another worker) leaves the summary alone so the story is never counted twice
+    return metadata
+
+
+def reprocess(stories, summaries, all_stories: bool = False, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Backfill: analyze stories without (or with stale) metadata, then rebuild the
+    summaries of every affected user from their stored metadata so stories
+    summarized before analysis existed are not counted twice.
+    """
+    users = set()
+    analyzed = 0
+    after = None
+    while True:
+        docs = stories.stories_needing_analysis(batch_size, after=after, include_current=all_stories)
+        if not docs:
+            break
+        for doc in docs:
+            metadata = analyze_story(doc)
+            stories.save_metadata(doc["userId"], metadata, doc["updatedAt"])
+            stories.reindex(doc)
+            stories.set_tags(doc["userId"], doc["id"], metadata.themes + metadata.characters)
+            users.add(doc["userId"])
+            analyzed += 1
+        after = docs[-1]["id"]
+    for user_id in users:
+        rebuilt = UserHistorySummary.from_history(user_id, stories.list_metadata(user_id))
+        # Keep versions moving forward so memoized analyses of the old summary are not reused
+        rebuilt.version = max(rebuilt.version, summaries.get(user_id).version + 1)
+        summaries.replace(rebuilt)
+    return {"analyzed": analyzed, "users": len(users)}
+
+
+class AnalyticsPipeline:
+    """
+    Bounded work queues drained by a pool of daemon worker threads.
+
+    Threads rather than asyncio tasks: create_story runs in FastAPI's threadpool
+    and the repositories are synchronous. Analysis holds the GIL, so a couple of
+    workers is enough; the queue bound is what protects the process.
+
+    Stories are routed to a worker by id, so edits to one story are analyzed in
+    order, and a story that is already waiting is not queued again: its pending
+    document is replaced, so a burst of autosaves costs one analysis.
+
+    With a backlog callable (limit, after id -> stories without current metadata),
+    a sweeper thread feeds deferred stories back through submit(), so they take
+    the same per-id route as fresh saves.
+    """
+
+    _STOP = object()
+
+    def __init__(self, process: Callable[[Dict], object], queue_size: int = 1000, workers: int = 2,
+                 enqueue_timeout: float = 0.05,
+                 backlog: Optional[Callable[[int, Optional[str]], List[Dict]]] = None,
+                 sweep_interval: float = 60.0):
+        self.process = process
+        self.backlog = backlog
+        self.sweep_interval = sweep_interval
+        self.workers = workers
+        self.enqueue_timeout = enqueue_timeout
+        per_worker = max(1, queue_size // workers)
+        self._queues: List["queue.Queue"] = [queue.Queue(maxsize=per_worker) for _ in range(workers)]
+        self._pending: Dict[str, Dict] = {}  # story_id -> latest document waiting for analysis
+        self._threads: List[threading.Thread] = []
+        self._sweeper: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._sweep_after: Optional[str] = None  # id the next sweep resumes after
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.deferred = 0
+        self.swept = 0
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads:
+                self._threads = [
+                    threading.Thread(target=self._run, args=(q,), name=f"story-analytics-{i}", daemon=True)
+                    for i, q in enumerate(self._queues)
+                ]
+                for thread in self._threads:
+                    thread.start()
+                if self.backlog is not None and self.sweep_interval > 0:
+                    self._stopping.clear()
+                    self._sweeper = threading.Thread(target=self._sweep_loop, name="story-analytics-sweep",
+                                                     daemon=True)
+                    self._sweeper.start()
+
+    def submit(self, doc: Dict, bulk: bool = False) -> bool:
+        """
+        Queue a saved story for analysis. Briefly blocks the caller when its queue
+        is full (backpressure); returns False if it is still full, leaving the
+        story for the next sweep. bulk=True (imports) never blocks and only
+        fills half of a queue, so interactive saves keep the other half.
+        """
+        self._ensure_started()
+        story_id = doc["id"]
+        with self._lock:
+            waiting = self._pending.get(story_id)
+            # A sweep may read a version older than one already waiting; keep the newer
+            if waiting is None or waiting.get("version", 0) <= doc.get("version", 0):
+                self._pending[story_id] = doc
+            if waiting is not None:
+                self.coalesced += 1
+                return True
+        work = self._queues[zlib.crc32(story_id.encode()) % self.workers]
+        try:
+            if bulk and work.qsize() >= max(1, work.maxsize // 2):
+                raise queue.Full
+            work.put(story_id, block=not bulk, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(story_id, None)
+                self.deferred += 1
+            if not bulk:
+                logger.warning("Analytics queue full; story %s deferred to the next sweep", story_id)
+            return False
+        return True
+
+    def _run(self, work: "queue.Queue") -> None:
+        while True:
+            story_id = work.get()
+            try:
+                if story_id is self._STOP:
+                    return
+                with self._lock:
+                    doc = self._pending.pop(story_id)
+                self.process(doc)
+                with self._lock:
+                    self.processed += 1
+            except Exception:
+                # Metadata stays missing or stale; the next sweep retries it
+                logger.exception("Story analytics failed for %s", story_id)
+                with self._lock:
+                    self.failed += 1
+            finally:
+                work.task_done()
+
+    def sweep(self) -> int:
+        """
+        Queue stories the backlog reports as unanalyzed, using at most the spare
+        half of the queues, and return how many were queued. Successive sweeps
+        walk the backlog by id and start over once it is exhausted.
+        """
+        room = sum(max(0, work.maxsize // 2 - work.qsize()) for work in self._queues)
+        if room == 0:
+            return 0
+        docs = self.backlog(room, self._sweep_after)
+        self._sweep_after = docs[-1]["id"] if len(docs) == room else None
+        queued = sum(self.submit(doc, bulk=True) for doc in docs)
+        with self._lock:
+            self.swept += queued
+        return queued
+
+    def _sweep_loop(self) -> None:
+        # First pass at startup picks up stories deferred before a restart
+        while True:
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Story analytics sweep failed")
+            if self._stopping.wait(self.sweep_interval):
+                return
+
+    def join(self) -> None:
+        """Block until every queued story has been processed."""
+        for work in self._queues:
+            work.join()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Let workers finish queued stories (up to timeout), then shut them down."""
+        threads, self._threads = self._threads, []
+        sweeper, self._sweeper = self._sweeper, None
+        self._stopping.set()
+        if sweeper is not None:
+            sweeper.join(timeout)
+        if threads:
+            for work in self._queues:
+                work.put(self._STOP)
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self) -> Dict:
+        return {
+            "queued": sum(work.qsize() for work in self._queues),
+            "capacity": sum(work.maxsize for work in self._queues),
+            "workers": self.workers,
+            "processed": self.processed,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "swept": self.swept,
+        }
+
+
+def create_analytics_pipeline(process: Callable[[Dict], object],
+                              backlog: Optional[Callable[[int, Optional[str]], List[Dict]]] = None
+                              ) -> AnalyticsPipeline:
+    """Build from STORY_ANALYTICS_* settings (STORY_ANALYTICS_SWEEP_SECONDS=0 disables the sweep)."""
+    return AnalyticsPipeline(
+        process,
+        queue_size=int(os.getenv("STORY_ANALYTICS_QUEUE_SIZE", "1000")),
+        workers=int(os.getenv("STORY_ANALYTICS_WORKERS", "2")),
+        enqueue_timeout=float(os.getenv("STORY_ANALYTICS_ENQUEUE_TIMEOUT_SECONDS", "0.05")),
+        backlog=backlog,
+        sweep_interval=float(os.getenv("STORY_ANALYTICS_SWEEP_SECONDS", "60")),
+    )
+
+
+def main() -> None:
+    from storage.history_summary import create_history_summary_store
+    from storage.repository import create_story_repository
+
+    parser = argparse.ArgumentParser(description="Backfill story analytics (STORY_STORE / STORY_DB_PATH apply).")
+    parser.add_argument("--all", action="store_true", help="re-analyze every story, not just missing/stale ones")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    stories = create_story_repository()
+    summaries = create_history_summary_store()
+    try:
+        print(json.dumps(reprocess(stories, summaries, all_stories=args.all, batch_size=args.batch_size)))
+    finally:
+        stories.close()
+        summaries.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Columnar story history.
+WHAT: A compact, append-only container for a user's StoryMetadata entries whose rows
+      still read like StoryMetadata (story.word_count, story.themes, story.to_model()).
+WHY: Power users have thousands of entries. One pydantic model per entry, each with
+     its own themes/characters lists and datetime, costs kilobytes per story and makes
+     loading a long history slow.
+HOW: Numeric fields live in array.array columns, themes/characters/sentiment are
+     interned to small integer ids stored in flat arrays with per-row offsets, and
+     rows are materialized on access as __slots__ views over the columns.
+     See backend/benchmarks/story_history.py for memory/time numbers.
+"""
+
+from array import array
+from collections.abc import Sequence
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class _Interner:
+    """Bidirectional string <-> small int table."""
+
+    __slots__ = ("ids", "values")
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def intern(self, value: str) -> int:
+        found = self.ids.get(value)
+        if found is None:
+            found = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return found
+
+
+def _timestamp(value) -> float:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value.timestamp()
+
+
+class StoryRow:
+    """Read-only StoryMetadata-shaped view of one row of a StoryHistory."""
+
+    __slots__ = ("_history", "_index")
+
+    def __init__(self, history: "StoryHistory", index: int):
+        self._history = history
+        self._index = index
+
+    @property
+    def story_id(self) -> str:
+        return self._history._story_ids[self._index]
+
+    @property
+    def title(self) -> Optional[str]:
+        return self._history._titles[self._index]
+
+    @property
+    def content_preview(self) -> str:
+        return self._history._previews[self._index]
+
+    @property
+    def created_at(self) -> datetime:
+        return datetime.fromtimestamp(self._history._created_at[self._index], timezone.utc)
+
+    @property
+    def word_count(self) -> int:
+        return self._history._word_counts[self._index]
+
+    @property
+    def completion_status(self) -> float:
+        return self._history._completion[self._index]
+
+    @property
+    def themes(self) -> List[str]:
+        h = self._history
+        return h._tag_list(h._theme_ids, h._theme_offsets, self._index)
+
+    @property
+    def characters(self) -> List[str]:
+        h = self._history
+        return h._tag_list(h._character_ids, h._character_offsets, self._index)
+
+    @property
+    def sentiment(self) -> Optional[str]:
+        sentiment_id = self._history._sentiments[self._index]
+        return None if sentiment_id < 0 else self._history._tags.values[sentiment_id]
+
+    def to_model(self):
+        """Materialize a full StoryMetadata model for this row."""
+        from ai.content_safety import StoryMetadata  # content_safety imports this module
+        return StoryMetadata(
+            story_id=self.story_id,
+            title=self.title,
+            content_preview=self.content_preview,
+            created_at=self.created_at,
+            word_count=self.word_count,
+            completion_status=self.completion_status,
+            themes=self.themes,
+            characters=self.characters,
+            sentiment=self.sentiment,
+        )
+
+    def __repr__(self) -> str:
+        return f"StoryRow(story_id={self.story_id!r}, title={self.title!r})"
+
+
+class StoryHistory(Sequence):
+    """
+    Append-only columnar list of story metadata.
+
+    Accepts StoryMetadata models, StoryRow views or plain dicts with the same
+    fields; indexing returns StoryRow views (negative indexes work as for lists).
+    created_at is stored as a UTC epoch and returned as an aware UTC datetime.
+    """
+
+    def __init__(self, stories: Iterable = ()):
+        self._story_ids: List[str] = []
+        self._titles: List[Optional[str]] = []
+        self._previews: List[str] = []
+        self._created_at = array("d")
+        self._word_counts = array("l")
+        self._completion = array("d")
+        self._sentiments = array("i")
+        self._tags = _Interner()  # themes, characters and sentiments share one table
+        self._theme_ids = array("I")
+        self._theme_offsets = array("I", [0])
+        self._character_ids = array("I")
+        self._character_offsets = array("I", [0])
+        self._latest = -1  # index of the newest row by created_at (the last of equals)
+        for story in stories:
+            self.append(story)
+
+    def append(self, story) -> None:
+        if isinstance(story, dict):
+            get = story.get
+        else:
+            def get(name, default=None):
+                return getattr(story, name, default)
+        self._story_ids.append(get("story_id"))
+        self._titles.append(get("title"))
+        self._previews.append(get("content_preview"))
+        created_at = _timestamp(get("created_at"))
+        if self._latest < 0 or created_at >= self._created_at[self._latest]:
+            self._latest = len(self._created_at)
+        self._created_at.append(created_at)
+        self._word_counts.append(get("word_count"))
+        self._completion.append(get("completion_status"))
+        sentiment = get("sentiment")
+        self._sentiments.append(-1 if sentiment is None else self._tags.intern(sentiment))
+        self._append_tags(self._theme_ids, self._theme_offsets, get("themes"))
+        self._append_tags(self._character_ids, self._character_offsets, get("characters"))
+
+    def _append_tags(self, ids: array, offsets: array, values: Optional[Iterable[str]]) -> None:
+        if values:
+            ids.extend(self._tags.intern(v) for v in values)
+        offsets.append(len(ids))
+
+    def _tag_list(self, ids: array, offsets: array, index: int) -> List[str]:
+        values = self._tags.values
+        return [values[i] for i in ids[offsets[index]:offsets[index + 1]]]
+
+    def latest(self) -> Optional[StoryRow]:
+        """The newest row by created_at (tracked on append, so O(1)), or None if empty."""
+        return StoryRow(self, self._latest) if self._latest >= 0 else None
+
+    def extend(self, stories: Iterable) -> None:
+        for story in stories:
+            self.append(story)
+
+    def __len__(self) -> int:
+        return len(self._story_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [StoryRow(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("story history index out of range")
+        return StoryRow(self, index)
+
+    def __iter__(self) -> Iterator[StoryRow]:
+        for i in range(len(self)):
+            yield StoryRow(self, i)
+
+    def to_models(self) -> list:
+        return [row.to_model() for row in self]
@@ -0,0 +1,167 @@
+"""
+End-to-end load generator for the FastAPI backend.
+WHAT: Drives GET /prompt, POST /stories and GET /stories at a target request rate
+      and reports throughput plus p50/p95/p99 latency per endpoint.
+WHY: Changes to pooling, caching or storage need numbers that can be compared run
+     over run, without paying for the real Azure endpoint (see mock_openai.py).
+HOW: Open-loop asyncio scheduler: requests start on a fixed timetable whatever the
+     server's latency, so queueing shows up in the percentiles instead of silently
+     lowering the offered load. In-flight requests are capped; requests that would
+     exceed the cap are counted as dropped.
+
+Usage (from backend/, with the API and mock server running):
+    python benchmarks/load_test.py --rps 50 --duration 30 --output run.json
+    python benchmarks/load_test.py --rps 50 --duration 30 --baseline run.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+GENRES = ["memoir", "adventure", "reflection", "creative"]
+MOODS = ["deep-reflection", "fun-nostalgia", "creative-storytelling", "action-growth", "connection-relationships"]
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, weight = part.split("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+async def prompt(client: httpx.AsyncClient, user: str, rng: random.Random) -> httpx.Response:
+    return await client.get("/prompt", params={"genre": rng.choice(GENRES), "mood": rng.choice(MOODS)},
+                            headers={"X-User-Id": user})
+
+
+async def create_story(client: httpx.AsyncClient, user: str, rng: random.Random) -> httpx.Response:
+    words = " ".join(rng.choice(["sea", "home", "summer", "train", "gran", "snow", "school"]) for _ in range(200))
+    return await client.post("/stories", json={"title": f"Load {rng.randrange(10**6)}", "content": words},
+                             headers={"X-User-Id": user})
+
+
+async def list_stories(client: httpx.AsyncClient, user: str, rng: random.Random) -> httpx.Response:
+    return await client.get("/stories", params={"limit": 20, "view": "summary"}, headers={"X-User-Id": user})
+
+
+SCENARIOS = {"prompt": prompt, "create": create_story, "list": list_stories}
+
+
+async def run(args) -> Dict:
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    users = [f"load_user_{i}" for i in range(args.users)]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    dropped = 0
+    in_flight = 0
+
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        async def one(name: str) -> None:
+            nonlocal in_flight
+            started = time.perf_counter()
+            try:
+                response = await SCENARIOS[name](client, rng.choice(users), rng)
+                if response.status_code >= 400:
+                    errors[name] += 1
+                else:
+                    latencies[name].append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                errors[name] += 1
+            finally:
+                in_flight -= 1
+
+        tasks = []
+        total = int(args.rps * args.duration)
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i / args.rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if in_flight >= args.max_in_flight:
+                dropped += 1
+                continue
+            in_flight += 1
+            tasks.append(asyncio.create_task(one(rng.choices(names, weights)[0])))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    report = {
+        "config": {"rps": args.rps, "duration": args.duration, "mix": mix, "users": args.users},
+        "elapsed_seconds": round(elapsed, 2),
+        "dropped": dropped,
+        "scenarios": {},
+    }
+    for name in names:
+        values = sorted(latencies[name])
+        report["scenarios"][name] = {
+            "ok": len(values),
+            "errors": errors[name],
+            "throughput_rps": round(len(values) / elapsed, 2),
+            **{f"p{p}_ms": round(percentile(values, p) * 1000, 2) if values else None for p in (50, 95, 99)},
+        }
+    return report
+
+
+def compare(report: Dict, baseline: Dict) -> Dict:
+    """Percent change per scenario metric versus a previous run (positive = higher)."""
+    deltas = {}
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        deltas[name] = {}
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            old, new = previous.get(metric), current.get(metric)
+            if old and new is not None:
+                deltas[name][metric] = f"{(new - old) / old * 100:+.1f}%"
+    return deltas
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--rps", type=float, default=20.0, help="target requests per second (all scenarios)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--mix", default="prompt=0.6,create=0.2,list=0.2", help="scenario weights")
+    parser.add_argument("--users", type=int, default=20, help="distinct X-User-Id values")
+    parser.add_argument("--max-in-flight", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["vs_baseline"] = compare(report, json.load(f))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
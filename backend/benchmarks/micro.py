@@ -0,0 +1,286 @@
+"""
+Micro-benchmarks for per-request CPU cost on the prompt and story paths.
+WHAT: Times hot functions (mood resolution, system/user prompt assembly in both the
+      backend and the generate_prompt Function, ProgressivePromptingSystem setup and
+      stage selection at history sizes up to 100k) and /stories create/list (and
+      If-None-Match revalidation) through the ASGI app in-process.
+WHY: Regressions in per-request CPU cost are invisible in unit tests and drowned out
+     by network latency in load tests.
+HOW: Each case is auto-calibrated to run for about --min-time seconds per repeat; the
+     median and fastest ns/op over --repeats are reported as JSON. With --baseline, the
+     fastest repeats are compared to a previous run and the exit status is 1 if any case
+     got slower than --threshold (so it can gate CI).
+
+Usage (from backend/):
+    python benchmarks/micro.py --output baseline.json
+    python benchmarks/micro.py --baseline baseline.json --threshold 0.25
+    python benchmarks/micro.py --filter progressive --sizes 0 1000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import types
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "functions")
+sys.path.insert(0, BACKEND_DIR)
+
+# In-process app with no shared state, background flushing or sampling
+os.environ.setdefault("STORY_STORE", "memory")
+os.environ.setdefault("METRICS_BACKEND", "memory")
+os.environ.setdefault("TRACE_SAMPLE_RATE", "0")
+os.environ.setdefault("PROMPT_POOL_ENABLED", "false")
+
+
+class Case:
+    """One benchmark: run(n) performs n operations (sync) or returns a coroutine that does (async)."""
+
+    def __init__(self, name: str, run: Callable, is_async: bool = False):
+        self.name = name
+        self.run = run
+        self.is_async = is_async
+
+
+def time_case(case: Case, loop: asyncio.AbstractEventLoop, min_time: float, repeats: int) -> Dict:
+    def timed(n: int) -> float:
+        started = time.perf_counter()
+        if case.is_async:
+            loop.run_until_complete(case.run(n))
+        else:
+            case.run(n)
+        return time.perf_counter() - started
+
+    # Calibrate: grow n until one repeat takes at least min_time
+    n = 1
+    while True:
+        elapsed = timed(n)
+        if elapsed >= min_time or n >= 10**7:
+            break
+        n = max(n * 2, int(n * min_time / max(elapsed, 1e-9) * 1.2))
+    samples = [timed(n) / n * 1e9 for _ in range(repeats)]
+    return {
+        "ns_per_op": round(statistics.median(samples), 1),
+        "min_ns_per_op": round(min(samples), 1),
+        "ops_per_repeat": n,
+    }
+
+
+def load_function_module():
+    """Import functions/generate_prompt; azure.functions is only needed by the Functions host."""
+    try:
+        import azure.functions  # noqa: F401
+    except ImportError:
+        stub = types.ModuleType("azure.functions")
+        stub.HttpRequest = stub.HttpResponse = object
+        sys.modules["azure.functions"] = stub
+    sys.path.insert(0, FUNCTIONS_DIR)
+    import generate_prompt
+    return generate_prompt
+
+
+def history_entries(size: int) -> List[dict]:
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "story_id": f"s{i}",
+            "title": f"Story {i}",
+            "content_preview": "We drove west",
+            "created_at": start + timedelta(minutes=i),
+            "word_count": 300,
+            "completion_status": 1.0,
+            "themes": ["family", "travel"],
+            "characters": ["Gran"],
+        }
+        for i in range(size)
+    ]
+
+
+def prompt_cases() -> List[Case]:
+    import main
+    function = load_function_module()
+    moods = ["deep-reflection", "Fun Nostalgia", "unknown", None]
+    mood = main.MOODS["fun_nostalgia"]
+
+    def backend_resolve(n):
+        for i in range(n):
+            main.resolve_mood(moods[i & 3])
+
+    def backend_select(n):
+        for _ in range(n):
+            main.select_system_prompt(mood)
+
+    def backend_user_prompt(n):
+        for _ in range(n):
+            main.build_user_prompt("memoir", mood, "short, about summers")
+
+    def function_resolve(n):
+        for i in range(n):
+            function.resolve_mood(moods[i & 3])
+
+    def function_select(n):
+        fn_mood = function.MOODS["fun_nostalgia"]
+        for _ in range(n):
+            function.select_system_prompt(fn_mood)
+
+    return [
+        Case("backend.resolve_mood", backend_resolve),
+        Case("backend.select_system_prompt", backend_select),
+        Case("backend.build_user_prompt", backend_user_prompt),
+        Case("function.resolve_mood", function_resolve),
+        Case("function.select_system_prompt", function_select),
+    ]
+
+
+def progressive_cases(sizes: List[int]) -> List[Case]:
+    from ai.content_safety import ProgressivePromptingSystem, UserHistorySummary
+    from ai.story_history import StoryHistory
+
+    profile = {"user_id": "bench"}
+    cases = []
+    for size in sizes:
+        entries = history_entries(size)
+        columnar = StoryHistory(entries)
+        summary = UserHistorySummary.from_history("bench", columnar)
+        system = ProgressivePromptingSystem(None, profile, history_summary=summary)
+
+        def from_dicts(n, entries=entries):
+            for _ in range(n):
+                ProgressivePromptingSystem(None, profile, content_history=entries)
+
+        def from_columnar(n, columnar=columnar):
+            for _ in range(n):
+                ProgressivePromptingSystem(None, profile, content_history=columnar)
+
+        def from_summary(n, summary=summary):
+            for _ in range(n):
+                ProgressivePromptingSystem(None, profile, history_summary=summary)
+
+        def stage(n, system=system):
+            for _ in range(n):
+                system._determine_prompting_stage()
+
+        cases += [
+            Case(f"progressive.init_from_dicts[{size}]", from_dicts),
+            Case(f"progressive.init_from_story_history[{size}]", from_columnar),
+            Case(f"progressive.init_from_summary[{size}]", from_summary),
+            Case(f"progressive.determine_stage[{size}]", stage),
+        ]
+    return cases
+
+
+def asgi_cases() -> List[Case]:
+    import httpx
+    import main
+    from storage.history_summary import InMemoryHistorySummaryStore
+    from storage.repository import InMemoryStoryRepository
+
+    main.STORIES = InMemoryStoryRepository()
+    main.HISTORY_SUMMARIES = InMemoryHistorySummaryStore()
+    # Listing runs against a fixed 200-story user so it doesn't depend on how many
+    # stories the create case happened to write
+    for i in range(200):
+        stamp = f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}+00:00"
+        main.STORIES.add({"id": f"story_{i:08x}", "title": f"T{i}", "content": "word " * 300,
+                          "userId": "bench_list", "createdAt": stamp, "updatedAt": stamp})
+    state = {}
+
+    def client() -> httpx.AsyncClient:
+        if "client" not in state:
+            state["client"] = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+        return state["client"]
+
+    async def create(n):
+        for i in range(n):
+            await client().post("/stories", json={"title": f"T{i}", "content": "word " * 300},
+                                headers={"X-User-Id": "bench_create"})
+
+    async def list_page(n):
+        for _ in range(n):
+            await client().get("/stories", params={"limit": 20, "view": "summary"},
+                               headers={"X-User-Id": "bench_list"})
+
+    async def revalidate(n):
+        if "etag" not in state:
+            first = await client().get("/stories", params={"limit": 20, "view": "summary"},
+                                       headers={"X-User-Id": "bench_list"})
+            state["etag"] = first.headers["ETag"]
+        for _ in range(n):
+            await client().get("/stories", params={"limit": 20, "view": "summary"},
+                               headers={"X-User-Id": "bench_list", "If-None-Match": state["etag"]})
+
+    return [
+        Case("asgi.create_story", create, is_async=True),
+        Case("asgi.list_stories_page", list_page, is_async=True),
+        Case("asgi.list_stories_not_modified", revalidate, is_async=True),
+    ]
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> Dict:
+    """
+    Per-case ratio to the baseline; cases slower than 1 + threshold are regressions.
+    Uses the fastest repeat, which is far less noisy than the median for micro timings.
+    """
+    report = {"regressions": [], "cases": {}}
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        ratio = current["min_ns_per_op"] / previous["min_ns_per_op"]
+        report["cases"][name] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            report["regressions"].append(name)
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", help="regex selecting case names")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 100, 1_000, 10_000, 100_000],
+                        help="history sizes for the ProgressivePromptingSystem cases")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="write JSON results here")
+    parser.add_argument("--baseline", help="previous JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    cases = prompt_cases() + progressive_cases(args.sizes) + asgi_cases()
+    if args.filter:
+        cases = [c for c in cases if re.search(args.filter, c.name)]
+
+    loop = asyncio.new_event_loop()
+    results = {}
+    for case in cases:
+        results[case.name] = time_case(case, loop, args.min_time, args.repeats)
+        print(f"{case.name:55s} {results[case.name]['ns_per_op']:>14,.0f} ns/op", file=sys.stderr)
+    loop.close()
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["vs_baseline"] = compare(results, json.load(f), args.threshold)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return 1 if args.baseline and report["vs_baseline"]["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Local stand-in for the Azure OpenAI chat-completions API.
+WHAT: A small ASGI server answering POST /openai/deployments/{deployment}/chat/completions
+      the way Azure does (JSON or SSE streaming, usage block, 429 with Retry-After).
+WHY: Load-testing /prompt or the generate_prompt Function against the real endpoint
+     costs money, is rate limited and is too noisy to compare runs.
+HOW: Every request draws a latency from a configurable distribution and may be turned
+     into a 429 or 500 at configurable rates. Streaming responses spread the latency
+     over time-to-first-token plus a per-chunk delay.
+
+Usage (from backend/):
+    python benchmarks/mock_openai.py --port 9100 --latency lognormal:400:0.5 --rate-limit-rate 0.02
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:9100 OPENAI_API_KEY=mock uvicorn main:app --port 8000
+
+Latency specs (milliseconds): fixed:MS, uniform:LO:HI, lognormal:MEDIAN:SIGMA, exponential:MEAN
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SAMPLE_PROMPTS = [
+    "What childhood moment shaped you?",
+    "Which song defined your summer?",
+    "Who taught you about kindness?",
+    "Where did you feel most at home?",
+    "What habit do you want to break?",
+    "Which journey changed your perspective?",
+    "Who makes you laugh hardest?",
+    "What was your bravest decision, and why?",
+]
+
+
+class LatencyModel:
+    """Latency distribution parsed from a spec string; sample() returns seconds."""
+
+    def __init__(self, spec: str, rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, *params = spec.split(":")
+        values = [float(p) for p in params]
+        if kind == "fixed" and len(values) == 1:
+            self._sample = lambda: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self._sample = lambda: self.rng.uniform(values[0], values[1])
+        elif kind == "lognormal" and len(values) == 2:
+            mu = math.log(values[0])
+            self._sample = lambda: self.rng.lognormvariate(mu, values[1])
+        elif kind == "exponential" and len(values) == 1:
+            self._sample = lambda: self.rng.expovariate(1 / values[0])
+        else:
+            raise ValueError(f"Invalid latency spec: {spec}")
+
+    def sample(self) -> float:
+        return max(0.0, self._sample()) / 1000
+
+
+class MockSettings:
+    def __init__(self, latency: str = "lognormal:400:0.5", error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after_seconds: int = 1, chunk_ms: float = 20.0,
+                 prompt_tokens: int = 180, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self.latency = LatencyModel(latency, self.rng)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.chunk_ms = chunk_ms
+        self.prompt_tokens = prompt_tokens
+
+
+def _error(status: int, code: str, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(status_code=status, content={"error": {"code": code, "message": message}}, headers=headers)
+
+
+def create_app(settings: MockSettings) -> FastAPI:
+    app = FastAPI(title="Mock Azure OpenAI")
+    counts = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "streams": 0}
+
+    def completion_texts(n: int) -> List[str]:
+        return settings.rng.sample(SAMPLE_PROMPTS, min(n, len(SAMPLE_PROMPTS)))
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        counts["requests"] += 1
+        body = await request.json()
+        roll = settings.rng.random()
+        if roll < settings.rate_limit_rate:
+            counts["rate_limited"] += 1
+            return _error(429, "429", "Rate limit is exceeded. Try again later.",
+                          {"Retry-After": str(settings.retry_after_seconds)})
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            counts["errors"] += 1
+            return _error(500, "InternalServerError", "The server had an error processing your request.")
+
+        n = int(body.get("n") or 1)
+        texts = completion_texts(n)
+        latency = settings.latency.sample()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if body.get("stream"):
+            counts["streams"] += 1
+            return StreamingResponse(
+                stream_chunks(completion_id, created, deployment, texts[0], latency),
+                media_type="text/event-stream",
+            )
+
+        await asyncio.sleep(latency)
+        counts["ok"] += 1
+        completion_tokens = sum(len(t.split()) + 2 for t in texts)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": deployment,
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                for i, text in enumerate(texts)
+            ],
+            "usage": {
+                "prompt_tokens": settings.prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": settings.prompt_tokens + completion_tokens,
+            },
+        }
+
+    async def stream_chunks(completion_id: str, created: int, deployment: str, text: str, first_token: float):
+        def chunk(choices):
+            return "data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created,
+                "model": deployment, "choices": choices,
+            }) + "\n\n"
+
+        yield chunk([])  # Azure sends prompt filter results before any choices
+        await asyncio.sleep(first_token)
+        for word in text.split(" "):
+            yield chunk([{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}])
+            await asyncio.sleep(settings.chunk_ms / 1000)
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        yield "data: [DONE]\n\n"
+        counts["ok"] += 1
+
+    @app.get("/mock/stats")
+    def stats():
+        return {**counts, "latency": settings.latency.spec,
+                "error_rate": settings.error_rate, "rate_limit_rate": settings.rate_limit_rate}
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", default="lognormal:400:0.5", help="latency distribution spec (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on 429")
+    parser.add_argument("--chunk-ms", type=float, default=20.0, help="delay between streamed chunks")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after_seconds=args.retry_after,
+        chunk_ms=args.chunk_ms,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
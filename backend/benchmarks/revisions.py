@@ -0,0 +1,149 @@
+"""
+Revision history cost: snapshots + deltas versus a full copy per save.
+WHAT: Replays a simulated writing session (autosaves that mostly append, sometimes
+      rewrite a sentence) against SQLite and reports stored bytes, database size,
+      time per save and time to rebuild the worst-case revision.
+WHY: The revision log (storage/revisions.py) exists to avoid multiplying storage by
+     the number of saves; this checks that it does, and what rebuilding costs.
+HOW: "deltas" is SQLiteStoryRepository with the given RevisionPolicy; "full_copies"
+     stores the whole content in a plain table on every save, as a naive history
+     would. Both run in fresh databases under a temporary directory.
+
+Usage (from backend/):
+    python benchmarks/revisions.py --saves 1000 --chars-per-save 300
+    python benchmarks/revisions.py --snapshot-every 50 --max-revisions 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.repository import SQLiteStoryRepository  # noqa: E402
+from storage.revisions import RevisionPolicy  # noqa: E402
+
+WORDS = "the sea was cold and we ran into it laughing while gran watched from the dunes".split()
+
+
+def session(saves: int, chars_per_save: int, seed: int):
+    """Yield the edit list of each autosave."""
+    rng = random.Random(seed)
+    length = 0
+    for _ in range(saves):
+        text = ""
+        while len(text) < chars_per_save:
+            text += rng.choice(WORDS) + " "
+        edits = [{"offset": None, "delete": 0, "text": text}]
+        if length > 200 and rng.random() < 0.2:
+            # Occasionally rework an earlier sentence
+            offset = rng.randrange(0, length - 100)
+            edits.append({"offset": offset, "delete": 40, "text": "we never forgot that summer "})
+        length += sum(len(e["text"]) - e["delete"] for e in edits)
+        yield edits
+
+
+def db_size(path: str) -> int:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(path)
+
+
+def run_deltas(directory: str, args) -> Dict:
+    path = os.path.join(directory, "deltas.db")
+    policy = RevisionPolicy(args.snapshot_every, args.snapshot_ratio, args.max_revisions)
+    repo = SQLiteStoryRepository(path, revisions=policy)
+    repo.add({"id": "story_bench", "title": "Bench", "content": "", "userId": "bench",
+              "createdAt": "t0", "updatedAt": "t0"})
+    started = time.perf_counter()
+    for i, edits in enumerate(session(args.saves, args.chars_per_save, args.seed)):
+        repo.apply_edits("bench", "story_bench", edits, f"t{i + 1}")
+    elapsed = time.perf_counter() - started
+
+    conn = repo.db.connect()
+    stored = conn.execute(
+        "SELECT count(*) AS n, sum(snapshot IS NOT NULL) AS snapshots, "
+        "coalesce(sum(length(snapshot)), 0) + coalesce(sum(length(delta)), 0) AS bytes FROM story_revisions"
+    ).fetchone()
+    # Worst case: the revision just before the newest snapshot (longest chain)
+    versions = [r["version"] for r in repo.list_revisions("bench", "story_bench")]
+    snapshots = {r["version"] for r in repo.list_revisions("bench", "story_bench") if r["snapshot"]}
+    worst = max((v for v in versions if v + 1 in snapshots), default=versions[0])
+    rebuild_started = time.perf_counter()
+    for _ in range(20):
+        repo.get_revision("bench", "story_bench", worst)
+    rebuild_ms = (time.perf_counter() - rebuild_started) / 20 * 1000
+    repo.close()
+    return {
+        "revisions_kept": stored["n"],
+        "snapshots": stored["snapshots"],
+        "stored_bytes": stored["bytes"],
+        "db_bytes": db_size(path),
+        "ms_per_save": round(elapsed / args.saves * 1000, 3),
+        "worst_rebuild_ms": round(rebuild_ms, 3),
+    }
+
+
+def run_full_copies(directory: str, args) -> Dict:
+    path = os.path.join(directory, "full.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE history (version INTEGER PRIMARY KEY, content TEXT NOT NULL)")
+    content = ""
+    started = time.perf_counter()
+    for i, edits in enumerate(session(args.saves, args.chars_per_save, args.seed)):
+        for edit in edits:
+            if edit["offset"] is None:
+                content += edit["text"]
+            else:
+                content = content[:edit["offset"]] + edit["text"] + content[edit["offset"] + edit["delete"]:]
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO history VALUES (?, ?)", (i + 1, content))
+        conn.execute("COMMIT")
+    elapsed = time.perf_counter() - started
+    stored = conn.execute("SELECT count(*), sum(length(content)) FROM history").fetchone()
+    conn.close()
+    return {
+        "revisions_kept": stored[0],
+        "stored_bytes": stored[1],
+        "db_bytes": db_size(path),
+        "ms_per_save": round(elapsed / args.saves * 1000, 3),
+        "final_length": len(content),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--saves", type=int, default=500)
+    parser.add_argument("--chars-per-save", type=int, default=300)
+    parser.add_argument("--snapshot-every", type=int, default=20)
+    parser.add_argument("--snapshot-ratio", type=float, default=0.5)
+    parser.add_argument("--max-revisions", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = {
+            "config": vars(args),
+            "deltas": run_deltas(directory, args),
+            "full_copies": run_full_copies(directory, args),
+        }
+    report["storage_ratio"] = round(report["full_copies"]["stored_bytes"] / max(report["deltas"]["stored_bytes"], 1), 1)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
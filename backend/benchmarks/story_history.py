@@ -0,0 +1,109 @@
+"""
+Memory and construction time: list of StoryMetadata models vs columnar StoryHistory.
+WHAT: Builds N synthetic history entries both ways and reports retained memory
+      (tracemalloc), construction time and full-scan time.
+WHY: Long progressive-prompting histories were held as one pydantic model per entry;
+     this keeps the cost of that representation next to the columnar one.
+HOW: Entries are generated from a fixed seed with a realistic vocabulary of themes,
+     characters and sentiments; each representation is built from the same dicts.
+
+Usage (from backend/):
+    python benchmarks/story_history.py                 # 1k, 10k and 100k entries
+    python benchmarks/story_history.py --sizes 5000
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from ai.content_safety import StoryMetadata  # noqa: E402
+from ai.story_history import StoryHistory  # noqa: E402
+
+THEMES = ["family", "travel", "loss", "career", "friendship", "childhood", "love", "courage",
+          "home", "music", "war", "faith", "school", "nature", "food", "illness"]
+CHARACTERS = ["Mum", "Dad", "Gran", "Grandpa", "Tom", "Aisha", "Mr. Lee", "Coach", "Sam",
+              "Aunt May", "the twins", "Rex"]
+SENTIMENTS = ["positive", "negative", "mixed", None]
+
+
+def make_entries(n: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    entries = []
+    for i in range(n):
+        entries.append({
+            "story_id": f"story_{i:08x}",
+            "title": f"Story {i}",
+            "content_preview": " ".join(rng.choice(THEMES) for _ in range(30))[:200],
+            "created_at": start + timedelta(minutes=i),
+            "word_count": rng.randint(50, 3000),
+            "completion_status": round(rng.random(), 2),
+            "themes": rng.sample(THEMES, rng.randint(1, 4)),
+            "characters": rng.sample(CHARACTERS, rng.randint(0, 3)),
+            "sentiment": rng.choice(SENTIMENTS),
+        })
+    return entries
+
+
+def measure(build):
+    """(retained bytes, build seconds, scan seconds) for build()."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    total = 0
+    for story in result:
+        total += story.word_count + len(story.themes)
+    scan = time.perf_counter() - started
+    del result
+    return retained, elapsed, scan
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    report = []
+    for n in args.sizes:
+        entries = make_entries(n)
+        rows = {}
+        for name, build in (
+            ("models", lambda: [StoryMetadata(**e) for e in entries]),
+            ("columnar", lambda: StoryHistory(entries)),
+        ):
+            # Time without tracemalloc overhead, memory with it
+            gc.collect()
+            started = time.perf_counter()
+            build()
+            build_seconds = time.perf_counter() - started
+            retained, _, scan = measure(build)
+            rows[name] = {
+                "retained_bytes": retained,
+                "bytes_per_entry": round(retained / n, 1),
+                "build_ms": round(build_seconds * 1000, 2),
+                "scan_ms": round(scan * 1000, 2),
+            }
+        rows["memory_ratio"] = round(rows["models"]["retained_bytes"] / rows["columnar"]["retained_bytes"], 2)
+        rows["build_speedup"] = round(rows["models"]["build_ms"] / rows["columnar"]["build_ms"], 2)
+        report.append({"entries": n, **rows})
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
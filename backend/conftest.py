@@ -0,0 +1,4 @@
+"""Shared pytest setup: keep the app on the in-memory store so tests never touch a real database."""
+import os
+
+os.environ.setdefault("STORY_STORE", "memory")
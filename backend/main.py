@@ -5,20 +5,60 @@ WHY: Demonstrates end-to-end flow without identity overhead.
 HOW: Replace user header extraction with JWT validation later.
 """
 
-from fastapi import FastAPI, Header, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from contextlib import asynccontextmanager
+from typing import Literal, Optional, List, Tuple
+import asyncio
+import base64
+import hashlib
+import json
 import random
+import time
 from datetime import datetime, timezone
 import uuid
 import os
 from dotenv import load_dotenv
 
+from ai.openai_client import close_async_openai_client, get_async_openai_client
+from ai.coalescing import create_prompt_coalescer
+from ai.prompt_cache import create_prompt_cache, make_cache_key
+from ai.prompt_dedup import create_prompt_memory
+from ai.prompt_pool import create_prompt_pool
+from ai.resilience import CircuitOpenError, create_upstream_guard
+from observability.metrics import create_metrics_registry
+from observability.tracing import ServerTimingMiddleware, span, tracing_settings
+from ai.content_safety import ProgressivePromptingSystem
+from ai.memo import create_analysis_memo
+from ai.story_analytics import create_analytics_pipeline, process_story
+from storage.bulk_import import ImportReport, ndjson_lines
+from storage.export import FORMATS, export_epub, export_markdown, export_text, iter_stories
+from storage.history_summary import create_history_summary_store
+from storage.json_cache import create_story_json_cache, join_fragments
+from storage.repository import VersionConflict, create_story_repository
+
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="StoryScribe Backend (Demo No Auth)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    METRICS.start(float(os.getenv("METRICS_FLUSH_SECONDS", "5")))
+    client, _ = get_openai_client()
+    if PROMPT_POOL and client:
+        # Warm the (genre, mood) prompt pools in the background
+        PROMPT_POOL.start()
+    yield
+    if PROMPT_POOL:
+        await PROMPT_POOL.stop()
+    # Finish queued analytics; anything left over is swept up after the next start
+    await asyncio.to_thread(STORY_ANALYTICS.stop)
+    # Drain the pooled Azure OpenAI connections on worker shutdown
+    await close_async_openai_client()
+    await METRICS.stop()
+
+app = FastAPI(title="StoryScribe Backend (Demo No Auth)", lifespan=lifespan)
 
 # Enable CORS for local development and production
 app.add_middleware(
@@ -31,13 +71,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Next-Offset", "Server-Timing"],
 )
 
-STORIES = {}  # In-memory; swap with Cosmos repository
+# Sampled per-stage timings (Server-Timing header, optional JSON trace logs)
+app.add_middleware(ServerTimingMiddleware, **tracing_settings())
+
+METRICS = create_metrics_registry()  # Usage ledger + latency; shared across workers via SQLite
+STORIES = create_story_repository()  # SQLite shared by all workers; STORY_STORE=memory for tests
+HISTORY_SUMMARIES = create_history_summary_store()  # Per-user digest for progressive prompting
+STORY_JSON_CACHE = create_story_json_cache()  # Encoded list-view JSON per story version
+# Word count, completion, themes, sentiment computed off the request path after each write
+STORY_ANALYTICS = create_analytics_pipeline(
+    lambda doc: process_story(doc, STORIES, HISTORY_SUMMARIES),
+    # Stories deferred while the queue was full are swept back in from the store
+    backlog=lambda limit, after: STORIES.stories_needing_analysis(limit, after=after),
+)
 
 def now_iso():
     return datetime.now(timezone.utc).isoformat()
 
+def new_story_id() -> str:
+    # 64 random bits: 32 made collisions likely once imports reach tens of thousands of stories
+    return "story_" + uuid.uuid4().hex[:16]
+
 def get_user(x_user_id: Optional[str]) -> str:
     if not x_user_id:
         raise HTTPException(status_code=401, detail="Missing X-User-Id (demo)")
@@ -47,6 +104,9 @@ class StoryCreate(BaseModel):
     title: str
     content: str
 
+class StoryImport(StoryCreate):
+    createdAt: Optional[datetime] = None  # Original date of a migrated entry (UTC if no offset)
+
 class StoryOut(BaseModel):
     id: str
     title: str
@@ -55,25 +115,366 @@ class StoryOut(BaseModel):
     createdAt: str
     updatedAt: str
 
+class TextEdit(BaseModel):
+    """
+    One autosave edit. Offsets count Unicode code points (Array.from(text) in JS),
+    not UTF-16 units. Edits in a patch apply in order, each to the previous result.
+    """
+    op: Literal["append", "splice"]
+    text: str = ""
+    offset: Optional[int] = Field(default=None, ge=0)  # splice only
+    delete: Optional[int] = Field(default=None, ge=0)  # splice only: code points removed at offset
+
+    @model_validator(mode="after")
+    def splice_needs_position(self):
+        # A missing offset must not silently become 0 and splice at the start of the text
+        if self.op == "splice" and (self.offset is None or self.delete is None):
+            raise ValueError("splice edits require offset and delete")
+        return self
+
+class StoryPatch(BaseModel):
+    title: Optional[str] = None
+    edits: List[TextEdit] = Field(default_factory=list, max_length=100)
+
+class StoryPatchResult(BaseModel):
+    id: str
+    title: str
+    length: int
+    updatedAt: str
+
+class StorySummary(BaseModel):
+    id: str
+    title: str
+    preview: str
+    wordCount: int
+    createdAt: str
+    updatedAt: str
+
+PREVIEW_CHARS = 200
+MAX_PAGE_SIZE = 100
+IMPORT_BATCH_SIZE = int(os.getenv("STORY_IMPORT_BATCH_SIZE", "500"))  # Stories written per transaction
+IMPORT_MAX_LINE_BYTES = int(os.getenv("STORY_IMPORT_MAX_LINE_BYTES", str(1024 * 1024)))
+EXPORT_BATCH_SIZE = int(os.getenv("STORY_EXPORT_BATCH_SIZE", "50"))  # Stories read per query while exporting
+STORY_FIELDS = set(StoryOut.model_fields) | set(StorySummary.model_fields)
+SUMMARY_FIELDS = list(StorySummary.model_fields)
+
+def summarize_story(doc: dict) -> dict:
+    """Derive list-view fields (preview, word count) from a stored story."""
+    content = doc["content"]
+    return {
+        **doc,
+        "preview": content[:PREVIEW_CHARS],
+        "wordCount": len(content.split()),
+    }
+
+def story_etag(doc: dict) -> str:
+    return f'"{doc["version"]}"'
+
+def parse_if_match(value: str) -> Optional[int]:
+    """Story version named by an If-Match header; None for "*" (any version)."""
+    value = value.strip()
+    if value == "*":
+        return None
+    try:
+        return int(value.removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=412, detail="If-Match does not name a story version")
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque cursor pointing just past this story in (createdAt, id) order."""
+    raw = json.dumps([doc["createdAt"], doc["id"]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, story_id = json.loads(base64.urlsafe_b64decode(padded))
+        return str(created_at), str(story_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str], view: str) -> Optional[List[str]]:
+    """Return the projected field list, or None for full StoryOut documents."""
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in STORY_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        return requested
+    if view == "summary":
+        return SUMMARY_FIELDS
+    if view != "full":
+        raise HTTPException(status_code=400, detail="view must be 'full' or 'summary'")
+    return None
+
 @app.post("/stories", response_model=StoryOut)
-def create_story(payload: StoryCreate, x_user_id: Optional[str] = Header(default=None)):
+def create_story(payload: StoryCreate, response: Response, x_user_id: Optional[str] = Header(default=None)):
     user = get_user(x_user_id)
-    story_id = "story_" + uuid.uuid4().hex[:8]
+    story_id = new_story_id()
+    created = now_iso()
     doc = {
         "id": story_id,
         "title": payload.title,
         "content": payload.content,
         "userId": user,
-        "createdAt": now_iso(),
-        "updatedAt": now_iso(),
+        "createdAt": created,
+        "updatedAt": created,
+        "version": 1,
     }
-    STORIES.setdefault(user, []).append(doc)
+    with span("repository"):
+        saved = STORIES.add(doc)
+    STORY_ANALYTICS.submit(saved)
+    response.headers["ETag"] = story_etag(saved)
+    return saved
+
+@app.post("/stories/import")
+async def import_stories(request: Request, x_user_id: Optional[str] = Header(default=None)):
+    """
+    Create many stories from an NDJSON body: one {"title", "content", "createdAt"?}
+    object per line. The body is parsed as it streams in and valid lines are written
+    IMPORT_BATCH_SIZE at a time; invalid lines are reported by number and skipped.
+    """
+    user = get_user(x_user_id)
+    report = ImportReport()
+    batch = []
+    async for line_no, line in ndjson_lines(request.stream(), IMPORT_MAX_LINE_BYTES):
+        if line is None:
+            report.error(line_no, f"Line is longer than {IMPORT_MAX_LINE_BYTES} bytes")
+            continue
+        if not line.strip():
+            continue
+        try:
+            item = StoryImport.model_validate_json(line)
+        except ValidationError as e:
+            report.error(line_no, validation_message(e))
+            continue
+        batch.append(imported_story(item, user))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await save_import_batch(batch, report)
+            batch = []
+    if batch:
+        await save_import_batch(batch, report)
+    return report.as_dict()
+
+def imported_story(item: StoryImport, user: str) -> dict:
+    if item.createdAt is None:
+        created = now_iso()
+    elif item.createdAt.tzinfo is None:
+        created = item.createdAt.replace(tzinfo=timezone.utc).isoformat()
+    else:
+        created = item.createdAt.astimezone(timezone.utc).isoformat()
+    return {
+        "id": new_story_id(),
+        "title": item.title,
+        "content": item.content,
+        "userId": user,
+        "createdAt": created,
+        "updatedAt": created,
+        "version": 1,
+    }
+
+async def save_import_batch(batch: List[dict], report: ImportReport) -> None:
+    with span("repository"):
+        saved = await asyncio.to_thread(STORIES.add_many, batch)
+    report.imported += len(saved)
+    # Imports never wait on the analytics queue; the sweep picks up what doesn't fit
+    report.analytics_deferred += sum(not STORY_ANALYTICS.submit(doc, bulk=True) for doc in saved)
+
+def validation_message(error: ValidationError) -> str:
+    """First problems of a line, without echoing its (possibly long) input."""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'line'}: {e['msg']}" for e in error.errors()[:3]
+    )
+
+@app.patch("/stories/{story_id}", response_model=StoryPatchResult)
+def patch_story(
+    story_id: str,
+    payload: StoryPatch,
+    response: Response,
+    if_match: Optional[str] = Header(default=None),
+    x_user_id: Optional[str] = Header(default=None),
+):
+    """
+    Autosave: apply append/splice edits to the stored text instead of resending it.
+    Requires If-Match with the ETag from the last create/get/patch; a stale ETag
+    gets 412 with the current ETag so the client can refetch and rebase its edits.
+    """
+    user = get_user(x_user_id)
+    if if_match is None:
+        raise HTTPException(status_code=428, detail="If-Match header required")
+    edits = [
+        {"offset": e.offset if e.op == "splice" else None, "delete": e.delete if e.op == "splice" else 0,
+         "text": e.text}
+        for e in payload.edits
+    ]
+    try:
+        with span("repository"):
+            doc = STORIES.apply_edits(user, story_id, edits, now_iso(), title=payload.title,
+                                      expected_version=parse_if_match(if_match))
+    except VersionConflict as e:
+        raise HTTPException(status_code=412, detail="Story was modified", headers={"ETag": f'"{e.current_version}"'})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Story not found")
+    STORY_ANALYTICS.submit(doc)
+    if STORY_JSON_CACHE:
+        STORY_JSON_CACHE.invalidate(story_id)
+    response.headers["ETag"] = story_etag(doc)
+    return {"id": doc["id"], "title": doc["title"], "length": len(doc["content"]), "updatedAt": doc["updatedAt"]}
+
+@app.get("/stories", response_model=None)
+def list_stories(
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    view: str = "full",
+    if_none_match: Optional[str] = Header(default=None),
+    x_user_id: Optional[str] = Header(default=None),
+):
+    """
+    List the user's stories oldest first.
+
+    - limit/cursor: keyset pagination; the next page's cursor is returned in X-Next-Cursor
+    - view=summary: title, preview, word count and timestamps only (no full content)
+    - fields=a,b,c: explicit projection over StoryOut and summary fields
+    - If-None-Match: 304 while none of the user's stories changed (strong ETag per
+      collection version and query)
+    Without limit the whole collection is returned, as before.
+    """
+    user = get_user(x_user_id)
+    projection = parse_fields(fields, view)
+    after = decode_cursor(cursor) if cursor else None
+
+    with span("repository"):
+        # Read the version before the stories: a write in between can only make the
+        # ETag older than the body, which costs a refetch, never a stale 304.
+        etag = collection_etag(STORIES.collection_version(user), limit, cursor, fields, view)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        # Fetch one extra row to learn whether another page exists
+        docs = STORIES.list_page(user, limit=limit + 1 if limit else None, after=after)
+    if limit and len(docs) > limit:
+        docs = docs[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(docs[-1])
+
+    with span("serialize"):
+        if fields or not STORY_JSON_CACHE:
+            return JSONResponse(content=[project_story(doc, projection) for doc in docs], headers=headers)
+        # Named views come from pre-serialized fragments, reused until the story changes
+        body = join_fragments(
+            STORY_JSON_CACHE.fragment(doc, view, lambda d: project_story(d, projection)) for doc in docs
+        )
+        return Response(content=body, media_type="application/json", headers=headers)
+
+def project_story(doc: dict, projection: Optional[List[str]]) -> dict:
+    if projection is None:
+        return StoryOut(**doc).model_dump()
+    full = summarize_story(doc)
+    return {f: full[f] for f in projection}
+
+def collection_etag(version: int, *query) -> str:
+    digest = hashlib.sha1(json.dumps(query).encode()).hexdigest()[:12]
+    return f'"{version}-{digest}"'
+
+@app.get("/stories/search", response_model=None)
+def search_stories(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(default=0, ge=0),
+    x_user_id: Optional[str] = Header(default=None),
+):
+    """
+    Ranked full-text search over the user's titles, content and story themes/characters.
+    Returns summaries with a relevance score; X-Next-Offset is set when more results exist.
+    """
+    user = get_user(x_user_id)
+    with span("search"):
+        hits = STORIES.search(user, q, limit=limit + 1, offset=offset)
+    headers = {}
+    if len(hits) > limit:
+        hits = hits[:limit]
+        headers["X-Next-Offset"] = str(offset + limit)
+
+    with span("serialize"):
+        items = []
+        for doc, score in hits:
+            full = summarize_story(doc)
+            items.append({**{f: full[f] for f in SUMMARY_FIELDS}, "score": round(score, 4)})
+        return JSONResponse(content=items, headers=headers)
+
+def story_search_for(user: str):
+    """Search callable for ProgressivePromptingSystem: any-term matches, best first."""
+    def search(query: str, limit: int) -> List[dict]:
+        return [doc for doc, _ in STORIES.search(user, query, limit=limit, any_terms=True)]
+    return search
+
+@app.get("/stories/export", response_model=None)
+def export_stories(
+    format: str = "markdown",
+    title: str = Query(default="My Stories", max_length=200),
+    x_user_id: Optional[str] = Header(default=None),
+):
+    """
+    Download the user's stories, oldest first, as one manuscript (markdown, txt or epub).
+    The body is streamed while stories are read EXPORT_BATCH_SIZE at a time.
+    """
+    user = get_user(x_user_id)
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(FORMATS)}")
+    media_type, extension = FORMATS[format]
+
+    render = {"markdown": export_markdown, "txt": export_text, "epub": export_epub}[format]
+    body = render(iter_stories(STORIES.list_page, user, EXPORT_BATCH_SIZE), title)
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="stories.{extension}"'},
+    )
+
+@app.get("/stories/{story_id}", response_model=StoryOut)
+def get_story(story_id: str, response: Response, x_user_id: Optional[str] = Header(default=None)):
+    user = get_user(x_user_id)
+    doc = STORIES.get(user, story_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Story not found")
+    response.headers["ETag"] = story_etag(doc)
     return doc
 
-@app.get("/stories", response_model=List[StoryOut])
-def list_stories(x_user_id: Optional[str] = Header(default=None)):
+@app.get("/stories/{story_id}/revisions")
+def list_story_revisions(story_id: str, x_user_id: Optional[str] = Header(default=None)):
+    """Retained earlier versions of a story, newest first (no content; see the next route)."""
     user = get_user(x_user_id)
-    return STORIES.get(user, [])
+    with span("repository"):
+        revisions = STORIES.list_revisions(user, story_id)
+    if revisions is None:
+        raise HTTPException(status_code=404, detail="Story not found")
+    return revisions
+
+@app.get("/stories/{story_id}/revisions/{version}")
+def get_story_revision(story_id: str, version: int, x_user_id: Optional[str] = Header(default=None)):
+    """One earlier version of a story, rebuilt from its nearest snapshot and the deltas after it."""
+    user = get_user(x_user_id)
+    with span("repository"):
+        revision = STORIES.get_revision(user, story_id, version)
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return revision
+
+@app.get("/stories/{story_id}/analytics")
+def get_story_analytics(story_id: str, x_user_id: Optional[str] = Header(default=None)):
+    """Precomputed metadata for a story; 404 until the analytics workers have processed it."""
+    user = get_user(x_user_id)
+    metadata = STORIES.get_metadata(user, story_id)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Story analytics not available")
+    return metadata
+
+@app.get("/analytics/stats")
+def story_analytics_stats():
+    """Queue depth and outcomes of the story analytics workers in this process."""
+    return STORY_ANALYTICS.stats()
 
 @app.get("/health")
 def health():
@@ -81,35 +482,10 @@ def health():
 
 def get_openai_client():
     """
-    Initialize Azure OpenAI client if credentials are available.
+    Shared async Azure OpenAI client for this worker.
     Returns (client, deployment_name) or (None, None) if not configured.
     """
-    try:
-        from openai import AzureOpenAI
-        
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        deployment = os.getenv("OPENAI_DEPLOYMENT", "gpt-4o-mini")
-        api_version = os.getenv("OPENAI_API_VERSION", "2024-08-01-preview")
-        api_key = os.getenv("OPENAI_API_KEY")
-        
-        if not endpoint:
-            return None, None
-        
-        if not api_key:
-            print("Warning: OPENAI_API_KEY not found in environment")
-            return None, None
-        
-        # Create Azure OpenAI client with API key
-        client = AzureOpenAI(
-            azure_endpoint=endpoint,
-            api_key=api_key,
-            api_version=api_version
-        )
-        
-        return client, deployment
-    except Exception as e:
-        print(f"Warning: Could not initialize Azure OpenAI: {e}")
-        return None, None
+    return get_async_openai_client()
 
 # Static fallback prompts
 FALLBACK_PROMPTS = {
@@ -201,74 +577,472 @@ MOODS = {
 
 DEFAULT_MOOD_KEY = "deep_reflection"
 
-def resolve_mood(mood_raw: Optional[str]) -> dict:
-    """Resolve incoming mood to a known style definition."""
+def resolve_mood_key(mood_raw: Optional[str]) -> str:
+    """Normalize incoming mood text to one of the MOODS keys."""
     if not mood_raw:
-        return MOODS[DEFAULT_MOOD_KEY]
+        return DEFAULT_MOOD_KEY
     normalized = mood_raw.strip().lower().replace("-", "_").replace(" ", "_")
-    return MOODS.get(normalized, MOODS[DEFAULT_MOOD_KEY])
+    return normalized if normalized in MOODS else DEFAULT_MOOD_KEY
+
+def resolve_mood(mood_raw: Optional[str]) -> dict:
+    """Resolve incoming mood to a known style definition."""
+    return MOODS[resolve_mood_key(mood_raw)]
 
 
-def select_system_prompt(mood_config: dict) -> str:
-    """Randomly choose a system prompt template and format it for the mood."""
-    template = random.choice(SYSTEM_PROMPT_TEMPLATES)
-    return template.format(MOOD=mood_config["label"])
+def select_system_prompt(mood_config: dict, template_index: Optional[int] = None) -> str:
+    """Choose a system prompt template (randomly unless given) and format it for the mood."""
+    if template_index is None:
+        template_index = random.randrange(len(SYSTEM_PROMPT_TEMPLATES))
+    return SYSTEM_PROMPT_TEMPLATES[template_index].format(MOOD=mood_config["label"])
+
+PROMPT_CACHE = create_prompt_cache()  # PROMPT_CACHE_BACKEND=memory|sqlite|off
+PROMPT_COALESCER = create_prompt_coalescer()  # PROMPT_COALESCE_ENABLED=false to disable
+
+def build_user_prompt(genre: str, mood_config: dict, preferences: Optional[str]) -> str:
+    """Build user instructions for the model."""
+    user_parts = [f"Generate a writing prompt for the genre: {genre}."]
+    user_parts.append(f"Mood guidance: {mood_config['label']} — {mood_config['description']}")
+    if preferences:
+        user_parts.append(f"User preferences: {preferences}")
+    user_parts.append("Return only the prompt.")
+    return " ".join(user_parts)
+
+# Deadline, circuit breaker and hedging around every completion in this worker
+OPENAI_GUARD = create_upstream_guard()
+
+# (prompt_tokens, completion_tokens) attributed to one returned choice
+TokenShare = Tuple[float, float]
+
+async def request_completions(client, deployment: str, system_prompt: str, user_prompt: str,
+                              n: int = 1) -> List[Tuple[str, Optional[TokenShare]]]:
+    """
+    One chat completion with n choices, returning (prompt text, token share) per choice.
+    Token usage is split evenly across choices so coalesced callers each get their part.
+    Raises CircuitOpenError / TimeoutError from OPENAI_GUARD so callers fall back fast.
+    """
+    def make_call():
+        return client.chat.completions.create(
+            model=deployment,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            max_tokens=80,
+            temperature=0.7,
+            n=n
+        )
+
+    started = time.monotonic()
+    try:
+        completion = await OPENAI_GUARD.call(make_call)
+    except CircuitOpenError:
+        METRICS.inc("storyscribe_openai_requests_total", {"outcome": "circuit_open"})
+        raise
+    except asyncio.TimeoutError:
+        METRICS.inc("storyscribe_openai_requests_total", {"outcome": "timeout"})
+        raise
+    except Exception:
+        METRICS.inc("storyscribe_openai_requests_total", {"outcome": "error"})
+        raise
+    METRICS.inc("storyscribe_openai_requests_total", {"outcome": "ok"})
+    METRICS.observe("storyscribe_openai_latency_seconds", time.monotonic() - started)
+
+    choices = completion.choices
+    usage = getattr(completion, "usage", None)
+    share = (usage.prompt_tokens / len(choices), usage.completion_tokens / len(choices)) if usage else None
+    return [(choice.message.content.strip(), share) for choice in choices]
+
+async def request_completion(client, deployment: str, system_prompt: str,
+                             user_prompt: str) -> Tuple[str, Optional[TokenShare]]:
+    """Single chat completion returning the stripped prompt text and its token usage."""
+    return (await request_completions(client, deployment, system_prompt, user_prompt))[0]
+
+def record_prompt_metrics(response: dict, user: str, mood_key: str, template_index: int,
+                          tokens: Optional[TokenShare] = None) -> dict:
+    """Count the response by source and charge any tokens it used to the user."""
+    METRICS.inc("storyscribe_prompt_requests_total", {"source": response["source"], "mood": mood_key})
+    if tokens:
+        METRICS.record_tokens(user, mood_key, str(template_index), *tokens)
+    return response
+
+def ai_prompt_response(prompt: str, genre: str, mood_config: dict, deployment: str, **flags) -> dict:
+    return {
+        "prompt": prompt,
+        "genre": genre,
+        "mood": mood_config["label"],
+        "source": "azure_openai",
+        "model": deployment,
+        **flags
+    }
+
+def static_prompt_response(genre: str, mood_config: dict) -> dict:
+    """Static fallback used when Azure OpenAI is unavailable or fails."""
+    prompt_text = FALLBACK_PROMPTS.get(genre.lower(), FALLBACK_PROMPTS["memoir"])
+    return {
+        "prompt": prompt_text,
+        "genre": genre,
+        "mood": mood_config["label"],
+        "source": "static_fallback"
+    }
 
 @app.get("/prompt")
-def get_prompt(genre: str = "memoir", mood: Optional[str] = None, preferences: Optional[str] = None):
+async def get_prompt(
+    genre: str = "memoir",
+    mood: Optional[str] = None,
+    preferences: Optional[str] = None,
+    x_user_id: Optional[str] = Header(default=None),
+):
     """
     Generate a writing prompt, using Azure OpenAI if available, otherwise fallback to static prompts.
     
     This endpoint supports:
     - AI-powered prompts via Azure OpenAI (if AZURE_OPENAI_ENDPOINT is configured)
     - Static fallback prompts (if Azure OpenAI is not configured)
+
+    The completion is awaited on the worker's shared async client, so concurrent
+    prompt requests are bounded by the upstream rather than the threadpool.
+    X-User-Id is optional here and only used to attribute token usage.
     """
-    genre_lower = genre.lower()
-    
-    mood_config = resolve_mood(mood)
-    system_prompt = select_system_prompt(mood_config)
-    # Build user instructions for the model
-    user_parts = [f"Generate a writing prompt for the genre: {genre}."]
-    user_parts.append(f"Mood guidance: {mood_config['label']} — {mood_config['description']}")
-    if preferences:
-        user_parts.append(f"User preferences: {preferences}")
-    user_parts.append("Return only the prompt.")
-    user_prompt = " ".join(user_parts)
+    return await generate_prompt_response(genre, mood, preferences, user=x_user_id or ANONYMOUS_USER)
+
+ANONYMOUS_USER = "anonymous"
+
+PROMPT_MEMORY = create_prompt_memory()  # Per-user recent prompts for near-duplicate checks
+PROMPT_DEDUP_RETRIES = int(os.getenv("PROMPT_DEDUP_RETRIES", "1"))
+
+def is_repeat(user: str, prompt: str) -> bool:
+    """True if this identified user was recently shown (nearly) the same prompt."""
+    return bool(PROMPT_MEMORY) and user != ANONYMOUS_USER and PROMPT_MEMORY.is_repeat(user, prompt)
+
+def serve_prompt(response: dict, user: str, mood_key: str, template_index: int,
+                 tokens: Optional[TokenShare] = None) -> dict:
+    """Remember the prompt for the user's repeat checks, then record its metrics."""
+    if PROMPT_MEMORY and user != ANONYMOUS_USER:
+        PROMPT_MEMORY.remember(user, response["prompt"])
+    return record_prompt_metrics(response, user, mood_key, template_index, tokens)
+
+async def generate_prompt_response(genre: str, mood: Optional[str], preferences: Optional[str],
+                                   user: str = ANONYMOUS_USER) -> dict:
+    """Pool, cache, live completion, then static fallback — shared by /prompt and /prompts/batch."""
+    with span("mood"):
+        mood_key = resolve_mood_key(mood)
+        mood_config = MOODS[mood_key]
+    with span("template"):
+        template_index = random.randrange(len(SYSTEM_PROMPT_TEMPLATES))
+        system_prompt = select_system_prompt(mood_config, template_index)
+        user_prompt = build_user_prompt(genre, mood_config, preferences)
 
     # Try to use Azure OpenAI
-    client, deployment = get_openai_client()
+    with span("client"):
+        client, deployment = get_openai_client()
     
     if client and deployment:
+        # Warm pools only hold generic prompts, so personalised requests skip them
+        with span("pool"):
+            pooled = PROMPT_POOL.pop(genre, mood_key) if PROMPT_POOL and not preferences else None
+        if pooled and not is_repeat(user, pooled):
+            response = ai_prompt_response(pooled, genre, mood_config, deployment, cached=False, pooled=True)
+            return serve_prompt(response, user, mood_key, template_index)
+
+        cache_key = make_cache_key(genre, mood_key, preferences, template_index)
+        with span("cache"):
+            # SQLite-backed caches read (and touch) on disk under the write lock
+            cached = await asyncio.to_thread(PROMPT_CACHE.get, cache_key) if PROMPT_CACHE else None
+        if cached and not is_repeat(user, cached):
+            response = ai_prompt_response(cached, genre, mood_config, deployment, cached=True, pooled=False)
+            return serve_prompt(response, user, mood_key, template_index)
+        try:
+            # Generate AI-powered prompt; identical concurrent requests share one call
+            with span("upstream"):
+                if PROMPT_COALESCER:
+                    # Keyed like the cache: the completion is built from this caller's template
+                    ai_prompt, tokens = await PROMPT_COALESCER.get(
+                        cache_key,
+                        lambda n: request_completions(client, deployment, system_prompt, user_prompt, n),
+                    )
+                else:
+                    ai_prompt, tokens = await request_completion(client, deployment, system_prompt, user_prompt)
+            if PROMPT_CACHE:
+                await asyncio.to_thread(PROMPT_CACHE.put, cache_key, ai_prompt)
+
+            # The user has seen this question already: resample within the retry budget,
+            # then try a pooled alternative, and only then serve the repeat
+            with span("dedup"):
+                repeat = is_repeat(user, ai_prompt)
+                retries = 0
+                while repeat and retries < PROMPT_DEDUP_RETRIES:
+                    retries += 1
+                    METRICS.inc("storyscribe_prompt_repeats_total", {"action": "retry"})
+                    if tokens:
+                        METRICS.record_tokens(user, mood_key, str(template_index), *tokens)
+                    ai_prompt, tokens = await request_completion(client, deployment, system_prompt, user_prompt)
+                    repeat = is_repeat(user, ai_prompt)
+                if repeat:
+                    alternative = PROMPT_POOL.pop(genre, mood_key) if PROMPT_POOL and not preferences else None
+                    if alternative and not is_repeat(user, alternative):
+                        METRICS.inc("storyscribe_prompt_repeats_total", {"action": "pooled"})
+                        if tokens:
+                            METRICS.record_tokens(user, mood_key, str(template_index), *tokens)
+                        response = ai_prompt_response(alternative, genre, mood_config, deployment, cached=False, pooled=True)
+                        return serve_prompt(response, user, mood_key, template_index)
+                    METRICS.inc("storyscribe_prompt_repeats_total", {"action": "served"})
+            response = ai_prompt_response(ai_prompt, genre, mood_config, deployment, cached=False, pooled=False)
+            return serve_prompt(response, user, mood_key, template_index, tokens)
+        except Exception as e:
+            print(f"Error calling Azure OpenAI: {e}")
+            # Fall through to static prompts
+    
+    # Fallback to static prompts
+    return serve_prompt(static_prompt_response(genre, mood_config), user, mood_key, template_index)
+
+MAX_BATCH_SPECS = 20
+PROMPT_BATCH_CONCURRENCY = int(os.getenv("PROMPT_BATCH_CONCURRENCY", "5"))
+PROMPT_BATCH_DEADLINE_SECONDS = float(os.getenv("PROMPT_BATCH_DEADLINE_SECONDS", "10"))
+
+class PromptSpec(BaseModel):
+    genre: str = "memoir"
+    mood: Optional[str] = None
+    preferences: Optional[str] = None
+
+class PromptBatchRequest(BaseModel):
+    specs: List[PromptSpec] = Field(min_length=1, max_length=MAX_BATCH_SPECS)
+    deadline_seconds: Optional[float] = Field(default=None, gt=0, le=60)
+
+@app.post("/prompts/batch")
+async def get_prompts_batch(payload: PromptBatchRequest, x_user_id: Optional[str] = Header(default=None)):
+    """
+    Generate several prompts at once (e.g. one per mood during onboarding).
+
+    Specs fan out concurrently under a semaphore of PROMPT_BATCH_CONCURRENCY.
+    Results keep request order; each item reports its source and a status of
+    "ok" or "timeout". Items still running at the deadline are cancelled and
+    answered with the static fallback so the batch always returns.
+    """
+    semaphore = asyncio.Semaphore(PROMPT_BATCH_CONCURRENCY)
+    deadline = payload.deadline_seconds or PROMPT_BATCH_DEADLINE_SECONDS
+
+    async def run(spec: PromptSpec) -> dict:
+        async with semaphore:
+            return await generate_prompt_response(spec.genre, spec.mood, spec.preferences,
+                                                  user=x_user_id or ANONYMOUS_USER)
+
+    tasks = [asyncio.create_task(run(spec)) for spec in payload.specs]
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        # Wait for the cancellations to land so no work outlives the request
+        # and no exception goes unretrieved
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    results = []
+    for spec, task in zip(payload.specs, tasks):
+        if task in done and not task.exception():
+            results.append({**task.result(), "status": "ok"})
+        else:
+            fallback = static_prompt_response(spec.genre, resolve_mood(spec.mood))
+            results.append({**fallback, "status": "timeout" if task in pending else "error"})
+    return {"results": results, "complete": not pending}
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_static_prompt(genre: str, mood_key: str):
+    """Emit the static fallback word by word, followed by the usual metadata."""
+    response = static_prompt_response(genre, MOODS[mood_key])
+    METRICS.inc("storyscribe_prompt_requests_total", {"source": response["source"], "mood": mood_key})
+    words = response["prompt"].split(" ")
+    for i, word in enumerate(words):
+        yield sse_event("token", {"text": word if i == len(words) - 1 else word + " "})
+    yield sse_event("done", response)
+
+@app.get("/prompt/stream")
+async def stream_prompt(genre: str = "memoir", mood: Optional[str] = None, preferences: Optional[str] = None):
+    """
+    Stream a writing prompt as Server-Sent Events.
+
+    Events:
+    - token: {"text": ...} incremental prompt text
+    - reset: {"reason": ...} upstream failed mid-stream; discard the text received so far
+    - done: the same metadata /prompt returns (prompt, genre, mood, source, model)
+    """
+    mood_key = resolve_mood_key(mood)
+    mood_config = MOODS[mood_key]
+    template_index = random.randrange(len(SYSTEM_PROMPT_TEMPLATES))
+    system_prompt = select_system_prompt(mood_config, template_index)
+    user_prompt = build_user_prompt(genre, mood_config, preferences)
+    client, deployment = get_openai_client()
+
+    async def events():
+        # An open breaker skips the upstream entirely
+        if not (client and deployment) or not OPENAI_GUARD.breaker.allow():
+            for frame in stream_static_prompt(genre, mood_key):
+                yield frame
+            return
+
+        parts = []
+        started = time.monotonic()
         try:
-            # Generate AI-powered prompt
-            completion = client.chat.completions.create(
+            stream = await asyncio.wait_for(client.chat.completions.create(
                 model=deployment,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 max_tokens=80,
-                temperature=0.7
-            )
-            
-            ai_prompt = completion.choices[0].message.content.strip()
-            
-            return {
-                "prompt": ai_prompt,
-                "genre": genre,
-                "mood": mood_config["label"],
-                "source": "azure_openai",
-                "model": deployment
-            }
+                temperature=0.7,
+                stream=True
+            ), timeout=OPENAI_GUARD.deadline_seconds)
+            async for chunk in stream:
+                # Azure sends a leading chunk with only content-filter results and no choices
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    parts.append(text)
+                    yield sse_event("token", {"text": text})
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client went away mid-stream; don't leave a half-open probe dangling
+            OPENAI_GUARD.breaker.release()
+            raise
         except Exception as e:
-            print(f"Error calling Azure OpenAI: {e}")
-            # Fall through to static prompts
-    
-    # Fallback to static prompts
-    prompt_text = FALLBACK_PROMPTS.get(genre_lower, FALLBACK_PROMPTS["memoir"])
-    return {
-        "prompt": prompt_text,
-        "genre": genre,
-        "mood": mood_config["label"],
-        "source": "static_fallback"
-    }
\ No newline at end of file
+            print(f"Error streaming from Azure OpenAI: {e}")
+            OPENAI_GUARD.breaker.record(False)
+            METRICS.inc("storyscribe_openai_requests_total", {"outcome": "error"})
+            if parts:
+                yield sse_event("reset", {"reason": "upstream_error"})
+            for frame in stream_static_prompt(genre, mood_key):
+                yield frame
+            return
+
+        elapsed = time.monotonic() - started
+        OPENAI_GUARD.breaker.record(True, elapsed)
+        METRICS.inc("storyscribe_openai_requests_total", {"outcome": "ok"})
+        METRICS.observe("storyscribe_openai_latency_seconds", elapsed)
+        ai_prompt = "".join(parts).strip()
+        if not ai_prompt:
+            for frame in stream_static_prompt(genre, mood_key):
+                yield frame
+            return
+        if PROMPT_CACHE:
+            await asyncio.to_thread(
+                PROMPT_CACHE.put, make_cache_key(genre, mood_key, preferences, template_index), ai_prompt
+            )
+        METRICS.inc("storyscribe_prompt_requests_total", {"source": "azure_openai", "mood": mood_key})
+        yield sse_event("done", ai_prompt_response(ai_prompt, genre, mood_config, deployment, cached=False, pooled=False))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+ANALYSIS_MEMO = create_analysis_memo()  # Per-user history analyses, keyed on the history version
+ANALYSIS_TEMPLATE = "history_analysis"
+
+def analysis_completion(client, deployment: str, user: str):
+    """Completion callable for ProgressivePromptingSystem analyses (guarded, metered, charged to the user)."""
+    async def complete(system_prompt: str, user_prompt: str) -> str:
+        text, tokens = await request_completion(client, deployment, system_prompt, user_prompt)
+        if tokens:
+            METRICS.record_tokens(user, "none", ANALYSIS_TEMPLATE, *tokens)
+        return text
+    return complete
+
+@app.get("/prompt/next")
+async def next_prompt(
+    genre_selected: bool = False,
+    title_selected: bool = False,
+    x_user_id: Optional[str] = Header(default=None),
+):
+    """
+    Progressive prompt for the user's current stage (continuation, new topic,
+    genre/title suggestion, refinement) based on their history summary.
+    Genre, title and theme analyses run concurrently and are memoized until
+    the user's stories change.
+    """
+    user = get_user(x_user_id)
+    with span("history"):
+        summary = await asyncio.to_thread(HISTORY_SUMMARIES.get, user)
+
+    client, deployment = get_openai_client()
+    system = ProgressivePromptingSystem(
+        client,
+        {"user_id": user, "genre_selected": genre_selected, "title_selected": title_selected},
+        history_summary=summary,
+        story_search=story_search_for(user),
+        complete=analysis_completion(client, deployment, user) if client else None,
+    )
+    if system.needs_analysis:
+        with span("analysis"):
+            system.analysis = await ANALYSIS_MEMO.get(user, summary.version, system.analyze_history)
+        if system.analysis.fallback:
+            # Don't pin defaults from a failed upstream call until the next story
+            ANALYSIS_MEMO.invalidate(user, summary.version)
+
+    with span("generate"):
+        result = await system.generate_next_prompt()
+    METRICS.inc("storyscribe_prompt_requests_total", {"source": "progressive", "mood": "none"})
+    return result
+
+@app.get("/prompt/cache/stats")
+def prompt_cache_stats():
+    """Hit/miss counters for this worker's view of the prompt cache."""
+    if not PROMPT_CACHE:
+        return {"backend": "off"}
+    return PROMPT_CACHE.stats()
+
+async def generate_pool_prompt(genre: str, mood_key: str) -> str:
+    """Generic (no preferences) prompt used to refill the warm pools."""
+    client, deployment = get_openai_client()
+    if not client:
+        raise RuntimeError("Azure OpenAI is not configured")
+    mood_config = MOODS[mood_key]
+    template_index = random.randrange(len(SYSTEM_PROMPT_TEMPLATES))
+    prompt, tokens = await request_completion(
+        client, deployment, select_system_prompt(mood_config, template_index), build_user_prompt(genre, mood_config, None)
+    )
+    if tokens:
+        # Refill spend is charged to a pseudo-user so it stays visible in the ledger
+        METRICS.record_tokens(POOL_USER, mood_key, str(template_index), *tokens)
+    return prompt
+
+POOL_USER = "_prompt_pool"
+
+# One warm pool per (genre, mood); PROMPT_POOL_ENABLED=false turns it off
+PROMPT_POOL = create_prompt_pool(
+    generate_pool_prompt,
+    [(genre, mood_key) for genre in FALLBACK_PROMPTS for mood_key in MOODS],
+)
+
+@app.get("/prompt/pool/stats")
+def prompt_pool_stats():
+    """Pool sizes and refill counters for this worker."""
+    if not PROMPT_POOL:
+        return {"enabled": False}
+    return {"enabled": True, **PROMPT_POOL.stats()}
+
+@app.get("/prompt/resilience/stats")
+def prompt_resilience_stats():
+    """Circuit breaker state, deadline misses and hedge win rate for this worker."""
+    return OPENAI_GUARD.stats()
+
+@app.get("/prompt/dedup/stats")
+def prompt_dedup_stats():
+    """Near-duplicate checks against users' recent prompts in this worker."""
+    if not PROMPT_MEMORY:
+        return {"enabled": False}
+    return {"enabled": True, "retries": PROMPT_DEDUP_RETRIES, **PROMPT_MEMORY.stats()}
+
+@app.get("/prompt/coalescing/stats")
+def prompt_coalescing_stats():
+    """How many prompt requests shared an upstream call in this worker."""
+    if not PROMPT_COALESCER:
+        return {"enabled": False}
+    return {"enabled": True, **PROMPT_COALESCER.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint: token ledger, upstream latency and prompt sources for all workers."""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
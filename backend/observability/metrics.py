@@ -0,0 +1,258 @@
+"""
+Usage ledger and request metrics.
+WHAT: Token usage (by user, mood and template), upstream latency histograms and
+      prompt source counts, exposed in Prometheus text format.
+WHY: get_prompt used to drop completion.usage and only print errors, so latency,
+     token spend and fallback rate in production were unknown.
+HOW: Each worker adds to plain in-process dicts (one short lock, no I/O on the
+     request path). A background task periodically folds those deltas into SQLite
+     in a single transaction, so /metrics on any worker reports totals for all
+     workers. Per-user token totals are also kept in time buckets for a rolling window.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+from storage.sqlite import DEFAULT_DB_PATH, SQLiteDatabase
+
+# Upstream latency buckets in seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+
+METRIC_HELP = {
+    "storyscribe_prompt_requests_total": ("counter", "Prompt responses by source and mood."),
+    "storyscribe_prompt_repeats_total": ("counter", "Near-duplicate prompts by how they were handled."),
+    "storyscribe_openai_tokens_total": ("counter", "Azure OpenAI tokens by user, mood, template and kind."),
+    "storyscribe_openai_requests_total": ("counter", "Azure OpenAI calls by outcome."),
+    "storyscribe_openai_latency_seconds": ("histogram", "Azure OpenAI completion latency."),
+    "storyscribe_user_tokens_window": ("gauge", "Tokens per user over the rolling window."),
+}
+
+CounterKey = Tuple[str, str]  # (metric name, rendered label set)
+
+
+def render_labels(labels: Dict[str, str]) -> str:
+    """Prometheus label set with sorted keys and escaped values."""
+    if not labels:
+        return ""
+    parts = []
+    for key in sorted(labels):
+        value = str(labels[key]).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class MetricsRegistry:
+    """
+    Counter/histogram aggregation for one worker, optionally flushed to a shared store.
+
+    Histograms are stored as plain counters (_bucket/_sum/_count), so merging
+    deltas from several workers is a sum.
+    """
+
+    def __init__(self, store: Optional["SQLiteMetricsStore"] = None, user_window_seconds: int = 86400,
+                 user_bucket_seconds: int = 300):
+        self.store = store
+        self.user_window_seconds = user_window_seconds
+        self.user_bucket_seconds = user_bucket_seconds
+        self._lock = threading.Lock()
+        self._counters: Dict[CounterKey, float] = defaultdict(float)
+        self._user_buckets: Dict[Tuple[str, int, str], float] = defaultdict(float)
+        # Held from draining the deltas until the store has committed them (or they
+        # were put back), so snapshot() never sees them in neither place
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0) -> None:
+        key = (name, render_labels(labels or {}))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None,
+                buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        labels = labels or {}
+        updates = [(f"{name}_bucket", render_labels({**labels, "le": "+Inf"})),
+                   (f"{name}_count", render_labels(labels))]
+        updates += [(f"{name}_bucket", render_labels({**labels, "le": str(b)})) for b in buckets if value <= b]
+        with self._lock:
+            for key in updates:
+                self._counters[key] += 1
+            self._counters[(f"{name}_sum", render_labels(labels))] += value
+
+    def record_tokens(self, user: str, mood: str, template: str, prompt_tokens: float,
+                      completion_tokens: float) -> None:
+        bucket = int(time.time()) // self.user_bucket_seconds * self.user_bucket_seconds
+        base = {"user": user, "mood": mood, "template": template}
+        with self._lock:
+            self._counters[("storyscribe_openai_tokens_total", render_labels({**base, "kind": "prompt"}))] += prompt_tokens
+            self._counters[("storyscribe_openai_tokens_total", render_labels({**base, "kind": "completion"}))] += completion_tokens
+            self._user_buckets[(user, bucket, "prompt")] += prompt_tokens
+            self._user_buckets[(user, bucket, "completion")] += completion_tokens
+
+    def _drain(self):
+        with self._lock:
+            counters, self._counters = self._counters, defaultdict(float)
+            buckets, self._user_buckets = self._user_buckets, defaultdict(float)
+        return counters, buckets
+
+    def flush(self) -> None:
+        """Fold this worker's pending deltas into the shared store."""
+        if self.store is None:
+            return
+        with self._flush_lock:
+            counters, buckets = self._drain()
+            try:
+                self.store.apply(counters, buckets, prune_before=int(time.time()) - self.user_window_seconds)
+            except Exception as e:
+                # Keep the deltas for the next attempt
+                print(f"Warning: metrics flush failed: {e}")
+                with self._lock:
+                    for key, value in counters.items():
+                        self._counters[key] += value
+                    for key, value in buckets.items():
+                        self._user_buckets[key] += value
+
+    def start(self, interval_seconds: float) -> None:
+        if self.store is not None and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop(interval_seconds))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _flush_loop(self, interval_seconds: float) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            # flush() may wait on SQLite's write lock; keep that off the event loop
+            await asyncio.to_thread(self.flush)
+
+    def snapshot(self) -> Tuple[Dict[CounterKey, float], Dict[str, Dict[str, float]]]:
+        """Totals across workers (shared store plus this worker's unflushed deltas)."""
+        cutoff = int(time.time()) - self.user_window_seconds
+        counters: Dict[CounterKey, float] = defaultdict(float)
+        users: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        with self._flush_lock:
+            if self.store is not None:
+                for key, value in self.store.counters():
+                    counters[key] += value
+                for user, kind, value in self.store.user_totals(since=cutoff):
+                    users[user][kind] += value
+            with self._lock:
+                for key, value in self._counters.items():
+                    counters[key] += value
+                for (user, bucket, kind), value in self._user_buckets.items():
+                    if bucket >= cutoff:
+                        users[user][kind] += value
+        return counters, users
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        counters, users = self.snapshot()
+        families: Dict[str, list] = defaultdict(list)
+        for (name, labels), value in counters.items():
+            family = name
+            for suffix in ("_bucket", "_sum", "_count"):
+                if name.endswith(suffix) and name[: -len(suffix)] in METRIC_HELP:
+                    family = name[: -len(suffix)]
+            families[family].append(f"{name}{labels} {value:g}")
+        window = f"{self.user_window_seconds}s"
+        for user, kinds in users.items():
+            for kind, value in kinds.items():
+                labels = render_labels({"user": user, "kind": kind, "window": window})
+                families["storyscribe_user_tokens_window"].append(f"storyscribe_user_tokens_window{labels} {value:g}")
+
+        lines = []
+        for family in sorted(families):
+            metric_type, help_text = METRIC_HELP.get(family, ("untyped", family))
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            lines.extend(sorted(families[family]))
+        return "\n".join(lines) + "\n"
+
+
+class SQLiteMetricsStore:
+    """Cross-worker totals; every flush is one short write transaction."""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.db = SQLiteDatabase(path)
+        conn = self.db.connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metrics_counters (
+                name TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (name, labels)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metrics_user_tokens (
+                user_id TEXT NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                value REAL NOT NULL,
+                PRIMARY KEY (user_id, bucket_start, kind)
+            )
+            """
+        )
+
+    def apply(self, counters: Dict[CounterKey, float], buckets: Dict[Tuple[str, int, str], float],
+              prune_before: int) -> None:
+        with self.db.transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO metrics_counters (name, labels, value) VALUES (?, ?, ?)
+                ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value
+                """,
+                [(name, labels, value) for (name, labels), value in counters.items()],
+            )
+            conn.executemany(
+                """
+                INSERT INTO metrics_user_tokens (user_id, bucket_start, kind, value) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, bucket_start, kind) DO UPDATE SET value = value + excluded.value
+                """,
+                [(user, bucket, kind, value) for (user, bucket, kind), value in buckets.items()],
+            )
+            conn.execute("DELETE FROM metrics_user_tokens WHERE bucket_start < ?", (prune_before,))
+
+    def counters(self):
+        for row in self.db.connect().execute("SELECT name, labels, value FROM metrics_counters"):
+            yield (row["name"], row["labels"]), row["value"]
+
+    def user_totals(self, since: int):
+        rows = self.db.connect().execute(
+            "SELECT user_id, kind, SUM(value) AS total FROM metrics_user_tokens "
+            "WHERE bucket_start >= ? GROUP BY user_id, kind",
+            (since,),
+        )
+        for row in rows:
+            yield row["user_id"], row["kind"], row["total"]
+
+
+def create_metrics_registry() -> MetricsRegistry:
+    """
+    METRICS_BACKEND selects "sqlite" (shared by workers) or "memory" (per worker);
+    it follows STORY_STORE when unset.
+    """
+    backend = os.getenv("METRICS_BACKEND", os.getenv("STORY_STORE", "sqlite")).lower()
+    store = None
+    if backend == "sqlite":
+        store = SQLiteMetricsStore(os.getenv("METRICS_DB_PATH", os.getenv("STORY_DB_PATH", DEFAULT_DB_PATH)))
+    elif backend != "memory":
+        raise ValueError(f"Unknown METRICS_BACKEND: {backend}")
+    return MetricsRegistry(
+        store,
+        user_window_seconds=int(os.getenv("METRICS_USER_WINDOW_SECONDS", "86400")),
+        user_bucket_seconds=int(os.getenv("METRICS_USER_BUCKET_SECONDS", "300")),
+    )
@@ -0,0 +1,126 @@
+"""
+Per-stage request tracing.
+WHAT: Lightweight spans around request stages, reported as a Server-Timing header
+      and optionally as one structured JSON log line per request.
+WHY: A slow /prompt or /stories call gave no hint whether the time went to mood
+     resolution, template selection, client setup, the upstream call or serialization.
+HOW: ServerTimingMiddleware samples requests at TRACE_SAMPLE_RATE (or when the
+     client sends X-Trace) and puts a Trace in a contextvar. `with span("stage"):`
+     records into it; outside sampled requests a span is just a contextvar lookup.
+"""
+
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+trace_logger = logging.getLogger("storyscribe.trace")
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("storyscribe_trace", default=None)
+
+
+class Trace:
+    """Spans recorded for one sampled request."""
+
+    __slots__ = ("trace_id", "spans", "started")
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.spans: List[Tuple[str, float]] = []
+        self.started = time.perf_counter()
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spans.append((name, seconds))
+
+    def server_timing(self, total_seconds: float) -> str:
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.spans]
+        entries.append(f"total;dur={total_seconds * 1000:.2f}")
+        return ", ".join(entries)
+
+
+class span:
+    """
+    Time a stage of the current request:
+
+        with span("upstream"):
+            ...
+
+    No-op when the request is not sampled.
+    """
+
+    __slots__ = ("name", "trace", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.trace = _current.get()
+
+    def __enter__(self):
+        if self.trace is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.trace is not None:
+            self.trace.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware that samples requests and emits Server-Timing (+ optional JSON trace logs)."""
+
+    def __init__(self, app, sample_rate: float = 0.05, log_json: bool = False):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.log_json = log_json
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        forced = any(name == b"x-trace" for name, _ in scope.get("headers", []))
+        if not forced and random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _current.set(trace)
+        status = {"code": None}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                total = time.perf_counter() - trace.started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing(total).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if self.log_json:
+                trace_logger.info(json.dumps({
+                    "trace_id": trace.trace_id,
+                    "method": scope.get("method"),
+                    "path": scope.get("path"),
+                    "status": status["code"],
+                    "total_ms": round((time.perf_counter() - trace.started) * 1000, 3),
+                    "spans": [{"name": name, "ms": round(seconds * 1000, 3)} for name, seconds in trace.spans],
+                }))
+
+
+def tracing_settings() -> dict:
+    """Middleware options from TRACE_SAMPLE_RATE and TRACE_LOG_JSON."""
+    return {
+        "sample_rate": float(os.getenv("TRACE_SAMPLE_RATE", "0.05")),
+        "log_json": os.getenv("TRACE_LOG_JSON", "false").lower() == "true",
+    }
@@ -0,0 +1,71 @@
+"""
+Bulk import of stories from NDJSON.
+WHAT: Splits a streamed request body into numbered lines and collects the outcome
+      of an import (counts and per-line errors).
+WHY: Users migrating a journal from another tool would otherwise call POST /stories
+     once per entry, paying HTTP overhead and a separate write for each.
+HOW: Lines are cut from the body chunk by chunk as it arrives, so only the current
+     line is buffered; a line longer than max_line_bytes is skipped up to its
+     newline and reported instead of being buffered. The endpoint validates each
+     line and writes valid stories in batches through StoryRepository.add_many.
+"""
+
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional, Tuple
+
+
+async def ndjson_lines(chunks: AsyncIterable[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    Yield (line number, line) for every line of a chunked body, blank ones included.
+    The line is None when it exceeds max_line_bytes (its bytes are dropped).
+    """
+    line_no = 0
+    pending = b""
+    oversized = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                break
+            piece = chunk[start:end]
+            line_no += 1
+            if oversized or len(pending) + len(piece) > max_line_bytes:
+                yield line_no, None
+            else:
+                yield line_no, pending + piece
+            pending, oversized = b"", False
+            start = end + 1
+        if not oversized:
+            rest = chunk[start:]
+            if len(pending) + len(rest) > max_line_bytes:
+                pending, oversized = b"", True
+            else:
+                pending += rest
+    # Last line without a trailing newline
+    if oversized or pending.strip():
+        yield line_no + 1, None if oversized else pending
+
+
+class ImportReport:
+    """Outcome of one import; keeps the first max_errors errors and counts the rest."""
+
+    def __init__(self, max_errors: int = 100):
+        self.max_errors = max_errors
+        self.imported = 0
+        self.failed = 0
+        self.analytics_deferred = 0
+        self.errors: List[Dict] = []
+
+    def error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> Dict:
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errorsTruncated": self.failed > len(self.errors),
+            "analyticsDeferred": self.analytics_deferred,
+        }
@@ -0,0 +1,159 @@
+"""
+Manuscript export of a user's stories.
+WHAT: Renders stories (oldest first) as Markdown, plain text or an EPUB 3 book.
+WHY: The prompting flow builds towards a book (genre, title, chapters), but the
+     only way to get stories out was the all-in-memory GET /stories JSON.
+HOW: Every format is a generator over pages of stories read from the repository
+     with keyset pagination, yielding bytes as each story is rendered, so memory
+     stays flat however many stories a user has. EPUB is a ZIP written through a
+     sink that is drained as it fills; table-of-contents entries are written to a
+     spooled temporary file as each chapter is added, so every link matches the
+     chapter it was written with and no list is kept in memory.
+"""
+
+import html
+import shutil
+import tempfile
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator
+
+# Table-of-contents bytes kept in memory before spilling to a temporary file
+NAV_SPOOL_BYTES = 1024 * 1024
+
+FORMATS = {
+    "markdown": ("text/markdown; charset=utf-8", "md"),
+    "txt": ("text/plain; charset=utf-8", "txt"),
+    "epub": ("application/epub+zip", "epub"),
+}
+
+
+def iter_stories(list_page: Callable, user_id: str, batch_size: int = 50) -> Iterator[Dict]:
+    """Walk a user's stories with keyset pages of batch_size."""
+    after = None
+    while True:
+        page = list_page(user_id, limit=batch_size, after=after)
+        yield from page
+        if len(page) < batch_size:
+            return
+        after = (page[-1]["createdAt"], page[-1]["id"])
+
+
+def written_on(doc: Dict) -> str:
+    return doc["createdAt"][:10]
+
+
+def export_markdown(stories: Iterable[Dict], book_title: str) -> Iterator[bytes]:
+    yield f"# {book_title}\n".encode()
+    for doc in stories:
+        yield f"\n## {doc['title']}\n\n*{written_on(doc)}*\n\n{doc['content'].rstrip()}\n".encode()
+
+
+def export_text(stories: Iterable[Dict], book_title: str) -> Iterator[bytes]:
+    yield f"{book_title}\n{'=' * len(book_title)}\n".encode()
+    for doc in stories:
+        yield f"\n\n{doc['title']}\n{'-' * len(doc['title'])}\n{written_on(doc)}\n\n{doc['content'].rstrip()}\n".encode()
+
+
+class _Sink:
+    """Write-only file object for zipfile; drain() hands over what was written so far."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+
+def _xhtml_head(title: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+        f"<head><title>{html.escape(title)}</title></head>\n"
+    )
+
+
+def _xhtml(title: str, body: str) -> str:
+    return f"{_xhtml_head(title)}<body>\n{body}\n</body>\n</html>\n"
+
+
+def _chapter(doc: Dict) -> str:
+    paragraphs = "\n".join(
+        "<p>" + html.escape(p.strip()).replace("\n", "<br/>") + "</p>"
+        for p in doc["content"].split("\n\n") if p.strip()
+    )
+    return _xhtml(doc["title"], f"<h1>{html.escape(doc['title'])}</h1>\n"
+                                f"<p><em>{written_on(doc)}</em></p>\n{paragraphs}")
+
+
+def export_epub(stories: Iterable[Dict], book_title: str, language: str = "en") -> Iterator[bytes]:
+    """
+    EPUB 3: mimetype first and stored, one XHTML chapter per story, then the
+    navigation document and package file. The only state that grows with the
+    number of stories is zipfile's central directory (one small record per entry).
+    """
+    sink = _Sink()
+    book = zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED)
+    book.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+    book.writestr("META-INF/container.xml", CONTAINER_XML)
+    yield sink.drain()
+
+    count = 0
+    with tempfile.SpooledTemporaryFile(max_size=NAV_SPOOL_BYTES) as toc:
+        for doc in stories:
+            count += 1
+            book.writestr(f"OEBPS/chapter-{count}.xhtml", _chapter(doc))
+            toc.write(f'<li><a href="chapter-{count}.xhtml">{html.escape(doc["title"])}</a></li>\n'.encode())
+            yield sink.drain()
+
+        toc.seek(0)
+        with book.open("OEBPS/nav.xhtml", "w") as nav:
+            nav.write(_xhtml_head(book_title).encode())
+            nav.write(b'<body>\n<nav epub:type="toc" id="toc"><h1>Contents</h1><ol>\n')
+            shutil.copyfileobj(toc, nav)
+            nav.write(b"</ol></nav>\n</body>\n</html>\n")
+    yield sink.drain()
+
+    modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    with book.open("OEBPS/content.opf", "w") as opf:
+        opf.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">\n'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+            f'<dc:identifier id="book-id">urn:uuid:{uuid.uuid4()}</dc:identifier>\n'
+            f"<dc:title>{html.escape(book_title)}</dc:title>\n"
+            f"<dc:language>{html.escape(language)}</dc:language>\n"
+            f'<meta property="dcterms:modified">{modified}</meta>\n'
+            "</metadata>\n<manifest>\n"
+            '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>\n'.encode()
+        )
+        for i in range(1, count + 1):
+            opf.write(f'<item id="c{i}" href="chapter-{i}.xhtml" media-type="application/xhtml+xml"/>\n'.encode())
+            if i % 500 == 0:
+                yield sink.drain()
+        opf.write(b"</manifest>\n<spine>\n")
+        for i in range(1, count + 1):
+            opf.write(f'<itemref idref="c{i}"/>\n'.encode())
+            if i % 500 == 0:
+                yield sink.drain()
+        opf.write(b"</spine>\n</package>\n")
+    book.close()
+    yield sink.drain()
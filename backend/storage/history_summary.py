@@ -0,0 +1,140 @@
+"""
+Per-user history summaries for progressive prompting.
+WHAT: One UserHistorySummary per user (story count, latest story and its completion
+      status, theme/character counts, recent story refs), updated as each new or
+      edited story is analyzed (see ai.story_analytics).
+WHY: ProgressivePromptingSystem used to receive the whole content history and walk
+     it on every call, so picking the next prompt got slower the more a user wrote.
+HOW: Writes fold the new story into the stored summary (read-modify-write inside one
+     IMMEDIATE transaction on SQLite, so concurrent workers never lose an update);
+     prompt generation reads a single row.
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict
+
+from ai.content_safety import StoryMetadata, UserHistorySummary
+from storage.sqlite import DEFAULT_DB_PATH, SQLiteDatabase
+
+
+class HistorySummaryStore(ABC):
+    """Interface every summary store implements."""
+
+    @abstractmethod
+    def get(self, user_id: str) -> UserHistorySummary:
+        """Return the user's summary (an empty one if they have not written yet)."""
+
+    @abstractmethod
+    def apply(self, user_id: str, story: StoryMetadata) -> UserHistorySummary:
+        """Fold a newly written story into the user's summary and return it."""
+
+    @abstractmethod
+    def revise(self, user_id: str, old: StoryMetadata, new: StoryMetadata) -> UserHistorySummary:
+        """Swap an edited story's previous analysis for its new one and return the summary."""
+
+    @abstractmethod
+    def replace(self, summary: UserHistorySummary) -> None:
+        """Overwrite a user's summary (used when rebuilding it from stored metadata)."""
+
+    def close(self) -> None:
+        """Release any held resources."""
+
+
+class InMemoryHistorySummaryStore(HistorySummaryStore):
+    """Process-local summaries. Not shared between workers; meant for tests."""
+
+    def __init__(self):
+        self._summaries: Dict[str, UserHistorySummary] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> UserHistorySummary:
+        with self._lock:
+            summary = self._summaries.get(user_id)
+            return summary.model_copy(deep=True) if summary else UserHistorySummary(user_id=user_id)
+
+    def apply(self, user_id: str, story: StoryMetadata) -> UserHistorySummary:
+        with self._lock:
+            summary = self._summaries.setdefault(user_id, UserHistorySummary(user_id=user_id))
+            summary.apply(story)
+            return summary.model_copy(deep=True)
+
+    def revise(self, user_id: str, old: StoryMetadata, new: StoryMetadata) -> UserHistorySummary:
+        with self._lock:
+            summary = self._summaries.setdefault(user_id, UserHistorySummary(user_id=user_id))
+            summary.revise(old, new)
+            return summary.model_copy(deep=True)
+
+    def replace(self, summary: UserHistorySummary) -> None:
+        with self._lock:
+            self._summaries[summary.user_id] = summary.model_copy(deep=True)
+
+
+class SQLiteHistorySummaryStore(HistorySummaryStore):
+    """Summaries stored as one JSON row per user, next to the stories table."""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, busy_timeout_ms: int = 5000):
+        self.db = SQLiteDatabase(path, busy_timeout_ms)
+        self.db.connect().execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_history_summaries (
+                user_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL
+            )
+            """
+        )
+
+    @staticmethod
+    def _store(conn, summary: UserHistorySummary) -> None:
+        conn.execute(
+            """
+            INSERT INTO user_history_summaries (user_id, summary) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET summary = excluded.summary
+            """,
+            (summary.user_id, summary.model_dump_json()),
+        )
+
+    @staticmethod
+    def _load(conn, user_id: str) -> UserHistorySummary:
+        row = conn.execute(
+            "SELECT summary FROM user_history_summaries WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return UserHistorySummary(user_id=user_id)
+        return UserHistorySummary.model_validate_json(row["summary"])
+
+    def get(self, user_id: str) -> UserHistorySummary:
+        return self._load(self.db.connect(), user_id)
+
+    def apply(self, user_id: str, story: StoryMetadata) -> UserHistorySummary:
+        with self.db.transaction() as conn:
+            summary = self._load(conn, user_id).apply(story)
+            self._store(conn, summary)
+        return summary
+
+    def revise(self, user_id: str, old: StoryMetadata, new: StoryMetadata) -> UserHistorySummary:
+        with self.db.transaction() as conn:
+            summary = self._load(conn, user_id).revise(old, new)
+            self._store(conn, summary)
+        return summary
+
+    def replace(self, summary: UserHistorySummary) -> None:
+        with self.db.transaction() as conn:
+            self._store(conn, summary)
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def create_history_summary_store() -> HistorySummaryStore:
+    """Follows STORY_STORE / STORY_DB_PATH so summaries live next to the stories they describe."""
+    backend = os.getenv("STORY_STORE", "sqlite").lower()
+    if backend == "memory":
+        return InMemoryHistorySummaryStore()
+    if backend == "sqlite":
+        return SQLiteHistorySummaryStore(
+            path=os.getenv("STORY_DB_PATH", DEFAULT_DB_PATH),
+            busy_timeout_ms=int(os.getenv("STORY_DB_BUSY_TIMEOUT_MS", "5000")),
+        )
+    raise ValueError(f"Unknown STORY_STORE backend: {backend}")
@@ -0,0 +1,73 @@
+"""
+Pre-serialized story JSON for list responses.
+WHAT: An LRU of each story's encoded JSON (full and summary views), keyed by story
+      id and version.
+WHY: GET /stories re-validated every story through StoryOut and re-encoded it on
+     every request, although stories rarely change between page loads.
+HOW: A fragment is reused while the stored version matches, so a write through any
+     worker makes other workers' copies miss instead of going stale; the worker
+     that handled the write also drops its copy straight away. List responses are
+     the fragments joined into a JSON array.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+
+VIEWS = ("full", "summary")
+
+
+def encode_json(value) -> bytes:
+    """Same bytes as FastAPI's JSONResponse renders."""
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def join_fragments(fragments: Iterable[bytes]) -> bytes:
+    return b"[" + b",".join(fragments) + b"]"
+
+
+class StoryJSONCache:
+    """Thread-safe LRU of (story_id, view) -> (version, encoded JSON)."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def fragment(self, doc: Dict, view: str, render: Callable[[Dict], Dict]) -> bytes:
+        """Encoded render(doc), reused while doc's version is unchanged."""
+        key = (doc["id"], view)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == doc["version"]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        encoded = encode_json(render(doc))
+        with self._lock:
+            self._entries[key] = (doc["version"], encoded)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return encoded
+
+    def invalidate(self, story_id: str) -> None:
+        with self._lock:
+            for view in VIEWS:
+                self._entries.pop((story_id, view), None)
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses}
+
+
+def create_story_json_cache() -> Optional[StoryJSONCache]:
+    """STORY_JSON_CACHE_MAX_ENTRIES=0 disables the cache."""
+    max_entries = int(os.getenv("STORY_JSON_CACHE_MAX_ENTRIES", "10000"))
+    return StoryJSONCache(max_entries) if max_entries > 0 else None
@@ -0,0 +1,742 @@
+"""
+Story repositories for StoryScribe.
+WHAT: Pluggable storage behind the /stories endpoints.
+WHY: gunicorn runs several workers; a per-process dict hides stories written
+     through one worker from the others and loses everything on restart.
+HOW: SQLite in WAL mode (shared by every worker on the host) is the default;
+     the in-memory repository stays available for tests and quick demos.
+     Swap in a Cosmos implementation later by subclassing StoryRepository.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ai.content_safety import StoryMetadata
+from storage.revisions import (
+    RevisionPolicy, TextEdit, apply_text_edits, check_edits, create_revision_policy, encode_delta, rebuild,
+)
+from storage.search import (
+    CONTENT_WEIGHT, TAGS_WEIGHT, TITLE_WEIGHT, PostingsIndex, fts_match_expression, owner_token,
+)
+from storage.sqlite import DEFAULT_DB_PATH, SQLiteDatabase
+
+# (createdAt, id) of the last story on the previous page
+PageKey = Tuple[str, str]
+
+
+class VersionConflict(Exception):
+    """The story changed since the version the client edited (optimistic concurrency)."""
+
+    def __init__(self, current_version: int):
+        super().__init__(f"Story is at version {current_version}")
+        self.current_version = current_version
+
+
+class StoryRepository(ABC):
+    """Interface every story store implements. Documents are plain dicts shaped like StoryOut."""
+
+    @abstractmethod
+    def add(self, doc: Dict) -> Dict:
+        """Persist a new story document and return it."""
+
+    @abstractmethod
+    def add_many(self, docs: List[Dict]) -> List[Dict]:
+        """
+        Persist several new stories in one write (bulk import) and return them.
+        Each user's collection version is bumped once for the whole batch.
+        """
+
+    @abstractmethod
+    def get(self, user_id: str, story_id: str) -> Optional[Dict]:
+        """Return one of the user's stories, or None if it does not exist."""
+
+    @abstractmethod
+    def list_page(self, user_id: str, limit: Optional[int] = None, after: Optional[PageKey] = None) -> List[Dict]:
+        """
+        Return the user's stories ordered by (createdAt, id), oldest first.
+
+        Args:
+            user_id: Owner of the stories
+            limit: Maximum number of stories to return (None for all)
+            after: Only return stories sorted strictly after this (createdAt, id) key
+        """
+
+    @abstractmethod
+    def apply_edits(self, user_id: str, story_id: str, edits: List[TextEdit], updated_at: str,
+                    title: Optional[str] = None, expected_version: Optional[int] = None) -> Optional[Dict]:
+        """
+        Apply text edits (in order) and an optional new title to a story, bump its
+        version and return the updated document, or None if it does not exist.
+
+        Raises:
+            VersionConflict: expected_version is set and the story is at another version
+            ValueError: an edit falls outside the text
+        """
+
+    @abstractmethod
+    def collection_version(self, user_id: str) -> int:
+        """Counter bumped by every write to the user's stories (0 before the first)."""
+
+    @abstractmethod
+    def list_revisions(self, user_id: str, story_id: str) -> Optional[List[Dict]]:
+        """
+        Retained revisions of a story, newest first, as {version, updatedAt, title,
+        length, snapshot}; None if the story does not exist.
+        """
+
+    @abstractmethod
+    def get_revision(self, user_id: str, story_id: str, version: int) -> Optional[Dict]:
+        """Rebuild one retained revision as {version, updatedAt, title, content}."""
+
+    @abstractmethod
+    def search(self, user_id: str, query: str, limit: int = 20, offset: int = 0,
+               any_terms: bool = False) -> List[Tuple[Dict, float]]:
+        """
+        Rank the user's stories against a free-text query (best first).
+
+        Args:
+            user_id: Owner of the stories
+            query: Free text; every term must match unless any_terms is set
+            limit: Maximum number of results
+            offset: Number of ranked results to skip
+            any_terms: Match stories containing any of the terms instead of all of them
+        Returns:
+            (story document, relevance score) pairs
+        """
+
+    @abstractmethod
+    def set_tags(self, user_id: str, story_id: str, tags: Iterable[str]) -> None:
+        """Replace the searchable themes/characters of a story."""
+
+    @abstractmethod
+    def reindex(self, doc: Dict) -> None:
+        """Refresh the searchable title/content of an edited story (edits don't do it themselves)."""
+
+    @abstractmethod
+    def save_metadata(self, user_id: str, metadata: StoryMetadata,
+                      source_updated_at: str) -> Optional[StoryMetadata]:
+        """
+        Store the analytics for one story, computed from the version saved at
+        source_updated_at. Returns the metadata it replaced (None on first analysis).
+        """
+
+    @abstractmethod
+    def get_metadata(self, user_id: str, story_id: str) -> Optional[StoryMetadata]:
+        """Return the stored analytics for one of the user's stories, if analyzed."""
+
+    @abstractmethod
+    def list_metadata(self, user_id: str) -> List[StoryMetadata]:
+        """Return analytics for all of the user's analyzed stories, oldest story first."""
+
+    @abstractmethod
+    def stories_needing_analysis(self, limit: int, after: Optional[str] = None,
+                                 include_current: bool = False) -> List[Dict]:
+        """
+        Return stories (any user) ordered by id whose metadata is missing or older
+        than the story; with include_current, every story. after is an id to resume from.
+        """
+
+    def list_for_user(self, user_id: str) -> List[Dict]:
+        """Return all of the user's stories ordered by createdAt (oldest first)."""
+        return self.list_page(user_id)
+
+    def close(self) -> None:
+        """Release any held resources."""
+
+
+class InMemoryStoryRepository(StoryRepository):
+    """Process-local store. Not shared between workers; meant for tests."""
+
+    def __init__(self, revisions: Optional[RevisionPolicy] = None):
+        self._stories: Dict[str, List[Dict]] = {}
+        self._index = PostingsIndex()
+        self.revisions = revisions or RevisionPolicy()
+        self._collection_versions: Dict[str, int] = {}
+        # story_id -> revision rows, oldest first ({..., "snapshot": str | None, "delta": edits | None})
+        self._revisions: Dict[str, List[Dict]] = {}
+        # story_id -> (owner, metadata, updatedAt of the analyzed version)
+        self._metadata: Dict[str, Tuple[str, StoryMetadata, str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, doc: Dict) -> Dict:
+        doc.setdefault("version", 1)
+        with self._lock:
+            self._stories.setdefault(doc["userId"], []).append(dict(doc))
+            self._index.add(doc["userId"], doc["id"], doc["title"], doc["content"])
+            self._record_revision(doc, [])
+            self._bump_collection(doc["userId"])
+        return doc
+
+    def add_many(self, docs: List[Dict]) -> List[Dict]:
+        with self._lock:
+            for doc in docs:
+                doc.setdefault("version", 1)
+                self._stories.setdefault(doc["userId"], []).append(dict(doc))
+                self._index.add(doc["userId"], doc["id"], doc["title"], doc["content"])
+                self._record_revision(doc, [])
+            for user_id in {doc["userId"] for doc in docs}:
+                self._bump_collection(user_id)
+        return docs
+
+    def _bump_collection(self, user_id: str) -> None:
+        self._collection_versions[user_id] = self._collection_versions.get(user_id, 0) + 1
+
+    def collection_version(self, user_id: str) -> int:
+        with self._lock:
+            return self._collection_versions.get(user_id, 0)
+
+    def _record_revision(self, doc: Dict, edits: List[TextEdit]) -> None:
+        rows = self._revisions.setdefault(doc["id"], [])
+        chain = []
+        for row in reversed(rows):
+            if row["snapshot"] is not None:
+                break
+            chain.append(row)
+        else:
+            chain = None  # no snapshot to build on
+        size = len(encode_delta(edits))
+        snapshot = self.revisions.should_snapshot(
+            -1 if chain is None else len(chain),
+            size + sum(row["size"] for row in chain or []),
+            len(doc["content"]),
+        )
+        rows.append({
+            "version": doc["version"], "updatedAt": doc["updatedAt"], "title": doc["title"],
+            "length": len(doc["content"]), "size": len(doc["content"]) if snapshot else size,
+            "snapshot": doc["content"] if snapshot else None, "delta": None if snapshot else list(edits),
+        })
+        floor = self.revisions.retention_floor(doc["version"])
+        keep_from = max((i for i, row in enumerate(rows) if row["snapshot"] is not None and row["version"] <= floor),
+                        default=0)
+        del rows[:keep_from]
+
+    def get(self, user_id: str, story_id: str) -> Optional[Dict]:
+        with self._lock:
+            for doc in self._stories.get(user_id, []):
+                if doc["id"] == story_id:
+                    return dict(doc)
+        return None
+
+    def list_page(self, user_id: str, limit: Optional[int] = None, after: Optional[PageKey] = None) -> List[Dict]:
+        with self._lock:
+            docs = sorted(self._stories.get(user_id, []), key=lambda d: (d["createdAt"], d["id"]))
+        if after is not None:
+            docs = [d for d in docs if (d["createdAt"], d["id"]) > tuple(after)]
+        if limit is not None:
+            docs = docs[:limit]
+        return [dict(doc) for doc in docs]
+
+    def apply_edits(self, user_id: str, story_id: str, edits: List[TextEdit], updated_at: str,
+                    title: Optional[str] = None, expected_version: Optional[int] = None) -> Optional[Dict]:
+        with self._lock:
+            doc = next((d for d in self._stories.get(user_id, []) if d["id"] == story_id), None)
+            if doc is None:
+                return None
+            if expected_version is not None and doc["version"] != expected_version:
+                raise VersionConflict(doc["version"])
+            check_edits(len(doc["content"]), edits)
+            doc["content"] = apply_text_edits(doc["content"], edits)
+            if title is not None:
+                doc["title"] = title
+            doc["updatedAt"] = updated_at
+            doc["version"] += 1
+            self._record_revision(doc, edits)
+            self._bump_collection(user_id)
+            return dict(doc)
+
+    def list_revisions(self, user_id: str, story_id: str) -> Optional[List[Dict]]:
+        if self.get(user_id, story_id) is None:
+            return None
+        with self._lock:
+            return [
+                {"version": row["version"], "updatedAt": row["updatedAt"], "title": row["title"],
+                 "length": row["length"], "snapshot": row["snapshot"] is not None}
+                for row in reversed(self._revisions.get(story_id, []))
+            ]
+
+    def get_revision(self, user_id: str, story_id: str, version: int) -> Optional[Dict]:
+        if self.get(user_id, story_id) is None:
+            return None
+        with self._lock:
+            rows = [row for row in self._revisions.get(story_id, []) if row["version"] <= version]
+        if not rows or rows[-1]["version"] != version:
+            return None
+        base = max(i for i, row in enumerate(rows) if row["snapshot"] is not None)
+        target = rows[-1]
+        return {
+            "version": version, "updatedAt": target["updatedAt"], "title": target["title"],
+            "content": rebuild(rows[base]["snapshot"], (row["delta"] for row in rows[base + 1:])),
+        }
+
+    def search(self, user_id: str, query: str, limit: int = 20, offset: int = 0,
+               any_terms: bool = False) -> List[Tuple[Dict, float]]:
+        with self._lock:
+            ranked = self._index.search(user_id, query, any_terms)[offset:offset + limit]
+            by_id = {doc["id"]: doc for doc in self._stories.get(user_id, [])}
+            return [(dict(by_id[story_id]), score) for story_id, score in ranked]
+
+    def set_tags(self, user_id: str, story_id: str, tags: Iterable[str]) -> None:
+        with self._lock:
+            self._index.set_tags(user_id, story_id, tags)
+
+    def reindex(self, doc: Dict) -> None:
+        with self._lock:
+            self._index.update_text(doc["userId"], doc["id"], doc["title"], doc["content"])
+
+    def save_metadata(self, user_id: str, metadata: StoryMetadata,
+                      source_updated_at: str) -> Optional[StoryMetadata]:
+        with self._lock:
+            previous = self._metadata.get(metadata.story_id)
+            self._metadata[metadata.story_id] = (user_id, metadata.model_copy(deep=True), source_updated_at)
+            return previous[1] if previous else None
+
+    def get_metadata(self, user_id: str, story_id: str) -> Optional[StoryMetadata]:
+        with self._lock:
+            entry = self._metadata.get(story_id)
+            return entry[1].model_copy(deep=True) if entry and entry[0] == user_id else None
+
+    def list_metadata(self, user_id: str) -> List[StoryMetadata]:
+        with self._lock:
+            docs = sorted(self._stories.get(user_id, []), key=lambda d: (d["createdAt"], d["id"]))
+            return [self._metadata[d["id"]][1].model_copy(deep=True) for d in docs if d["id"] in self._metadata]
+
+    def stories_needing_analysis(self, limit: int, after: Optional[str] = None,
+                                 include_current: bool = False) -> List[Dict]:
+        with self._lock:
+            docs = sorted((d for docs in self._stories.values() for d in docs), key=lambda d: d["id"])
+            pending = [
+                dict(d) for d in docs
+                if (after is None or d["id"] > after)
+                and (include_current or d["id"] not in self._metadata
+                     or self._metadata[d["id"]][2] != d["updatedAt"])
+            ]
+        return pending[:limit]
+
+
+class SQLiteStoryRepository(StoryRepository):
+    """
+    Embedded store shared by all workers through one database file.
+    See storage.sqlite for the WAL / busy_timeout connection setup.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, busy_timeout_ms: int = 5000,
+                 revisions: Optional[RevisionPolicy] = None):
+        self.db = SQLiteDatabase(path, busy_timeout_ms)
+        self.revisions = revisions or RevisionPolicy()
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        conn = self.db.connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stories (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                title TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1,
+                fts_rowid INTEGER
+            )
+            """
+        )
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(stories)")}
+        if "version" not in columns:
+            # Databases created before PATCH existed; ignore a concurrent worker winning the race
+            try:
+                conn.execute("ALTER TABLE stories ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            except sqlite3.OperationalError:
+                pass
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stories_user_created ON stories (user_id, created_at, id)"
+        )
+        # Per-user write counter behind the GET /stories ETag
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS story_collections (
+                user_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+            """
+        )
+        # Earlier versions: a full snapshot or the JSON edits from the previous version
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS story_revisions (
+                story_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                updated_at TEXT NOT NULL,
+                title TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                snapshot TEXT,
+                delta TEXT,
+                PRIMARY KEY (story_id, version)
+            )
+            """
+        )
+        # Analytics computed after the write (see ai.story_analytics); lists are JSON
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS story_metadata (
+                story_id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                word_count INTEGER NOT NULL,
+                content_preview TEXT NOT NULL,
+                completion_status REAL NOT NULL,
+                themes TEXT NOT NULL,
+                characters TEXT NOT NULL,
+                sentiment TEXT,
+                source_updated_at TEXT NOT NULL
+            )
+            """
+        )
+        # Full-text index over title/content/tags; owner is a per-user token so
+        # MATCH narrows to one user's postings before ranking. stories.fts_rowid
+        # points at a story's index row, so tag/text updates don't scan the
+        # owner's postings. Databases created before the index or the pointer
+        # existed are backfilled once (checked under the write lock so concurrent
+        # workers don't both do it).
+        with self.db.transaction() as tx:
+            has_fts = tx.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stories_fts'"
+            ).fetchone()
+            has_pointer = "fts_rowid" in {row["name"] for row in tx.execute("PRAGMA table_info(stories)")}
+            if not has_pointer:
+                tx.execute("ALTER TABLE stories ADD COLUMN fts_rowid INTEGER")
+                if has_fts:
+                    tx.executemany(
+                        "UPDATE stories SET fts_rowid = ? WHERE id = ?",
+                        tx.execute("SELECT rowid, story_id FROM stories_fts").fetchall(),
+                    )
+            if not has_fts:
+                tx.execute(
+                    "CREATE VIRTUAL TABLE stories_fts "
+                    "USING fts5(story_id UNINDEXED, owner, title, content, tags, "
+                    "tokenize = 'porter unicode61', prefix = '2 3')"
+                )
+                for row in tx.execute("SELECT id, user_id, title, content FROM stories").fetchall():
+                    self._index_story(tx, row["id"], row["user_id"], row["title"], row["content"])
+
+    @staticmethod
+    def _row_to_doc(row: sqlite3.Row) -> Dict:
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "content": row["content"],
+            "userId": row["user_id"],
+            "createdAt": row["created_at"],
+            "updatedAt": row["updated_at"],
+            "version": row["version"],
+        }
+
+    def add(self, doc: Dict) -> Dict:
+        doc.setdefault("version", 1)
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT INTO stories (id, user_id, title, content, created_at, updated_at, version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (doc["id"], doc["userId"], doc["title"], doc["content"], doc["createdAt"], doc["updatedAt"],
+                 doc["version"]),
+            )
+            self._index_story(conn, doc["id"], doc["userId"], doc["title"], doc["content"])
+            self._record_revision(conn, doc, [])
+            self._bump_collection(conn, doc["userId"])
+        return doc
+
+    def add_many(self, docs: List[Dict]) -> List[Dict]:
+        for doc in docs:
+            doc.setdefault("version", 1)
+        with self.db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO stories (id, user_id, title, content, created_at, updated_at, version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(d["id"], d["userId"], d["title"], d["content"], d["createdAt"], d["updatedAt"], d["version"])
+                 for d in docs],
+            )
+            for d in docs:
+                self._index_story(conn, d["id"], d["userId"], d["title"], d["content"])
+            # A story's first revision is always a snapshot, so no chain lookups are needed
+            conn.executemany(
+                "INSERT INTO story_revisions (story_id, version, updated_at, title, length, snapshot, delta) "
+                "VALUES (?, ?, ?, ?, ?, ?, NULL)",
+                [(d["id"], d["version"], d["updatedAt"], d["title"], len(d["content"]), d["content"]) for d in docs],
+            )
+            for user_id in {doc["userId"] for doc in docs}:
+                self._bump_collection(conn, user_id)
+        return docs
+
+    @staticmethod
+    def _index_story(conn: sqlite3.Connection, story_id: str, user_id: str, title: str, content: str) -> None:
+        """Add a stored story to the full-text index and remember its index row."""
+        fts_rowid = conn.execute(
+            "INSERT INTO stories_fts (story_id, owner, title, content, tags) VALUES (?, ?, ?, ?, '')",
+            (story_id, owner_token(user_id), title, content),
+        ).lastrowid
+        conn.execute("UPDATE stories SET fts_rowid = ? WHERE id = ?", (fts_rowid, story_id))
+
+    @staticmethod
+    def _bump_collection(conn: sqlite3.Connection, user_id: str) -> None:
+        conn.execute(
+            "INSERT INTO story_collections (user_id, version) VALUES (?, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET version = version + 1",
+            (user_id,),
+        )
+
+    def collection_version(self, user_id: str) -> int:
+        row = self.db.connect().execute(
+            "SELECT version FROM story_collections WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row["version"] if row else 0
+
+    def _record_revision(self, conn: sqlite3.Connection, doc: Dict, edits: List[TextEdit]) -> None:
+        """Append the revision for doc's version inside the caller's write transaction."""
+        story_id, version = doc["id"], doc["version"]
+        base = conn.execute(
+            "SELECT max(version) AS version FROM story_revisions WHERE story_id = ? AND snapshot IS NOT NULL",
+            (story_id,),
+        ).fetchone()["version"]
+        chain_length, chain_bytes = -1, 0
+        if base is not None:
+            chain = conn.execute(
+                "SELECT count(*) AS n, coalesce(sum(length(delta)), 0) AS bytes "
+                "FROM story_revisions WHERE story_id = ? AND version > ?",
+                (story_id, base),
+            ).fetchone()
+            chain_length, chain_bytes = chain["n"], chain["bytes"]
+        delta = encode_delta(edits)
+        snapshot = self.revisions.should_snapshot(chain_length, chain_bytes + len(delta), len(doc["content"]))
+        conn.execute(
+            "INSERT INTO story_revisions (story_id, version, updated_at, title, length, snapshot, delta) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (story_id, version, doc["updatedAt"], doc["title"], len(doc["content"]),
+             doc["content"] if snapshot else None, None if snapshot else delta),
+        )
+        # Drop whole snapshot groups that end before the retention floor
+        conn.execute(
+            """
+            DELETE FROM story_revisions WHERE story_id = :id AND version < (
+                SELECT max(version) FROM story_revisions
+                WHERE story_id = :id AND snapshot IS NOT NULL AND version <= :floor
+            )
+            """,
+            {"id": story_id, "floor": self.revisions.retention_floor(version)},
+        )
+
+    def get(self, user_id: str, story_id: str) -> Optional[Dict]:
+        row = self.db.connect().execute(
+            "SELECT * FROM stories WHERE id = ? AND user_id = ?",
+            (story_id, user_id),
+        ).fetchone()
+        return self._row_to_doc(row) if row else None
+
+    def list_page(self, user_id: str, limit: Optional[int] = None, after: Optional[PageKey] = None) -> List[Dict]:
+        # Keyset pagination: the (user_id, created_at, id) index serves every page
+        # with a range scan, so deep pages cost the same as the first one.
+        sql = "SELECT * FROM stories WHERE user_id = ?"
+        params: list = [user_id]
+        if after is not None:
+            sql += " AND (created_at, id) > (?, ?)"
+            params.extend(after)
+        sql += " ORDER BY created_at, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self.db.connect().execute(sql, params).fetchall()
+        return [self._row_to_doc(row) for row in rows]
+
+    def apply_edits(self, user_id: str, story_id: str, edits: List[TextEdit], updated_at: str,
+                    title: Optional[str] = None, expected_version: Optional[int] = None) -> Optional[Dict]:
+        # Edits run inside SQLite (concatenation / substr splices), so an autosave
+        # never ships the unchanged text through Python; the search index is
+        # refreshed later by the analytics workers (see reindex).
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                "SELECT version, length(content) AS length FROM stories WHERE id = ? AND user_id = ?",
+                (story_id, user_id),
+            ).fetchone()
+            if row is None:
+                return None
+            if expected_version is not None and row["version"] != expected_version:
+                raise VersionConflict(row["version"])
+            check_edits(row["length"], edits)
+            for edit in edits:
+                if edit.get("offset") is None:
+                    conn.execute("UPDATE stories SET content = content || ? WHERE id = ?", (edit["text"], story_id))
+                else:
+                    conn.execute(
+                        "UPDATE stories SET content = substr(content, 1, :offset) || :text "
+                        "|| substr(content, :offset + :delete + 1) WHERE id = :id",
+                        {"offset": edit["offset"], "delete": edit.get("delete", 0), "text": edit["text"],
+                         "id": story_id},
+                    )
+            row = conn.execute(
+                "UPDATE stories SET title = coalesce(?, title), updated_at = ?, version = version + 1 "
+                "WHERE id = ? RETURNING *",
+                (title, updated_at, story_id),
+            ).fetchone()
+            doc = self._row_to_doc(row)
+            self._record_revision(conn, doc, edits)
+            self._bump_collection(conn, user_id)
+        return doc
+
+    def list_revisions(self, user_id: str, story_id: str) -> Optional[List[Dict]]:
+        if self.get(user_id, story_id) is None:
+            return None
+        rows = self.db.connect().execute(
+            "SELECT version, updated_at, title, length, snapshot IS NOT NULL AS is_snapshot "
+            "FROM story_revisions WHERE story_id = ? ORDER BY version DESC",
+            (story_id,),
+        ).fetchall()
+        return [
+            {"version": r["version"], "updatedAt": r["updated_at"], "title": r["title"],
+             "length": r["length"], "snapshot": bool(r["is_snapshot"])}
+            for r in rows
+        ]
+
+    def get_revision(self, user_id: str, story_id: str, version: int) -> Optional[Dict]:
+        if self.get(user_id, story_id) is None:
+            return None
+        # The nearest snapshot at or before the version, then the deltas up to it
+        rows = self.db.connect().execute(
+            """
+            SELECT version, updated_at, title, snapshot, delta FROM story_revisions
+            WHERE story_id = :id AND version <= :version AND version >= (
+                SELECT max(version) FROM story_revisions
+                WHERE story_id = :id AND snapshot IS NOT NULL AND version <= :version
+            )
+            ORDER BY version
+            """,
+            {"id": story_id, "version": version},
+        ).fetchall()
+        if not rows or rows[-1]["version"] != version:
+            return None
+        target = rows[-1]
+        return {
+            "version": version, "updatedAt": target["updated_at"], "title": target["title"],
+            "content": rebuild(rows[0]["snapshot"], (json.loads(row["delta"]) for row in rows[1:])),
+        }
+
+    def search(self, user_id: str, query: str, limit: int = 20, offset: int = 0,
+               any_terms: bool = False) -> List[Tuple[Dict, float]]:
+        match = fts_match_expression(user_id, query, any_terms)
+        if match is None:
+            return []
+        rows = self.db.connect().execute(
+            f"""
+            SELECT s.*, bm25(stories_fts, 0, 0, {TITLE_WEIGHT}, {CONTENT_WEIGHT}, {TAGS_WEIGHT}) AS rank
+            FROM stories_fts JOIN stories s ON s.id = stories_fts.story_id
+            WHERE stories_fts MATCH ? AND s.user_id = ?
+            ORDER BY rank, s.id
+            LIMIT ? OFFSET ?
+            """,
+            (match, user_id, limit, offset),
+        ).fetchall()
+        # bm25() is lower-is-better; flip it so scores read like the in-memory index
+        return [(self._row_to_doc(row), -row["rank"]) for row in rows]
+
+    def set_tags(self, user_id: str, story_id: str, tags: Iterable[str]) -> None:
+        with self.db.transaction() as conn:
+            conn.execute(
+                "UPDATE stories_fts SET tags = ? "
+                "WHERE rowid = (SELECT fts_rowid FROM stories WHERE id = ? AND user_id = ?)",
+                (" ".join(tags), story_id, user_id),
+            )
+
+    def reindex(self, doc: Dict) -> None:
+        with self.db.transaction() as conn:
+            conn.execute(
+                "UPDATE stories_fts SET title = ?, content = ? "
+                "WHERE rowid = (SELECT fts_rowid FROM stories WHERE id = ? AND user_id = ?)",
+                (doc["title"], doc["content"], doc["id"], doc["userId"]),
+            )
+
+    def save_metadata(self, user_id: str, metadata: StoryMetadata,
+                      source_updated_at: str) -> Optional[StoryMetadata]:
+        with self.db.transaction() as conn:
+            previous = conn.execute(
+                self._METADATA_SELECT + " WHERE m.story_id = ?", (metadata.story_id,)
+            ).fetchone()
+            conn.execute(
+                """
+                INSERT INTO story_metadata (story_id, user_id, word_count, content_preview,
+                    completion_status, themes, characters, sentiment, source_updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (story_id) DO UPDATE SET
+                    word_count = excluded.word_count,
+                    content_preview = excluded.content_preview,
+                    completion_status = excluded.completion_status,
+                    themes = excluded.themes,
+                    characters = excluded.characters,
+                    sentiment = excluded.sentiment,
+                    source_updated_at = excluded.source_updated_at
+                """,
+                (metadata.story_id, user_id, metadata.word_count, metadata.content_preview,
+                 metadata.completion_status, json.dumps(metadata.themes or []),
+                 json.dumps(metadata.characters or []), metadata.sentiment, source_updated_at),
+            )
+        return self._row_to_metadata(previous) if previous else None
+
+    @staticmethod
+    def _row_to_metadata(row: sqlite3.Row) -> StoryMetadata:
+        return StoryMetadata(
+            story_id=row["id"],
+            title=row["title"],
+            content_preview=row["content_preview"],
+            created_at=row["created_at"],
+            word_count=row["word_count"],
+            completion_status=row["completion_status"],
+            themes=json.loads(row["themes"]),
+            characters=json.loads(row["characters"]),
+            sentiment=row["sentiment"],
+        )
+
+    _METADATA_SELECT = """
+        SELECT s.id, s.title, s.created_at, m.word_count, m.content_preview,
+               m.completion_status, m.themes, m.characters, m.sentiment
+        FROM story_metadata m JOIN stories s ON s.id = m.story_id
+    """
+
+    def get_metadata(self, user_id: str, story_id: str) -> Optional[StoryMetadata]:
+        row = self.db.connect().execute(
+            self._METADATA_SELECT + " WHERE s.id = ? AND s.user_id = ?", (story_id, user_id)
+        ).fetchone()
+        return self._row_to_metadata(row) if row else None
+
+    def list_metadata(self, user_id: str) -> List[StoryMetadata]:
+        rows = self.db.connect().execute(
+            self._METADATA_SELECT + " WHERE s.user_id = ? ORDER BY s.created_at, s.id", (user_id,)
+        ).fetchall()
+        return [self._row_to_metadata(row) for row in rows]
+
+    def stories_needing_analysis(self, limit: int, after: Optional[str] = None,
+                                 include_current: bool = False) -> List[Dict]:
+        sql = "SELECT s.* FROM stories s LEFT JOIN story_metadata m ON m.story_id = s.id WHERE s.id > ?"
+        if not include_current:
+            sql += " AND (m.story_id IS NULL OR m.source_updated_at != s.updated_at)"
+        rows = self.db.connect().execute(sql + " ORDER BY s.id LIMIT ?", (after or "", limit)).fetchall()
+        return [self._row_to_doc(row) for row in rows]
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def create_story_repository() -> StoryRepository:
+    """
+    Build the repository selected by STORY_STORE ("sqlite" by default, or "memory").
+    STORY_DB_PATH overrides where the SQLite file lives.
+    """
+    backend = os.getenv("STORY_STORE", "sqlite").lower()
+    if backend == "memory":
+        return InMemoryStoryRepository(revisions=create_revision_policy())
+    if backend == "sqlite":
+        return SQLiteStoryRepository(
+            path=os.getenv("STORY_DB_PATH", DEFAULT_DB_PATH),
+            busy_timeout_ms=int(os.getenv("STORY_DB_BUSY_TIMEOUT_MS", "5000")),
+            revisions=create_revision_policy(),
+        )
+    raise ValueError(f"Unknown STORY_STORE backend: {backend}")
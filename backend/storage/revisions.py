@@ -0,0 +1,93 @@
+"""
+Story revisions: text edits, delta chains and snapshots.
+WHAT: The edit operations PATCH /stories applies, and the policy the repositories
+      use to keep a bounded log of earlier versions of each story.
+WHY: Writers want to go back to earlier drafts, but keeping a full copy of the
+     content for every autosave multiplies storage by the number of saves.
+HOW: Each revision stores either a full snapshot or the edits that turned the
+     previous version into it (exactly what the client sent). A new snapshot is
+     taken every snapshot_every revisions, or sooner once the deltas since the
+     last one outweigh snapshot_ratio of the text, so rebuilding any version
+     replays at most one short chain. Retention drops whole snapshot groups, so
+     every kept revision can still be rebuilt.
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List
+
+# Text edit: {"offset": int or None (append), "delete": int, "text": str}.
+# Offsets count Unicode code points, which is what SQLite's substr()/length() use.
+TextEdit = Dict
+
+
+def check_edits(length: int, edits: List[TextEdit]) -> int:
+    """
+    Validate edits applied in order to content of the given length and return the
+    final length. Raises ValueError for an offset/delete range outside the text.
+    """
+    for edit in edits:
+        offset, delete = edit.get("offset"), edit.get("delete", 0)
+        if offset is None:
+            if delete:
+                raise ValueError("append cannot delete")
+        elif offset < 0 or delete < 0 or offset + delete > length:
+            raise ValueError(f"Edit range {offset}+{delete} is outside the story (length {length})")
+        length += len(edit["text"]) - delete
+    return length
+
+
+def apply_text_edits(content: str, edits: List[TextEdit]) -> str:
+    for edit in edits:
+        offset = edit.get("offset")
+        if offset is None:
+            content += edit["text"]
+        else:
+            content = content[:offset] + edit["text"] + content[offset + edit.get("delete", 0):]
+    return content
+
+
+def encode_delta(edits: List[TextEdit]) -> str:
+    """Stored form of a delta; ASCII-only, so its length is its size in bytes."""
+    return json.dumps(edits, separators=(",", ":"))
+
+
+def rebuild(snapshot: str, deltas: Iterable[List[TextEdit]]) -> str:
+    """Content of the last revision in a chain, from the snapshot that starts it."""
+    content = snapshot
+    for edits in deltas:
+        content = apply_text_edits(content, edits)
+    return content
+
+
+class RevisionPolicy:
+    """When to snapshot instead of storing a delta, and how many revisions to keep."""
+
+    def __init__(self, snapshot_every: int = 20, snapshot_ratio: float = 0.5, max_revisions: int = 200):
+        self.snapshot_every = snapshot_every
+        self.snapshot_ratio = snapshot_ratio
+        self.max_revisions = max_revisions
+
+    def should_snapshot(self, chain_length: int, chain_bytes: int, content_length: int) -> bool:
+        """
+        Args:
+            chain_length: Deltas stored since the last snapshot (-1 if there is none)
+            chain_bytes: Their total encoded size, including the delta being added
+            content_length: Length of the new version
+        """
+        if chain_length < 0 or chain_length + 1 >= self.snapshot_every:
+            return True
+        return chain_bytes > self.snapshot_ratio * max(content_length, 1)
+
+    def retention_floor(self, version: int) -> int:
+        """Oldest version that must stay rebuildable once version is written."""
+        return max(1, version - self.max_revisions + 1)
+
+
+def create_revision_policy() -> RevisionPolicy:
+    """Build from STORY_REVISION_* settings."""
+    return RevisionPolicy(
+        snapshot_every=int(os.getenv("STORY_REVISION_SNAPSHOT_EVERY", "20")),
+        snapshot_ratio=float(os.getenv("STORY_REVISION_SNAPSHOT_RATIO", "0.5")),
+        max_revisions=int(os.getenv("STORY_REVISIONS_MAX", "200")),
+    )
@@ -0,0 +1,136 @@
+"""
+Story search helpers.
+WHAT: Query tokenization shared by both repositories, the FTS5 MATCH expression used
+      by SQLiteStoryRepository and an in-process postings index for the in-memory one.
+WHY: Users had no way to find old stories, and prompt builders picked a "related"
+     story at random.
+HOW: Title, content and tags (themes/characters) are indexed per user and ranked with
+     BM25; title matches weigh most, then tags, then body text. The last query term is
+     treated as a prefix so partially typed words still match.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# BM25 column weights (title, content, tags)
+TITLE_WEIGHT = 4.0
+CONTENT_WEIGHT = 1.0
+TAGS_WEIGHT = 2.0
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def owner_token(user_id: str) -> str:
+    """Single FTS token identifying a user, so MATCH narrows to their stories first."""
+    return "u" + user_id.encode("utf-8").hex()
+
+
+def fts_match_expression(user_id: str, query: str, any_terms: bool = False) -> Optional[str]:
+    """FTS5 MATCH string for query restricted to user_id, or None if the query has no terms."""
+    terms = tokenize(query)
+    if not terms:
+        return None
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    joined = (" OR " if any_terms else " ").join(quoted)
+    return f"owner:{owner_token(user_id)} AND {{title content tags}}: ({joined})"
+
+
+class PostingsIndex:
+    """
+    Per-user inverted index with incremental add/update, used by the in-memory
+    repository. Not thread-safe on its own; callers hold the repository lock.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        # user -> term -> story_id -> weighted term frequency
+        self._postings: Dict[str, Dict[str, Dict[str, float]]] = {}
+        # user -> story_id -> (text terms, tag terms)
+        self._docs: Dict[str, Dict[str, Tuple[Counter, Counter]]] = {}
+        self._lengths: Dict[str, Dict[str, float]] = {}
+
+    def add(self, user_id: str, story_id: str, title: str, content: str, tags: Iterable[str] = ()) -> None:
+        self._index(user_id, story_id, self._text_terms(title, content), self._tag_terms(tags))
+
+    def update_text(self, user_id: str, story_id: str, title: str, content: str) -> None:
+        """Re-index an edited story's title and content, keeping its tags."""
+        doc = self._docs.get(user_id, {}).get(story_id)
+        self._index(user_id, story_id, self._text_terms(title, content), doc[1] if doc else Counter())
+
+    def set_tags(self, user_id: str, story_id: str, tags: Iterable[str]) -> None:
+        doc = self._docs.get(user_id, {}).get(story_id)
+        if doc is not None:
+            self._index(user_id, story_id, doc[0], self._tag_terms(tags))
+
+    @staticmethod
+    def _text_terms(title: str, content: str) -> Counter:
+        terms = Counter()
+        for term in tokenize(title):
+            terms[term] += TITLE_WEIGHT
+        for term in tokenize(content):
+            terms[term] += CONTENT_WEIGHT
+        return terms
+
+    @staticmethod
+    def _tag_terms(tags: Iterable[str]) -> Counter:
+        terms = Counter()
+        for tag in tags:
+            for term in tokenize(tag):
+                terms[term] += TAGS_WEIGHT
+        return terms
+
+    def _index(self, user_id: str, story_id: str, text: Counter, tags: Counter) -> None:
+        postings = self._postings.setdefault(user_id, {})
+        docs = self._docs.setdefault(user_id, {})
+        old = docs.get(story_id)
+        if old is not None:
+            for term in old[0] + old[1]:
+                postings[term].pop(story_id, None)
+        docs[story_id] = (text, tags)
+        combined = text + tags
+        for term, weight in combined.items():
+            postings.setdefault(term, {})[story_id] = weight
+        self._lengths.setdefault(user_id, {})[story_id] = sum(combined.values())
+
+    def search(self, user_id: str, query: str, any_terms: bool = False) -> List[Tuple[str, float]]:
+        """(story_id, score) pairs, best first."""
+        terms = tokenize(query)
+        postings = self._postings.get(user_id)
+        if not terms or not postings:
+            return []
+        lengths = self._lengths[user_id]
+        n_docs = len(lengths)
+        avg_length = sum(lengths.values()) / n_docs
+
+        scores: Dict[str, float] = {}
+        matched: Counter = Counter()
+        for i, term in enumerate(terms):
+            if i == len(terms) - 1:
+                candidates = [t for t in postings if t.startswith(term)]
+            else:
+                candidates = [term] if term in postings else []
+            seen = set()
+            for candidate in candidates:
+                docs = postings[candidate]
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for story_id, tf in docs.items():
+                    norm = tf + self.K1 * (1 - self.B + self.B * lengths[story_id] / avg_length)
+                    scores[story_id] = scores.get(story_id, 0.0) + idf * tf * (self.K1 + 1) / norm
+                    seen.add(story_id)
+            for story_id in seen:
+                matched[story_id] += 1
+
+        if not any_terms:
+            scores = {s: v for s, v in scores.items() if matched[s] == len(terms)}
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
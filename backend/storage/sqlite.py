@@ -0,0 +1,87 @@
+"""
+Shared SQLite plumbing.
+WHAT: Thread-local connections to one database file, tuned for many workers.
+WHY: Every SQLite-backed store (stories, caches, indexes) needs the same
+     WAL/busy_timeout setup; keeping it in one place keeps them consistent.
+HOW: One connection per thread (FastAPI runs sync endpoints on a threadpool),
+     autocommit by default, explicit transactions through `transaction()`.
+     Write transactions from threads of the same process queue on a lock per
+     database file; SQLite's busy handler only polls, so a long writer (bulk
+     import) could otherwise wait out busy_timeout behind a stream of short ones.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "storyscribe.db")
+
+# Absolute database path -> lock held for the duration of a write transaction
+_WRITE_LOCKS: Dict[str, threading.Lock] = {}
+_WRITE_LOCKS_GUARD = threading.Lock()
+
+
+def _write_lock(path: str) -> threading.Lock:
+    with _WRITE_LOCKS_GUARD:
+        return _WRITE_LOCKS.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class SQLiteDatabase:
+    """
+    Per-thread connections to a WAL-mode database file.
+
+    WAL mode lets readers proceed while a writer commits, and busy_timeout
+    bounds how long a writer waits for another process holding the write lock.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = _write_lock(path)
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout_ms / 1000,
+                isolation_level=None,  # autocommit; explicit BEGIN where needed
+                check_same_thread=False,
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE ... COMMIT, rolling back on error."""
+        conn = self.connect()
+        if not self._write_lock.acquire(timeout=self.busy_timeout_ms / 1000):
+            raise sqlite3.OperationalError("database is locked")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            self._write_lock.release()
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
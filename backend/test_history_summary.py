@@ -0,0 +1,132 @@
+"""Per-user history summary and progressive prompting stage tests."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+import main
+from ai.content_safety import ProgressivePromptingSystem, PromptType, StoryMetadata, UserHistorySummary
+from storage.history_summary import InMemoryHistorySummaryStore, SQLiteHistorySummaryStore
+from storage.repository import InMemoryStoryRepository
+
+
+def make_story(i, completion=1.0, themes=(), characters=(), created_at=None):
+    return StoryMetadata(
+        story_id=f"s{i}",
+        title=f"Story {i}",
+        content_preview=f"preview {i}",
+        created_at=created_at or datetime.now(timezone.utc),
+        word_count=10,
+        completion_status=completion,
+        themes=list(themes),
+        characters=list(characters),
+    )
+
+
+def test_incremental_summary_tracks_latest_and_counts():
+    summary = UserHistorySummary(user_id="u")
+    summary.apply(make_story(1, themes=["family", "travel"], characters=["Gran"]))
+    summary.apply(make_story(2, completion=0.4, themes=["family"], characters=["Gran", "Tom"]))
+
+    assert summary.story_count == 2
+    assert summary.latest_story_id == "s2"
+    assert summary.latest_completion_status == 0.4
+    assert summary.theme_counts == {"family": 2, "travel": 1}
+    assert summary.character_counts == {"Gran": 2, "Tom": 1}
+    assert summary.top_themes(1) == ["family"]
+    assert [ref.story_id for ref in summary.recent_stories] == ["s1", "s2"]
+
+
+def test_recent_stories_are_bounded():
+    summary = UserHistorySummary.from_history("u", [make_story(i) for i in range(30)])
+    assert summary.story_count == 30
+    assert len(summary.recent_stories) == UserHistorySummary.RECENT_STORIES_LIMIT
+    assert summary.recent_stories[-1].story_id == "s29"
+
+
+def test_out_of_order_analysis_keeps_latest_by_created_at():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    stories = [make_story(i, completion=i / 10, created_at=start + timedelta(days=i)) for i in range(10)]
+    summary = UserHistorySummary(user_id="u")
+    for i in (0, 9, 4, 2, 7, 1, 8, 3, 6, 5):
+        summary.apply(stories[i])
+
+    assert summary.story_count == 10
+    assert summary.latest_story_id == "s9"
+    assert summary.latest_content_preview == "preview 9"
+    assert summary.latest_completion_status == 0.9
+    assert summary.latest_created_at == start + timedelta(days=9)
+    assert [ref.story_id for ref in summary.recent_stories] == [f"s{i}" for i in range(10)]
+
+
+def test_from_history_matches_applying_each_story():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    order = [(i * 7) % 30 for i in range(30)]
+    history = [
+        make_story(i, themes=["sea", "family"][: i % 3], characters=["Gran"] * (i % 2), created_at=start + timedelta(hours=i))
+        for i in order
+    ]
+    applied = UserHistorySummary(user_id="u")
+    for story in history:
+        applied.apply(story)
+
+    assert UserHistorySummary.from_history("u", history) == applied
+    assert UserHistorySummary.from_history("u", []) == UserHistorySummary(user_id="u")
+
+
+def test_stage_from_summary_matches_full_history():
+    history = [make_story(i) for i in range(11)]
+    profile = {"user_id": "u"}
+    from_history = ProgressivePromptingSystem(None, profile, content_history=history)
+    from_summary = ProgressivePromptingSystem(
+        None, profile, history_summary=UserHistorySummary.from_history("u", history)
+    )
+    assert from_history.prompting_stage == from_summary.prompting_stage == PromptType.GENRE_SUGGESTION
+
+    unfinished = UserHistorySummary.from_history("u", [make_story(1, completion=0.3)])
+    assert ProgressivePromptingSystem(None, profile, history_summary=unfinished).prompting_stage == PromptType.CONTINUATION
+    assert ProgressivePromptingSystem(None, profile).prompting_stage == PromptType.NEW_TOPIC
+
+
+def test_sqlite_summary_survives_restart(tmp_path):
+    path = str(tmp_path / "summaries.db")
+    first = SQLiteHistorySummaryStore(path)
+    first.apply("u", make_story(1, themes=["war"]))
+    first.apply("u", make_story(2, themes=["war"]))
+    first.close()
+
+    reopened = SQLiteHistorySummaryStore(path).get("u")
+    assert reopened.story_count == 2
+    assert reopened.theme_counts == {"war": 2}
+    assert SQLiteHistorySummaryStore(path).get("nobody").story_count == 0
+
+
+def test_analyzing_a_new_story_updates_the_summary(monkeypatch):
+    monkeypatch.setattr(main, "STORIES", InMemoryStoryRepository())
+    monkeypatch.setattr(main, "HISTORY_SUMMARIES", InMemoryHistorySummaryStore())
+    client = TestClient(main.app)
+    headers = {"X-User-Id": "writer"}
+    created = client.post("/stories", json={"title": "Lake", "content": "We swam at dawn"}, headers=headers).json()
+    main.STORY_ANALYTICS.join()
+
+    summary = main.HISTORY_SUMMARIES.get("writer")
+    assert summary.story_count == 1
+    assert summary.latest_story_id == created["id"]
+    assert summary.latest_content_preview == "We swam at dawn"
+
+
+def test_refinement_prefers_story_matching_top_themes():
+    summary = UserHistorySummary.from_history("u", [
+        make_story(1, themes=["sea"]), make_story(2, themes=["sea", "family"]), make_story(3, themes=["sea"]),
+    ])
+    queries = []
+
+    def search(query, limit):
+        queries.append(query)
+        return [{"id": "s2", "title": "Story 2"}]
+
+    system = ProgressivePromptingSystem(None, {"user_id": "u"}, history_summary=summary, story_search=search)
+    result = asyncio.run(system._create_refinement_prompt())
+
+    assert result["additional_context"]["story_id"] == "s2"
+    assert queries == ["sea family"]
@@ -0,0 +1,93 @@
+"""Usage ledger and /metrics exposition tests."""
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from observability.metrics import MetricsRegistry, SQLiteMetricsStore
+from test_prompt import FakeClient
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(main, "METRICS", registry)
+    monkeypatch.setattr(main, "PROMPT_CACHE", None)
+    monkeypatch.setattr(main, "PROMPT_COALESCER", None)
+    return registry
+
+
+def test_prompt_usage_is_attributed_to_user(registry, monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(main, "get_openai_client", lambda: (client, "test-deployment"))
+    monkeypatch.setattr(main.random, "randrange", lambda n: 1)
+    api = TestClient(main.app)
+    api.get("/prompt", params={"mood": "fun_nostalgia"}, headers={"X-User-Id": "guest_a"})
+
+    text = api.get("/metrics").text
+    assert 'storyscribe_openai_tokens_total{kind="prompt",mood="fun_nostalgia",template="1",user="guest_a"} 50' in text
+    assert 'storyscribe_prompt_requests_total{mood="fun_nostalgia",source="azure_openai"} 1' in text
+    assert 'storyscribe_openai_latency_seconds_bucket{le="+Inf"} 1' in text
+    assert 'storyscribe_user_tokens_window{kind="completion",user="guest_a",window="86400s"} 8' in text
+    assert "# TYPE storyscribe_openai_latency_seconds histogram" in text
+
+
+def test_static_fallback_is_counted(registry, monkeypatch):
+    monkeypatch.setattr(main, "get_openai_client", lambda: (None, None))
+    TestClient(main.app).get("/prompt")
+    assert 'storyscribe_prompt_requests_total{mood="deep_reflection",source="static_fallback"} 1' in registry.render()
+
+
+def test_sqlite_store_merges_workers(tmp_path):
+    path = str(tmp_path / "metrics.db")
+    workers = [MetricsRegistry(SQLiteMetricsStore(path)) for _ in range(2)]
+    for worker in workers:
+        worker.inc("storyscribe_prompt_requests_total", {"source": "azure_openai", "mood": "fun_nostalgia"})
+        worker.record_tokens("guest_a", "fun_nostalgia", "0", 10, 2)
+    workers[0].flush()
+
+    # Worker 1 sees worker 0's flushed totals plus its own pending deltas
+    text = workers[1].render()
+    assert 'storyscribe_prompt_requests_total{mood="fun_nostalgia",source="azure_openai"} 2' in text
+    assert 'storyscribe_user_tokens_window{kind="prompt",user="guest_a",window="86400s"} 20' in text
+
+
+def test_render_during_flush_never_drops_drained_deltas(tmp_path):
+    store = SQLiteMetricsStore(str(tmp_path / "metrics.db"))
+    registry = MetricsRegistry(store)
+    registry.inc("storyscribe_prompt_requests_total", {"source": "cache", "mood": "calm"})
+    applying, release = threading.Event(), threading.Event()
+    apply = store.apply
+
+    def slow_apply(*args, **kwargs):
+        applying.set()
+        release.wait(5)
+        apply(*args, **kwargs)
+
+    store.apply = slow_apply
+    flusher = threading.Thread(target=registry.flush)
+    flusher.start()
+    applying.wait(5)
+    rendered = []
+    reader = threading.Thread(target=lambda: rendered.append(registry.render()))
+    reader.start()
+    release.set()
+    flusher.join()
+    reader.join()
+    assert 'storyscribe_prompt_requests_total{mood="calm",source="cache"} 1' in rendered[0]
+
+
+def test_server_timing_header_on_sampled_requests(monkeypatch):
+    from storage.repository import InMemoryStoryRepository
+
+    monkeypatch.setattr(main, "STORIES", InMemoryStoryRepository())
+    api = TestClient(main.app)
+    headers = {"X-User-Id": "guest_a"}
+    api.post("/stories", json={"title": "t", "content": "c"}, headers=headers)
+
+    traced = api.get("/stories", headers={**headers, "X-Trace": "1"}).headers["server-timing"]
+    assert [entry.split(";")[0] for entry in traced.split(", ")] == ["repository", "serialize", "total"]
+
+    monkeypatch.setattr(main.random, "random", lambda: 0.99)  # above the default sample rate
+    assert "server-timing" not in api.get("/stories", headers=headers).headers
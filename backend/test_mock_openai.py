@@ -0,0 +1,56 @@
+"""The local mock server must satisfy the real openai SDK the backend uses."""
+import asyncio
+
+import httpx
+import openai
+import pytest
+from openai import AsyncAzureOpenAI
+
+from benchmarks.mock_openai import LatencyModel, MockSettings, create_app
+
+
+def make_client(settings: MockSettings) -> AsyncAzureOpenAI:
+    transport = httpx.ASGITransport(app=create_app(settings))
+    return AsyncAzureOpenAI(
+        azure_endpoint="http://mock",
+        api_key="mock",
+        api_version="2024-08-01-preview",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=transport),
+    )
+
+
+def test_sdk_completion_and_stream_against_mock():
+    async def run():
+        client = make_client(MockSettings(latency="fixed:1", chunk_ms=0, seed=3))
+        completion = await client.chat.completions.create(
+            model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}], n=2,
+        )
+        stream = await client.chat.completions.create(
+            model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}], stream=True,
+        )
+        text = "".join([chunk.choices[0].delta.content or "" async for chunk in stream if chunk.choices])
+        return completion, text
+
+    completion, text = asyncio.run(run())
+    assert len(completion.choices) == 2
+    assert completion.choices[0].message.content != completion.choices[1].message.content
+    assert completion.usage.total_tokens > 0
+    assert text.strip().endswith("?")
+
+
+def test_mock_rate_limits_with_retry_after():
+    async def run():
+        client = make_client(MockSettings(latency="fixed:0", rate_limit_rate=1.0, retry_after_seconds=7))
+        await client.chat.completions.create(model="m", messages=[{"role": "user", "content": "hi"}])
+
+    with pytest.raises(openai.RateLimitError) as error:
+        asyncio.run(run())
+    assert error.value.response.headers["retry-after"] == "7"
+
+
+def test_latency_specs():
+    assert LatencyModel("fixed:250").sample() == 0.25
+    assert 0.1 <= LatencyModel("uniform:100:200").sample() <= 0.2
+    with pytest.raises(ValueError):
+        LatencyModel("gamma:1")
@@ -0,0 +1,412 @@
+"""Prompt endpoint tests using a stubbed async Azure OpenAI client."""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from ai.prompt_cache import InMemoryPromptCache, PromptCache, SQLitePromptCache, make_cache_key
+
+
+class FakeCompletions:
+    def __init__(self, text="Which song defined your summer?", delay=0.0, error=None, fail_after_chunks=None):
+        self.text = text
+        self.delay = delay
+        self.error = error
+        self.fail_after_chunks = fail_after_chunks
+        self.calls = 0
+
+    async def create(self, stream=False, n=1, **kwargs):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        if stream:
+            return self._stream()
+        texts = [self.text] + [f"{self.text} ({i})" for i in range(1, n)]
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=f" {text} ")) for text in texts],
+            usage=SimpleNamespace(prompt_tokens=50, completion_tokens=8, total_tokens=58),
+        )
+
+
+    async def _stream(self):
+        yield SimpleNamespace(choices=[])  # Azure content-filter preamble
+        for i, word in enumerate(self.text.split(" ")):
+            if self.fail_after_chunks is not None and i >= self.fail_after_chunks:
+                raise RuntimeError("connection reset")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+
+
+class FakeClient:
+    def __init__(self, **kwargs):
+        self.chat = SimpleNamespace(completions=FakeCompletions(**kwargs))
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    cache = InMemoryPromptCache(serve_ratio=1.0)
+    monkeypatch.setattr(main, "PROMPT_CACHE", cache)
+    return cache
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(main, "get_openai_client", lambda: (client, "test-deployment"))
+    return client
+
+
+def test_prompt_uses_shared_async_client(fake_openai):
+    res = TestClient(main.app).get("/prompt", params={"mood": "fun-nostalgia"})
+    body = res.json()
+    assert body["prompt"] == "Which song defined your summer?"
+    assert body["source"] == "azure_openai"
+    assert body["mood"] == "Fun Nostalgia"
+    assert fake_openai.chat.completions.calls == 1
+
+
+def test_prompt_falls_back_when_upstream_fails(monkeypatch):
+    client = FakeClient(error=RuntimeError("boom"))
+    monkeypatch.setattr(main, "get_openai_client", lambda: (client, "test-deployment"))
+    body = TestClient(main.app).get("/prompt", params={"genre": "adventure"}).json()
+    assert body["source"] == "static_fallback"
+    assert body["prompt"] == main.FALLBACK_PROMPTS["adventure"]
+
+
+def test_prompt_served_from_cache_after_first_call(fake_openai, monkeypatch):
+    monkeypatch.setattr(main.random, "randrange", lambda n: 0)
+    client = TestClient(main.app)
+    first = client.get("/prompt").json()
+    second = client.get("/prompt", params={"genre": " Memoir "}).json()
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["prompt"] == first["prompt"]
+    assert fake_openai.chat.completions.calls == 1
+    stats = client.get("/prompt/cache/stats").json()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+@pytest.mark.parametrize("make_cache", [
+    lambda tmp_path, **kw: InMemoryPromptCache(**kw),
+    lambda tmp_path, **kw: SQLitePromptCache(path=str(tmp_path / "cache.db"), touch_seconds=0, **kw),
+])
+def test_prompt_cache_bounds(tmp_path, make_cache):
+    cache = make_cache(tmp_path, max_keys=2, variants_per_key=2, serve_ratio=1.0)
+    keys = [make_cache_key("memoir", mood, None, 0) for mood in ("a", "b", "c")]
+    for variant in ("one", "two", "three"):
+        cache.put(keys[0], variant)
+    assert sorted(cache._variants(keys[0])) == ["three", "two"]
+
+    cache.put(keys[1], "x")
+    cache.get(keys[0])  # touch key 0 so key 1 is least recently used
+    cache.put(keys[2], "y")
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) in ("two", "three")
+    assert cache.size() == 2
+
+    cache.ttl_seconds = -1
+    assert cache.get(keys[0]) is None
+
+
+def test_prompt_cache_base_requires_storage_methods():
+    class Partial(PromptCache):
+        def size(self):
+            return 0
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_prompt_pool_refills_and_backs_off_on_429():
+    from ai.prompt_pool import PromptPool
+
+    class Throttled(Exception):
+        status_code = 429
+
+    async def scenario():
+        calls = {"n": 0, "throttle": False}
+
+        async def generate(genre, mood_key):
+            calls["n"] += 1
+            if calls["throttle"]:
+                raise Throttled()
+            return f"{genre}:{mood_key}:{calls['n']}"
+
+        pool = PromptPool(generate, [("memoir", "fun_nostalgia")], high_watermark=3, low_watermark=2)
+        pool.start()
+        for _ in range(50):
+            await asyncio.sleep(0)
+        assert pool.stats()["sizes"]["memoir/fun_nostalgia"] == 3
+
+        calls["throttle"] = True
+        assert pool.pop("Memoir", "fun_nostalgia").startswith("memoir:fun_nostalgia")
+        assert pool.pop("memoir", "fun_nostalgia")
+        for _ in range(50):
+            await asyncio.sleep(0)
+        assert pool.rate_limited >= 1
+        assert pool.stats()["backoff_seconds"] >= 1.0
+        assert pool.pop("memoir", "unknown_mood") is None
+        await pool.stop()
+
+    asyncio.run(scenario())
+
+
+def parse_sse(body):
+    events = []
+    for frame in body.strip().split("\n\n"):
+        event_line, data_line = frame.split("\n")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+def test_prompt_stream_forwards_tokens_then_metadata(fake_openai):
+    res = TestClient(main.app).get("/prompt/stream", params={"mood": "action_growth"})
+    assert res.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(res.text)
+    assert "".join(data["text"] for name, data in events if name == "token").strip() == fake_openai.chat.completions.text
+    name, done = events[-1]
+    assert name == "done"
+    assert done["source"] == "azure_openai"
+    assert done["mood"] == "Action & Growth"
+    assert done["model"] == "test-deployment"
+
+
+def test_prompt_stream_falls_back_mid_stream(monkeypatch):
+    client = FakeClient(fail_after_chunks=2)
+    monkeypatch.setattr(main, "get_openai_client", lambda: (client, "test-deployment"))
+    events = parse_sse(TestClient(main.app).get("/prompt/stream").text)
+    names = [name for name, _ in events]
+    assert names[:2] == ["token", "token"] and "reset" in names
+    after_reset = events[names.index("reset") + 1:]
+    assert "".join(d["text"] for n, d in after_reset if n == "token") == main.FALLBACK_PROMPTS["memoir"]
+    assert events[-1][1]["source"] == "static_fallback"
+
+
+def test_prompt_batch_keeps_order_and_returns_partial_results(monkeypatch):
+    cancelled = []
+
+    class SlowNostalgia(FakeCompletions):
+        async def create(self, **kwargs):
+            if "Fun Nostalgia" in kwargs["messages"][1]["content"]:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(True)
+                    raise
+            return await super().create(**kwargs)
+
+    client = FakeClient()
+    client.chat.completions = SlowNostalgia()
+    monkeypatch.setattr(main, "get_openai_client", lambda: (client, "test-deployment"))
+    monkeypatch.setattr(main, "PROMPT_POOL", None)
+
+    specs = [{"mood": mood_key} for mood_key in main.MOODS]
+    body = TestClient(main.app).post("/prompts/batch", json={"specs": specs, "deadline_seconds": 0.3}).json()
+
+    assert body["complete"] is False
+    assert [r["mood"] for r in body["results"]] == [m["label"] for m in main.MOODS.values()]
+    statuses = {r["mood"]: (r["status"], r["source"]) for r in body["results"]}
+    assert statuses.pop("Fun Nostalgia") == ("timeout", "static_fallback")
+    assert set(statuses.values()) == {("ok", "azure_openai")}
+    assert cancelled  # the late item was cancelled before the batch answered
+
+
+def test_upstream_guard_deadline_breaker_and_hedging():
+    from ai.resilience import CircuitBreaker, CircuitOpenError, UpstreamGuard
+
+    async def scenario():
+        guard = UpstreamGuard(deadline_seconds=0.05,
+                              breaker=CircuitBreaker(failure_threshold=2, open_seconds=0.1))
+
+        async def hang():
+            await asyncio.sleep(1)
+
+        for _ in range(2):
+            with pytest.raises(asyncio.TimeoutError):
+                await guard.call(hang)
+        assert guard.breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await guard.call(hang)
+
+        await asyncio.sleep(0.1)
+
+        async def ok():
+            return "fine"
+
+        assert await guard.call(ok) == "fine"  # half-open probe succeeds
+        assert guard.breaker.state == "closed"
+
+        # Hedging: the first attempt stalls, the hedge answers
+        hedged = UpstreamGuard(deadline_seconds=1, hedge_enabled=True, hedge_min_samples=1)
+        hedged.latency.add(0.01)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                await asyncio.sleep(1)
+            return "hedge"
+
+        assert await hedged.call(flaky) == "hedge"
+        assert hedged.stats()["hedging"]["win_rate"] == 1.0
+
+    asyncio.run(scenario())
+
+
+def test_coalescer_shares_one_call_and_diversifies():
+    from ai.coalescing import PromptCoalescer
+
+    async def scenario():
+        coalescer = PromptCoalescer(max_fan_in=4, window_seconds=0.05)
+        fetches = []
+
+        async def fetch(n):
+            fetches.append(n)
+            await asyncio.sleep(0.01)
+            return [f"prompt {i}" for i in range(n)]
+
+        results = await asyncio.gather(*(coalescer.get(("memoir", "fun_nostalgia", ""), fetch) for _ in range(6)))
+        assert fetches == [4, 2]
+        assert sorted(results) == sorted([f"prompt {i}" for i in range(4)] + ["prompt 0", "prompt 1"])
+        assert coalescer.stats()["coalesced"] == 4
+        await asyncio.sleep(0)
+        assert not coalescer._running  # finished flights are released
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_prompt_requests_coalesce(fake_openai, monkeypatch):
+    from ai.coalescing import PromptCoalescer
+
+    monkeypatch.setattr(main, "PROMPT_COALESCER", PromptCoalescer(max_fan_in=8, window_seconds=0.05))
+    monkeypatch.setattr(main, "PROMPT_CACHE", None)
+    monkeypatch.setattr(main.random, "randrange", lambda n: 0)
+
+    async def burst():
+        return await asyncio.gather(*(main.generate_prompt_response("memoir", "fun_nostalgia", None) for _ in range(5)))
+
+    results = asyncio.run(burst())
+    assert fake_openai.chat.completions.calls == 1
+    assert len({r["prompt"] for r in results}) == 5
+
+    # Requests drawing different system prompt templates never share a completion
+    templates = iter([0, 1, 0, 1])
+    monkeypatch.setattr(main.random, "randrange", lambda n: next(templates))
+
+    async def mixed():
+        return await asyncio.gather(*(main.generate_prompt_response("memoir", "fun_nostalgia", None) for _ in range(4)))
+
+    asyncio.run(mixed())
+    assert fake_openai.chat.completions.calls == 3
+
+
+def test_prompt_next_memoizes_analyses_until_stories_change(monkeypatch):
+    from ai.memo import VersionedMemo
+    from storage.history_summary import InMemoryHistorySummaryStore
+    from storage.repository import InMemoryStoryRepository
+
+    monkeypatch.setattr(main, "STORIES", InMemoryStoryRepository())
+    monkeypatch.setattr(main, "HISTORY_SUMMARIES", InMemoryHistorySummaryStore())
+    monkeypatch.setattr(main, "ANALYSIS_MEMO", VersionedMemo())
+    client = FakeClient(text='["Memoir", "Road Trip"]', delay=0.05)
+    monkeypatch.setattr(main, "get_openai_client", lambda: (client, "test-deployment"))
+    api = TestClient(main.app)
+    headers = {"X-User-Id": "writer"}
+    finished = "We drove west along the coast. " * 60  # long and ends a sentence: reads as complete
+    for i in range(10):
+        api.post("/stories", json={"title": f"Day {i}", "content": finished}, headers=headers)
+    main.STORY_ANALYTICS.join()
+
+    first = api.get("/prompt/next", headers=headers).json()
+    assert first["prompt_type"] == "genre_suggestion"
+    assert first["additional_context"]["suggested_genres"] == ["Memoir", "Road Trip"]
+    assert client.chat.completions.calls == 3  # genres, titles and themes
+
+    api.get("/prompt/next", headers=headers)
+    assert client.chat.completions.calls == 3
+    assert main.ANALYSIS_MEMO.stats()["hits"] == 1
+
+    api.post("/stories", json={"title": "Day 10", "content": finished}, headers=headers)
+    main.STORY_ANALYTICS.join()
+    api.get("/prompt/next", headers=headers)
+    assert client.chat.completions.calls == 6
+
+
+def test_analyses_run_concurrently():
+    from ai.content_safety import ProgressivePromptingSystem, UserHistorySummary
+
+    async def complete(system_prompt, user_prompt):
+        await asyncio.sleep(0.1)
+        return '["x"]'
+
+    async def run():
+        system = ProgressivePromptingSystem(
+            None, {"user_id": "u"}, history_summary=UserHistorySummary(user_id="u", story_count=12),
+            complete=complete,
+        )
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        analysis = await system.analyze_history()
+        return analysis, loop.time() - started
+
+    analysis, elapsed = asyncio.run(run())
+    assert analysis.suggested_titles == ["x"] and not analysis.fallback
+    assert elapsed < 0.25
+
+
+def test_prompt_memory_flags_near_duplicates():
+    from ai.prompt_dedup import PromptMemory
+
+    memory = PromptMemory(capacity=4)
+    memory.remember("u", "When did you feel most brave?")
+    assert memory.is_repeat("u", "When did you feel the most brave?")
+    assert not memory.is_repeat("u", "What was your favorite childhood snack, and why?")
+    assert not memory.is_repeat("someone_else", "When did you feel most brave?")
+
+    for i in range(4):  # ring buffer: the oldest prompt is forgotten
+        memory.remember("u", f"Unrelated question number {i} about gardens and {'x' * i}")
+    assert not memory.is_repeat("u", "When did you feel most brave?")
+
+
+def test_prompt_memory_grows_per_user_matrix_on_demand():
+    from ai.prompt_dedup import INITIAL_ROWS, PromptMemory
+
+    memory = PromptMemory(dim=64, capacity=20)
+    memory.remember("u", "Which song defined your summer?")
+    assert memory._users["u"].vectors.shape == (INITIAL_ROWS, 64)
+    assert memory.stats()["vector_bytes"] == INITIAL_ROWS * 64 * 4
+
+    for i in range(30):
+        memory.remember("u", f"Question {i} about a different summer")
+    assert memory._users["u"].vectors.shape == (20, 64)  # doubled up to capacity, never past it
+    assert memory.is_repeat("u", "Question 29 about a different summer")
+
+
+def test_repeated_prompt_is_regenerated_for_the_same_user(monkeypatch):
+    from ai.prompt_dedup import PromptMemory
+
+    texts = iter(["Which song defined your summer?"] * 2 + ["Who taught you to swim?"])
+
+    class SequenceCompletions(FakeCompletions):
+        async def create(self, **kwargs):
+            self.text = next(texts)
+            return await super().create(**kwargs)
+
+    client = FakeClient()
+    client.chat.completions = SequenceCompletions()
+    monkeypatch.setattr(main, "get_openai_client", lambda: (client, "test-deployment"))
+    monkeypatch.setattr(main, "PROMPT_MEMORY", PromptMemory())
+    monkeypatch.setattr(main.random, "randrange", lambda n: 0)
+    api = TestClient(main.app)
+    headers = {"X-User-Id": "writer"}
+
+    first = api.get("/prompt", headers=headers).json()
+    # The cached variant and the next completion are repeats; one retry gets a new question
+    second = api.get("/prompt", headers=headers).json()
+    assert first["prompt"] == "Which song defined your summer?"
+    assert second["prompt"] == "Who taught you to swim?"
+    assert client.chat.completions.calls == 3
+    assert api.get("/prompt/dedup/stats").json()["repeats"] == 2
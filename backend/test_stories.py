@@ -0,0 +1,412 @@
+"""Story endpoint and repository tests (no Azure access required)."""
+import asyncio
+import io
+import re
+import json
+import sqlite3
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from storage.bulk_import import ndjson_lines
+from storage.export import export_epub, iter_stories
+from storage.repository import InMemoryStoryRepository, SQLiteStoryRepository, VersionConflict
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "STORIES", InMemoryStoryRepository())
+    return TestClient(main.app)
+
+
+def test_create_and_list_stories(client):
+    headers = {"X-User-Id": "guest_a"}
+    created = client.post("/stories", json={"title": "First", "content": "Once"}, headers=headers)
+    assert created.status_code == 200
+    client.post("/stories", json={"title": "Second", "content": "Twice"}, headers=headers)
+
+    listed = client.get("/stories", headers=headers).json()
+    assert [s["title"] for s in listed] == ["First", "Second"]
+    assert client.get("/stories", headers={"X-User-Id": "guest_b"}).json() == []
+
+
+def test_missing_user_header_is_rejected(client):
+    assert client.get("/stories").status_code == 401
+
+
+def test_sqlite_repository_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "stories.db")
+    writer = SQLiteStoryRepository(path)
+    reader = SQLiteStoryRepository(path)  # stands in for a second gunicorn worker
+    doc = {
+        "id": "story_1",
+        "title": "Shared",
+        "content": "Visible everywhere",
+        "userId": "guest_a",
+        "createdAt": "2024-01-01T00:00:00+00:00",
+        "updatedAt": "2024-01-01T00:00:00+00:00",
+    }
+    writer.add(doc)
+    assert reader.list_for_user("guest_a") == [doc]
+    writer.close()
+    reader.close()
+
+
+def test_cursor_pagination_walks_every_story_once(client):
+    headers = {"X-User-Id": "guest_a"}
+    for i in range(5):
+        client.post("/stories", json={"title": f"T{i}", "content": "word " * i}, headers=headers)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        res = client.get("/stories", params=params, headers=headers)
+        seen.extend(s["title"] for s in res.json())
+        cursor = res.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == [f"T{i}" for i in range(5)]
+
+
+def test_summary_view_omits_content(client):
+    headers = {"X-User-Id": "guest_a"}
+    story = client.post("/stories", json={"title": "Long", "content": "a b c " * 200}, headers=headers).json()
+
+    summary = client.get("/stories", params={"view": "summary"}, headers=headers).json()[0]
+    assert "content" not in summary
+    assert summary["wordCount"] == 600
+    assert len(summary["preview"]) == main.PREVIEW_CHARS
+
+    projected = client.get("/stories", params={"fields": "id,title"}, headers=headers).json()
+    assert projected == [{"id": story["id"], "title": "Long"}]
+    assert client.get("/stories", params={"fields": "secret"}, headers=headers).status_code == 400
+
+    full = client.get(f"/stories/{story['id']}", headers=headers).json()
+    assert full["content"] == story["content"]
+    assert client.get(f"/stories/{story['id']}", headers={"X-User-Id": "guest_b"}).status_code == 404
+
+
+def test_sqlite_keyset_pages(tmp_path):
+    repo = SQLiteStoryRepository(str(tmp_path / "stories.db"))
+    for i in range(3):
+        repo.add({
+            "id": f"story_{i}", "title": str(i), "content": "", "userId": "u",
+            "createdAt": "2024-01-01T00:00:00+00:00", "updatedAt": "2024-01-01T00:00:00+00:00",
+        })
+    first = repo.list_page("u", limit=2)
+    rest = repo.list_page("u", after=(first[-1]["createdAt"], first[-1]["id"]))
+    assert [d["id"] for d in first + rest] == ["story_0", "story_1", "story_2"]
+    repo.close()
+
+
+def test_search_ranks_and_pages(client):
+    headers = {"X-User-Id": "guest_a"}
+    for title, content in [
+        ("Lighthouse", "The keeper climbed the lighthouse every night"),
+        ("Harbour", "Boats in the harbour, the lighthouse far away"),
+        ("Kitchen", "Baking bread with grandma"),
+    ]:
+        client.post("/stories", json={"title": title, "content": content}, headers=headers)
+    client.post("/stories", json={"title": "Lighthouse", "content": "not yours"}, headers={"X-User-Id": "guest_b"})
+
+    first = client.get("/stories/search", params={"q": "lighthouse", "limit": 1}, headers=headers)
+    assert [s["title"] for s in first.json()] == ["Lighthouse"]
+    assert "content" not in first.json()[0] and first.json()[0]["score"] > 0
+    assert first.headers["X-Next-Offset"] == "1"
+
+    rest = client.get("/stories/search", params={"q": "lighthouse", "offset": 1}, headers=headers)
+    assert [s["title"] for s in rest.json()] == ["Harbour"]
+    assert "X-Next-Offset" not in rest.headers
+
+    # Every term must match; the last one may be a prefix
+    assert [s["title"] for s in client.get("/stories/search", params={"q": "baking gran"}, headers=headers).json()] == ["Kitchen"]
+    assert client.get("/stories/search", params={"q": "baking harbour"}, headers=headers).json() == []
+
+
+def test_sqlite_search_with_tags_and_backfill(tmp_path):
+    path = str(tmp_path / "stories.db")
+    repo = SQLiteStoryRepository(path)
+    for i, (title, content) in enumerate([("Summer", "We swam in the lake"), ("Winter", "Snow on the roofs")]):
+        repo.add({
+            "id": f"story_{i}", "title": title, "content": content, "userId": "guest_a",
+            "createdAt": f"2024-01-0{i + 1}T00:00:00+00:00", "updatedAt": "2024-01-01T00:00:00+00:00",
+        })
+    assert [d["id"] for d, _ in repo.search("guest_a", "swam lake")] == ["story_0"]
+    assert repo.search("guest_b", "lake") == []
+
+    repo.set_tags("guest_a", "story_1", ["family", "Grandpa"])
+    assert [d["id"] for d, _ in repo.search("guest_a", "grandpa")] == ["story_1"]
+    assert repo.search("guest_a", "grandpa lake") == []
+    assert {d["id"] for d, _ in repo.search("guest_a", "grandpa lake", any_terms=True)} == {"story_0", "story_1"}
+    repo.close()
+
+    # Databases written before the index existed are indexed on open
+    conn = sqlite3.connect(path)
+    conn.execute("DROP TABLE stories_fts")
+    conn.commit()
+    conn.close()
+    reopened = SQLiteStoryRepository(path)
+    assert [d["id"] for d, _ in reopened.search("guest_a", "snow")] == ["story_1"]
+    reopened.set_tags("guest_a", "story_1", ["Grandpa"])
+    reopened.close()
+
+    # Indexes written before stories pointed at their index rows keep their tags
+    conn = sqlite3.connect(path)
+    conn.execute("ALTER TABLE stories DROP COLUMN fts_rowid")
+    conn.commit()
+    conn.close()
+    migrated = SQLiteStoryRepository(path)
+    assert [d["id"] for d, _ in migrated.search("guest_a", "grandpa")] == ["story_1"]
+    migrated.set_tags("guest_a", "story_0", ["lakeside"])
+    migrated.set_tags("guest_b", "story_1", ["intruder"])  # not guest_b's story
+    assert [d["id"] for d, _ in migrated.search("guest_a", "lakeside")] == ["story_0"]
+    assert migrated.search("guest_a", "intruder") == []
+    migrated.close()
+
+
+def test_patch_applies_edits_with_etag_concurrency(client, monkeypatch):
+    from storage.history_summary import InMemoryHistorySummaryStore
+    monkeypatch.setattr(main, "HISTORY_SUMMARIES", InMemoryHistorySummaryStore())
+    headers = {"X-User-Id": "guest_a"}
+    created = client.post("/stories", json={"title": "Lake", "content": "We swam at dawn."}, headers=headers)
+    story_id, etag = created.json()["id"], created.headers["ETag"]
+    url = f"/stories/{story_id}"
+
+    assert client.patch(url, json={"edits": []}, headers=headers).status_code == 428
+    edits = {"title": "The lake", "edits": [
+        {"op": "append", "text": " Gran watched."},
+        {"op": "splice", "offset": 3, "delete": 4, "text": "paddled"},
+    ]}
+    patched = client.patch(url, json=edits, headers={**headers, "If-Match": etag})
+    assert patched.status_code == 200
+    assert patched.json()["length"] == len("We paddled at dawn. Gran watched.")
+    assert patched.headers["ETag"] != etag
+
+    # The old ETag is now stale; the 412 carries the current one
+    stale = client.patch(url, json={"edits": [{"op": "append", "text": "!"}]}, headers={**headers, "If-Match": etag})
+    assert stale.status_code == 412
+    assert stale.headers["ETag"] == patched.headers["ETag"]
+    out_of_range = {"edits": [{"op": "splice", "offset": 30, "delete": 10, "text": ""}]}
+    assert client.patch(url, json=out_of_range, headers={**headers, "If-Match": "*"}).status_code == 422
+    for partial in ({"op": "splice", "delete": 2, "text": "x"}, {"op": "splice", "offset": 2, "text": "x"}):
+        assert client.patch(url, json={"edits": [partial]}, headers={**headers, "If-Match": "*"}).status_code == 422
+    assert client.patch(url, json=edits, headers={"X-User-Id": "guest_b", "If-Match": "*"}).status_code == 404
+
+    story = client.get(url, headers=headers)
+    assert story.json()["content"] == "We paddled at dawn. Gran watched."
+    assert story.json()["title"] == "The lake"
+    assert story.json()["updatedAt"] > story.json()["createdAt"]
+    assert story.headers["ETag"] == patched.headers["ETag"]
+
+    # Search and the history summary catch up through the analytics workers
+    main.STORY_ANALYTICS.join()
+    assert [s["id"] for s in client.get("/stories/search", params={"q": "paddled"}, headers=headers).json()] == [story_id]
+    summary = main.HISTORY_SUMMARIES.get("guest_a")
+    assert summary.story_count == 1
+    assert summary.version >= 2
+    assert summary.latest_title == "The lake"
+
+
+def test_sqlite_edits_run_in_place_on_old_databases(tmp_path):
+    path = str(tmp_path / "stories.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE stories (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, title TEXT NOT NULL, "
+                 "content TEXT NOT NULL, created_at TEXT NOT NULL, updated_at TEXT NOT NULL)")
+    conn.execute("INSERT INTO stories VALUES ('story_0', 'guest_a', 'Café', 'Naïve 🙂 start', 't0', 't0')")
+    conn.commit()
+    conn.close()
+
+    repo = SQLiteStoryRepository(path)
+    assert repo.get("guest_a", "story_0")["version"] == 1
+    # Offsets are code points on both sides: the emoji is one character
+    doc = repo.apply_edits("guest_a", "story_0", [
+        {"offset": 8, "delete": 5, "text": "end"}, {"offset": None, "delete": 0, "text": "."},
+    ], "t1", expected_version=1)
+    assert doc["content"] == "Naïve 🙂 end."
+    assert doc["version"] == 2
+    with pytest.raises(VersionConflict):
+        repo.apply_edits("guest_a", "story_0", [], "t2", expected_version=1)
+    assert repo.apply_edits("guest_b", "story_0", [], "t2") is None
+    repo.close()
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_revisions_rebuild_from_snapshots_and_deltas(tmp_path, backend):
+    from storage.revisions import RevisionPolicy
+    policy = RevisionPolicy(snapshot_every=4, snapshot_ratio=10.0, max_revisions=6)
+    repo = (InMemoryStoryRepository(revisions=policy) if backend == "memory"
+            else SQLiteStoryRepository(str(tmp_path / "stories.db"), revisions=policy))
+    repo.add({"id": "story_0", "title": "Draft", "content": "Line 0.", "userId": "guest_a",
+              "createdAt": "t0", "updatedAt": "t0"})
+    expected = {1: "Line 0."}
+    content = "Line 0."
+    for version in range(2, 13):
+        edits = [{"offset": None, "delete": 0, "text": f" Line {version}."},
+                 {"offset": 0, "delete": 4, "text": f"L{version}"}]
+        content = f"L{version}" + (content + f" Line {version}.")[4:]
+        repo.apply_edits("guest_a", "story_0", edits, f"t{version}", title=f"Draft {version}")
+        expected[version] = content
+
+    listed = repo.list_revisions("guest_a", "story_0")
+    versions = [r["version"] for r in listed]
+    # At least max_revisions are kept, trimmed to a snapshot boundary
+    assert versions[0] == 12 and 6 <= len(versions) <= 6 + 4
+    assert listed[-1]["snapshot"]
+    assert [r["version"] for r in listed if r["snapshot"]] == [v for v in versions if (v - 1) % 4 == 0]
+    for version in versions:
+        revision = repo.get_revision("guest_a", "story_0", version)
+        assert revision["content"] == expected[version]
+        assert revision["title"] == ("Draft" if version == 1 else f"Draft {version}")
+    assert repo.get_revision("guest_a", "story_0", 1) is None
+    assert repo.get_revision("guest_b", "story_0", 12) is None
+    assert repo.list_revisions("guest_b", "story_0") is None
+
+
+def test_revision_endpoints(client):
+    headers = {"X-User-Id": "guest_a"}
+    created = client.post("/stories", json={"title": "Lake", "content": "We swam."}, headers=headers)
+    url = f"/stories/{created.json()['id']}"
+    client.patch(url, json={"edits": [{"op": "append", "text": " Then ate."}]},
+                 headers={**headers, "If-Match": created.headers["ETag"]})
+
+    assert [r["version"] for r in client.get(f"{url}/revisions", headers=headers).json()] == [2, 1]
+    assert client.get(f"{url}/revisions/1", headers=headers).json()["content"] == "We swam."
+    assert client.get(f"{url}/revisions/2", headers=headers).json()["content"] == "We swam. Then ate."
+    assert client.get(f"{url}/revisions/3", headers=headers).status_code == 404
+    assert client.get(f"{url}/revisions", headers={"X-User-Id": "guest_b"}).status_code == 404
+
+
+def test_list_etag_and_cached_fragments(client, monkeypatch):
+    from storage.json_cache import StoryJSONCache
+    monkeypatch.setattr(main, "STORY_JSON_CACHE", StoryJSONCache())
+    headers = {"X-User-Id": "guest_a"}
+    created = client.post("/stories", json={"title": "Lake", "content": "We swam at dawn, “early”."}, headers=headers)
+    client.post("/stories", json={"title": "Snow", "content": "Cold"}, headers=headers)
+
+    first = client.get("/stories", params={"view": "summary"}, headers=headers)
+    etag = first.headers["ETag"]
+    assert client.get("/stories", params={"view": "summary"}, headers={**headers, "If-None-Match": etag}).status_code == 304
+    # Different queries and users get different tags
+    assert client.get("/stories", headers={**headers, "If-None-Match": etag}).status_code == 200
+    assert client.get("/stories", params={"view": "summary"},
+                      headers={"X-User-Id": "guest_b", "If-None-Match": etag}).status_code == 200
+
+    # Cached fragments render exactly what the uncached path does
+    monkeypatch.setattr(main, "STORY_JSON_CACHE", None)
+    assert client.get("/stories", params={"view": "summary"}, headers=headers).content == first.content
+    monkeypatch.setattr(main, "STORY_JSON_CACHE", StoryJSONCache())
+    full = client.get("/stories", headers=headers).content
+    assert client.get("/stories", headers=headers).content == full
+    assert main.STORY_JSON_CACHE.stats()["hits"] == 2
+
+    client.patch(f"/stories/{created.json()['id']}", json={"edits": [{"op": "append", "text": " Brr."}]},
+                 headers={**headers, "If-Match": created.headers["ETag"]})
+    changed = client.get("/stories", params={"view": "summary"}, headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()[0]["preview"].endswith("Brr.")
+    assert changed.headers["ETag"] != etag
+
+
+def test_export_streams_every_story_in_order(client, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_BATCH_SIZE", 2)
+    headers = {"X-User-Id": "guest_a"}
+    for i in range(5):
+        client.post("/stories", json={"title": f"Day {i} & night", "content": f"Line {i}\n\nMore {i}"}, headers=headers)
+
+    md = client.get("/stories/export", params={"title": "Summers"}, headers=headers)
+    assert md.headers["content-type"].startswith("text/markdown")
+    assert md.headers["content-disposition"] == 'attachment; filename="stories.md"'
+    assert md.text.startswith("# Summers\n")
+    assert [md.text.index(f"## Day {i} & night") for i in range(5)] == sorted(md.text.index(f"## Day {i} & night") for i in range(5))
+
+    txt = client.get("/stories/export", params={"format": "txt"}, headers=headers).text
+    assert txt.startswith("My Stories\n==========\n") and "More 4" in txt
+
+    epub = client.get("/stories/export", params={"format": "epub"}, headers=headers)
+    book = zipfile.ZipFile(io.BytesIO(epub.content))
+    assert book.namelist()[0] == "mimetype" and book.read("mimetype") == b"application/epub+zip"
+    assert book.getinfo("mimetype").compress_type == zipfile.ZIP_STORED
+    assert book.testzip() is None
+    nav = book.read("OEBPS/nav.xhtml").decode()
+    assert [nav.index(f"Day {i} &amp; night") for i in range(5)] == sorted(nav.index(f"Day {i} &amp; night") for i in range(5))
+    assert book.read("OEBPS/content.opf").decode().count("<itemref ") == 5
+    assert "<p>More 3</p>" in book.read("OEBPS/chapter-4.xhtml").decode()
+
+    assert client.get("/stories/export", params={"format": "pdf"}, headers=headers).status_code == 400
+    empty = client.get("/stories/export", params={"format": "epub"}, headers={"X-User-Id": "guest_b"})
+    assert zipfile.ZipFile(io.BytesIO(empty.content)).read("OEBPS/content.opf").count(b"<itemref ") == 0
+
+
+def test_ndjson_lines_split_across_chunks():
+    async def chunks():
+        for part in (b'{"a":', b'1}\n\n{"b"', b':2}\n' + b"x" * 30, b"y" * 30 + b"\n", b'{"c":3}'):
+            yield part
+
+    async def collect():
+        return [item async for item in ndjson_lines(chunks(), max_line_bytes=40)]
+
+    assert asyncio.run(collect()) == [(1, b'{"a":1}'), (2, b""), (3, b'{"b":2}'), (4, None), (5, b'{"c":3}')]
+
+
+def test_import_reports_bad_lines_and_writes_in_batches(client, monkeypatch):
+    monkeypatch.setattr(main, "IMPORT_BATCH_SIZE", 2)
+    monkeypatch.setattr(main, "IMPORT_MAX_LINE_BYTES", 200)
+    lines = [
+        json.dumps({"title": "Later", "content": "Beach", "createdAt": "2021-06-01T09:00:00+02:00"}),
+        "{not json",
+        json.dumps({"title": "Earlier", "content": "Snow", "createdAt": "2019-12-24"}),
+        "",
+        json.dumps({"content": "No title"}),
+        json.dumps({"title": "Long", "content": "z" * 300}),
+        json.dumps({"title": "Undated", "content": "Today"}),
+    ]
+    body = "\n".join(lines).encode()
+    headers = {"X-User-Id": "guest_a"}
+    # Stream in small chunks so lines straddle chunk boundaries
+    res = client.post("/stories/import", content=(body[i:i + 7] for i in range(0, len(body), 7)), headers=headers)
+    report = res.json()
+    assert res.status_code == 200
+    assert report["imported"] == 3 and report["failed"] == 3
+    assert [e["line"] for e in report["errors"]] == [2, 5, 6]
+    assert report["errors"][1]["error"] == "title: Field required"
+
+    listed = client.get("/stories", headers=headers).json()
+    assert [s["title"] for s in listed] == ["Earlier", "Later", "Undated"]
+    assert listed[1]["createdAt"] == "2021-06-01T07:00:00+00:00" == listed[1]["updatedAt"]
+    assert main.STORIES.collection_version("guest_a") == 2  # one bump per batch
+    assert [d["title"] for d, _ in main.STORIES.search("guest_a", "snow")] == ["Earlier"]
+
+
+def test_sqlite_add_many_indexes_and_records_revisions(tmp_path):
+    repo = SQLiteStoryRepository(str(tmp_path / "stories.db"))
+    docs = [{"id": f"story_{i}", "title": f"Entry {i}", "content": f"dunes {i}", "userId": "guest_a",
+             "createdAt": f"2020-01-0{i + 1}", "updatedAt": f"2020-01-0{i + 1}"} for i in range(3)]
+    repo.add_many(docs)
+    assert [d["id"] for d in repo.list_for_user("guest_a")] == ["story_0", "story_1", "story_2"]
+    assert repo.collection_version("guest_a") == 1
+    assert len(repo.search("guest_a", "dunes")) == 3
+    assert repo.get_revision("guest_a", "story_2", 1)["content"] == "dunes 2"
+    repo.apply_edits("guest_a", "story_2", [{"offset": None, "delete": 0, "text": "!"}], "2020-02-01")
+    assert repo.get_revision("guest_a", "story_2", 2)["content"] == "dunes 2!"
+    repo.close()
+
+
+def test_epub_contents_match_chapters_when_stories_change_mid_export():
+    repo = InMemoryStoryRepository()
+    for i in range(4):
+        repo.add({"id": f"story_{i}", "title": f"Chapter {i}", "content": f"Text {i}", "userId": "guest_a",
+                  "createdAt": f"2024-01-0{i + 1}", "updatedAt": f"2024-01-0{i + 1}"})
+    chunks = []
+    for chunk in export_epub(iter_stories(repo.list_page, "guest_a", batch_size=2), "Book"):
+        chunks.append(chunk)
+        if len(chunks) == 3:  # two chapters written: an older entry is imported meanwhile
+            repo.add({"id": "story_x", "title": "Imported", "content": "Old", "userId": "guest_a",
+                      "createdAt": "2023-01-01", "updatedAt": "2023-01-01"})
+    book = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    nav = book.read("OEBPS/nav.xhtml").decode()
+    links = re.findall(r'<a href="(chapter-\d+\.xhtml)">([^<]*)</a>', nav)
+    assert links
+    for href, title in links:
+        assert f"<h1>{title}</h1>" in book.read(f"OEBPS/{href}").decode()
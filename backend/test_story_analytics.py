@@ -0,0 +1,123 @@
+"""Write-time story analytics: heuristics, the bounded worker queue and reprocess backfills."""
+import threading
+
+from fastapi.testclient import TestClient
+
+import main
+from ai.story_analytics import AnalyticsPipeline, analyze_story, process_story, reprocess
+from storage.history_summary import InMemoryHistorySummaryStore, SQLiteHistorySummaryStore
+from storage.repository import InMemoryStoryRepository, SQLiteStoryRepository
+
+
+def make_doc(i, content, user="u", updated="2024-01-01T00:00:00+00:00"):
+    return {"id": f"story_{i:04d}", "title": f"T{i}", "content": content, "userId": user,
+            "createdAt": f"2024-01-01T00:00:{i:02d}+00:00", "updatedAt": updated}
+
+
+def test_analyze_story_heuristics():
+    finished = analyze_story(make_doc(1, "Every summer Gran took me to the sea and we laughed. " * 30))
+    assert finished.word_count == 330
+    assert finished.completion_status == 1.0
+    assert finished.themes[:2] == ["nature", "family"]
+    assert finished.characters == ["Gran"]
+    assert finished.sentiment == "positive"
+    assert len(finished.content_preview) == main.PREVIEW_CHARS
+
+    draft = analyze_story(make_doc(2, "I was lonely and afraid when Dad left and then"))
+    assert draft.completion_status < 0.1
+    assert draft.sentiment == "negative"
+    assert analyze_story(make_doc(3, "word " * 400 + "to be continued...")).completion_status == 0.5
+
+
+def test_pipeline_backpressure_defers_when_full():
+    release = threading.Event()
+    done = []
+
+    def process(doc):
+        release.wait(5)
+        done.append(doc["id"])
+
+    pipeline = AnalyticsPipeline(process, queue_size=1, workers=1, enqueue_timeout=0.01)
+    results = [pipeline.submit(make_doc(i, "x")) for i in range(4)]
+    # One story is being processed, one waits in the queue, the rest are deferred
+    assert results.count(False) >= 2
+    release.set()
+    pipeline.join()
+    pipeline.stop()
+    assert pipeline.stats()["deferred"] == results.count(False)
+    assert len(done) == results.count(True)
+
+
+def test_new_story_is_analyzed_off_the_request_path(monkeypatch):
+    monkeypatch.setattr(main, "STORIES", InMemoryStoryRepository())
+    monkeypatch.setattr(main, "HISTORY_SUMMARIES", InMemoryHistorySummaryStore())
+    client = TestClient(main.app)
+    headers = {"X-User-Id": "writer"}
+    story = client.post("/stories", json={"title": "Trains", "content": "The train journey with Mum."},
+                        headers=headers).json()
+    main.STORY_ANALYTICS.join()
+
+    analytics = client.get(f"/stories/{story['id']}/analytics", headers=headers).json()
+    assert analytics["themes"] == ["travel", "family"]
+    assert client.get("/stories/search", params={"q": "family"}, headers=headers).json()[0]["id"] == story["id"]
+    assert client.get(f"/stories/{story['id']}/analytics", headers={"X-User-Id": "other"}).status_code == 404
+    assert main.HISTORY_SUMMARIES.get("writer").theme_counts == {"travel": 1, "family": 1}
+
+
+def test_reprocess_backfills_and_rebuilds_summaries(tmp_path):
+    path = str(tmp_path / "stories.db")
+    stories, summaries = SQLiteStoryRepository(path), SQLiteHistorySummaryStore(path)
+    docs = [make_doc(i, "We cooked dinner for the family. " * 50) for i in range(3)]
+    for doc in docs:
+        stories.add(doc)
+    process_story(docs[0], stories, summaries)
+    summaries.apply("u", analyze_story(docs[1]))  # summarized before analytics existed
+    version = summaries.get("u").version
+
+    assert [d["id"] for d in stories.stories_needing_analysis(10)] == [docs[1]["id"], docs[2]["id"]]
+    assert reprocess(stories, summaries, batch_size=1) == {"analyzed": 2, "users": 1}
+    assert stories.stories_needing_analysis(10) == []
+
+    summary = summaries.get("u")
+    assert summary.story_count == 3  # rebuilt, not double counted
+    assert summary.theme_counts == {"food": 3, "family": 3}
+    assert summary.version > version
+    assert [m.story_id for m in stories.list_metadata("u")] == [d["id"] for d in docs]
+    assert reprocess(stories, summaries, all_stories=True)["analyzed"] == 3
+
+
+def test_edits_and_sweeps_count_each_story_once():
+    stories, summaries = InMemoryStoryRepository(), InMemoryHistorySummaryStore()
+    pipeline = AnalyticsPipeline(lambda doc: process_story(doc, stories, summaries), queue_size=100, workers=4,
+                                 backlog=lambda limit, after: stories.stories_needing_analysis(limit, after=after),
+                                 sweep_interval=0)
+    for i in range(20):
+        doc = stories.add(make_doc(i, "We sailed to the island. " * 20))
+        pipeline.submit(doc)
+        edited = stories.apply_edits("u", doc["id"], [{"offset": None, "delete": 0, "text": " Gran waved."}],
+                                     "2024-02-01T00:00:00+00:00")
+        pipeline.submit(edited)
+        pipeline.submit(doc)  # a late, older copy (e.g. from a sweep) doesn't replace the edit
+    pipeline.join()
+    pipeline.sweep()  # nothing is stale; re-queues nothing
+    pipeline.join()
+    pipeline.stop()
+    summary = summaries.get("u")
+    assert summary.story_count == 20
+    assert summary.character_counts == {"Gran": 20}
+    assert stories.stories_needing_analysis(100) == []
+
+
+def test_sweep_requeues_deferred_stories():
+    stories, summaries = InMemoryStoryRepository(), InMemoryHistorySummaryStore()
+    for i in range(5):
+        stories.add(make_doc(i, "We walked the dog in the rain. " * 20))  # saved while analytics was full
+    pipeline = AnalyticsPipeline(lambda doc: process_story(doc, stories, summaries), queue_size=4, workers=1,
+                                 backlog=lambda limit, after: stories.stories_needing_analysis(limit, after=after),
+                                 sweep_interval=0)
+    while stories.stories_needing_analysis(10):
+        pipeline.sweep()
+        pipeline.join()
+    pipeline.stop()
+    assert pipeline.stats()["swept"] == 5
+    assert summaries.get("u").story_count == 5
@@ -0,0 +1,88 @@
+"""Columnar StoryHistory tests."""
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ai.content_safety import ProgressivePromptingSystem, PromptType, StoryMetadata
+from ai.story_history import StoryHistory
+
+
+def make_model(i, **overrides):
+    fields = dict(
+        story_id=f"s{i}",
+        title=f"Story {i}",
+        content_preview=f"preview {i}",
+        created_at=datetime(2024, 5, 1, 12, i, tzinfo=timezone.utc),
+        word_count=100 + i,
+        completion_status=0.9,
+        themes=["family", "travel"][: i % 3],
+        characters=["Gran"] if i % 2 else [],
+        sentiment="positive" if i % 2 else None,
+    )
+    fields.update(overrides)
+    return StoryMetadata(**fields)
+
+
+def test_rows_round_trip_to_models():
+    models = [make_model(i) for i in range(5)]
+    history = StoryHistory(models)
+
+    assert len(history) == 5
+    assert history.to_models() == models
+    assert history[-1].story_id == "s4"
+    assert history[2].themes == ["family", "travel"]
+    assert history[0].characters == [] and history[0].sentiment is None
+    with pytest.raises(IndexError):
+        history[5]
+
+
+def test_accepts_dicts_and_interns_tags():
+    history = StoryHistory()
+    history.append({**make_model(1).model_dump(), "created_at": "2024-05-01T12:00:00Z"})
+    history.append(make_model(2, themes=["family"], characters=["Gran"]))
+
+    assert history[0].created_at == datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    assert history._tags.values.count("family") == 1
+    assert history._tags.values.count("Gran") == 1
+
+
+def test_prompting_system_uses_columnar_history_directly():
+    history = StoryHistory(make_model(i) for i in range(11))
+    system = ProgressivePromptingSystem(None, {"user_id": "u"}, content_history=history)
+
+    assert system.content_history is history
+    assert system.prompting_stage == PromptType.GENRE_SUGGESTION
+    assert system._history_summary is None  # the stage came straight from the columns
+    assert system.history_summary.story_count == 11
+
+
+def test_latest_row_follows_created_at():
+    history = StoryHistory([make_model(2), make_model(5, completion_status=0.3), make_model(1)])
+    assert history.latest().story_id == "s5"
+    assert StoryHistory().latest() is None
+
+    system = ProgressivePromptingSystem(None, {"user_id": "u"}, content_history=history)
+    assert system.prompting_stage == PromptType.CONTINUATION
+
+
+def test_columnar_stage_beats_list_of_dicts():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    entries = [make_model(i % 60, created_at=start + timedelta(minutes=i)).model_dump() for i in range(1000)]
+    history = StoryHistory(entries)
+    profile = {"user_id": "u"}
+
+    def best_of(build, repeats=5):
+        timings = []
+        for _ in range(repeats):
+            began = time.perf_counter()
+            system = build()
+            timings.append(time.perf_counter() - began)
+        return min(timings), system.prompting_stage
+
+    from_dicts, dicts_stage = best_of(lambda: ProgressivePromptingSystem(None, profile, content_history=entries))
+    from_columns, columns_stage = best_of(lambda: ProgressivePromptingSystem(None, profile, content_history=history))
+
+    assert columns_stage == dicts_stage
+    # O(1) column reads against one model per entry: orders of magnitude apart
+    assert from_columns * 20 < from_dicts
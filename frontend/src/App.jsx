@@ -34,7 +34,8 @@ const App = () => {
 
   async function loadStories() {
     try {
-      const res = await fetch(`${API_BASE}/stories`, {
+      // Summary view: list never downloads full story bodies
+      const res = await fetch(`${API_BASE}/stories?view=summary`, {
         headers: { 'X-User-Id': userId }
       });
       if (res.ok) {
@@ -59,7 +60,10 @@ const App = () => {
       });
       if (res.ok) {
         const doc = await res.json();
-        setStories(prev => [...prev, doc]);
+        setStories(prev => [...prev, {
+          ...doc,
+          preview: doc.content.slice(0, 200),
+        }]);
         setTitle('');
         setContent('');
       }
@@ -73,7 +77,9 @@ const App = () => {
   async function fetchPrompt() {
     setLoadingPrompt(true);
     try {
-      const res = await fetch(`${API_BASE}/prompt?genre=memoir`);
+      const res = await fetch(`${API_BASE}/prompt?genre=memoir`, {
+        headers: { 'X-User-Id': userId }
+      });
       const data = await res.json();
       setPrompt(data.prompt || 'No prompt available');
     } catch (error) {
@@ -158,8 +164,8 @@ const App = () => {
               <li key={s.id}>
                 <div className="story-title">{s.title}</div>
                 <div className="story-preview">
-                  {s.content.slice(0, 120)}
-                  {s.content.length > 120 ? '...' : ''}
+                  {s.preview.slice(0, 120)}
+                  {s.preview.length > 120 ? '...' : ''}
                 </div>
               </li>
             ))}
@@ -163,17 +163,25 @@ const StoryInterface = () => {
     
     try {
       // This would be a real API call in production
-      // const response = await fetch(storyId ? `/api/stories/${storyId}` : '/api/stories', {
-      //   method: storyId ? 'PUT' : 'POST',
-      //   headers: {
-      //     'Content-Type': 'application/json',
-      //   },
-      //   body: JSON.stringify({
-      //     title: story.title,
-      //     content: story.content,
-      //     tags: story.tags
-      //   }),
-      // });
+      // New stories are POSTed in full; later autosaves PATCH only what changed
+      // since the last save, guarded by the ETag the server returned:
+      // const response = storyId
+      //   ? await fetch(`/api/stories/${storyId}`, {
+      //       method: 'PATCH',
+      //       headers: { 'Content-Type': 'application/json', 'If-Match': etag },
+      //       body: JSON.stringify({
+      //         title: story.title,
+      //         // e.g. [{ op: 'append', text }] or [{ op: 'splice', offset, delete, text }],
+      //         // offsets in code points (Array.from(content))
+      //         edits: diffSinceLastSave(savedContent, story.content)
+      //       }),
+      //     })
+      //   : await fetch('/api/stories', {
+      //       method: 'POST',
+      //       headers: { 'Content-Type': 'application/json' },
+      //       body: JSON.stringify({ title: story.title, content: story.content }),
+      //     });
+      // etag = response.headers.get('ETag');  // 412: refetch, rebase edits, retry
       
       // Simulate API delay
       await new Promise(resolve => setTimeout(resolve, 1000));
@@ -0,0 +1,149 @@
+"""
+Cold vs warm invocation latency for the generate_prompt Function.
+WHAT: Times module load, the first (cold) invocation and later (warm) invocations.
+WHY: Credential, token and client caching only pay off on warm invocations;
+     this keeps the two numbers separate so regressions are visible.
+HOW: azure.functions, azure.identity and openai are replaced by in-process stubs
+     with configurable latency, so no Azure access is needed.
+
+Usage (from functions/):
+    python benchmarks/cold_warm.py --warm 200 --token-ms 150 --completion-ms 0
+    python benchmarks/cold_warm.py --no-cache   # rebuild credential/client every call
+"""
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+import types
+from types import SimpleNamespace
+
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _sleep_ms(ms: float) -> None:
+    if ms > 0:
+        time.sleep(ms / 1000)
+
+
+def install_stubs(args) -> None:
+    """Register fake azure.functions / azure.identity / openai modules in sys.modules."""
+    azure = sys.modules.get("azure") or types.ModuleType("azure")
+    azure.__path__ = getattr(azure, "__path__", [])
+    sys.modules["azure"] = azure
+
+    functions = types.ModuleType("azure.functions")
+
+    class HttpRequest:
+        def __init__(self, params=None, headers=None):
+            self.params = params or {}
+            self.headers = headers or {}
+
+    class HttpResponse:
+        def __init__(self, body, mimetype=None, status_code=200, headers=None):
+            self.body, self.mimetype, self.status_code = body, mimetype, status_code
+            self.headers = headers or {}
+
+    functions.HttpRequest, functions.HttpResponse = HttpRequest, HttpResponse
+
+    identity = types.ModuleType("azure.identity")
+
+    class DefaultAzureCredential:
+        def __init__(self):
+            _sleep_ms(args.credential_ms)
+
+        def get_token(self, scope):
+            _sleep_ms(args.token_ms)
+            return SimpleNamespace(token="stub-token", expires_on=time.time() + 3600)
+
+    identity.DefaultAzureCredential = DefaultAzureCredential
+
+    openai = types.ModuleType("openai")
+
+    class AzureOpenAI:
+        def __init__(self, azure_endpoint, api_version, api_key=None, azure_ad_token_provider=None):
+            _sleep_ms(args.client_ms)
+            self._token_provider = azure_ad_token_provider
+            self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+        def _create(self, **kwargs):
+            if self._token_provider:
+                self._token_provider()
+            _sleep_ms(args.completion_ms)
+            message = SimpleNamespace(content="What taught you patience?")
+            usage = SimpleNamespace(prompt_tokens=60, completion_tokens=6, total_tokens=66)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    openai.AzureOpenAI = AzureOpenAI
+
+    sys.modules.update({"azure.functions": functions, "azure.identity": identity, "openai": openai})
+
+
+def load_function():
+    sys.modules.pop("generate_prompt", None)
+    start = time.perf_counter()
+    module = importlib.import_module("generate_prompt")
+    return module, (time.perf_counter() - start) * 1000
+
+
+def invoke(module) -> float:
+    request = sys.modules["azure.functions"].HttpRequest({"genre": "memoir", "mood": "fun_nostalgia"})
+    start = time.perf_counter()
+    response = module.main(request)
+    elapsed = (time.perf_counter() - start) * 1000
+    assert "fallback" not in json.loads(response.body), response.body
+    return elapsed
+
+
+def reset_caches(module) -> None:
+    module._credential = module._token = module._client = module._deployment = None
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cold", type=int, default=5, help="fresh module loads to sample")
+    parser.add_argument("--warm", type=int, default=100, help="warm invocations per load")
+    parser.add_argument("--credential-ms", type=float, default=20.0)
+    parser.add_argument("--token-ms", type=float, default=150.0)
+    parser.add_argument("--client-ms", type=float, default=5.0)
+    parser.add_argument("--completion-ms", type=float, default=0.0)
+    parser.add_argument("--no-cache", action="store_true", help="reset module caches before every call")
+    args = parser.parse_args()
+
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://stub.openai.azure.com")
+    sys.path.insert(0, FUNCTIONS_DIR)
+    install_stubs(args)
+
+    loads, colds, warms = [], [], []
+    for _ in range(args.cold):
+        module, load_ms = load_function()
+        loads.append(load_ms)
+        colds.append(invoke(module))
+        for _ in range(args.warm):
+            if args.no_cache:
+                reset_caches(module)
+            warms.append(invoke(module))
+
+    print(json.dumps({
+        "caching": not args.no_cache,
+        "module_load": summarize(loads),
+        "cold_invocation": summarize(colds),
+        "warm_invocation": summarize(warms),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,13 +9,43 @@ import os
 import json
 import logging
 import random
+import threading
+import time
+from contextlib import contextmanager
 import azure.functions as func
+# Heavy SDK imports happen once at module load (cold start), not per invocation
+from azure.identity import DefaultAzureCredential
+from openai import AzureOpenAI
+
+TOKEN_SCOPE = "https://cognitiveservices.azure.com/.default"
+# Refresh the AAD token this long before it expires
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+# Reused across warm invocations of this worker process
+_credential = None
+_token = None
+_client = None
+_deployment = None
+_lock = threading.Lock()
+
+
+def get_token() -> str:
+    """Return a cached AAD token, walking the credential chain only when it nears expiry."""
+    global _credential, _token
+    with _lock:
+        if _token is None or _token.expires_on - TOKEN_REFRESH_MARGIN_SECONDS <= time.time():
+            if _credential is None:
+                _credential = DefaultAzureCredential()
+            _token = _credential.get_token(TOKEN_SCOPE)
+        return _token.token
+
 
 def get_client():
-    """Initialize Azure OpenAI client with proper authentication."""
-    from azure.identity import DefaultAzureCredential
-    from openai import AzureOpenAI
-    
+    """Return the process-wide Azure OpenAI client, creating it on the first invocation."""
+    global _client, _deployment
+    if _client is not None:
+        return _client, _deployment
+
     endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
     deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4o-mini")
     api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
@@ -23,18 +53,22 @@ def get_client():
     if not endpoint:
         raise RuntimeError("AZURE_OPENAI_ENDPOINT environment variable is missing.")
     
-    # Get Azure credential token
-    credential = DefaultAzureCredential()
-    token = credential.get_token("https://cognitiveservices.azure.com/.default")
+    with _lock:
+        if _client is None:
+            api_key = os.getenv("AZURE_OPENAI_API_KEY")
+            if api_key:
+                # Key auth (e.g. the local mock server in backend/benchmarks/mock_openai.py)
+                _client = AzureOpenAI(azure_endpoint=endpoint, api_key=api_key, api_version=api_version)
+            else:
+                # The token provider is called per request, so the client outlives token refreshes
+                _client = AzureOpenAI(
+                    azure_endpoint=endpoint,
+                    azure_ad_token_provider=get_token,
+                    api_version=api_version
+                )
+            _deployment = deployment
     
-    # Create Azure OpenAI client
-    client = AzureOpenAI(
-        azure_endpoint=endpoint,
-        api_key=token.token,
-        api_version=api_version
-    )
-    
-    return client, deployment
+    return _client, _deployment
 
 SYSTEM_PROMPT_TEMPLATES = [
     """Generate ONE ultra-concise personal reflection question.
@@ -99,41 +133,86 @@ def select_system_prompt(mood_config: dict) -> str:
     template = random.choice(SYSTEM_PROMPT_TEMPLATES)
     return template.format(MOOD=mood_config["label"])
 
+# Sampled per-stage timings (Server-Timing header, optional JSON trace log)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_LOG_JSON = os.getenv("TRACE_LOG_JSON", "false").lower() == "true"
+
+
+class StageTimer:
+    """Collects stage durations for one invocation; does nothing when not sampled."""
+
+    def __init__(self, sampled: bool):
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.spans = []
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.sampled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, time.perf_counter() - start))
+
+    def headers(self) -> dict:
+        if not self.sampled:
+            return {}
+        total = time.perf_counter() - self.started
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.spans]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        if TRACE_LOG_JSON:
+            logging.info(json.dumps({
+                "function": "generate_prompt",
+                "total_ms": round(total * 1000, 3),
+                "spans": [{"name": name, "ms": round(seconds * 1000, 3)} for name, seconds in self.spans],
+            }))
+        return {"Server-Timing": ", ".join(entries)}
+
+
 def main(req: func.HttpRequest) -> func.HttpResponse:
     """
     Azure Function HTTP trigger to generate writing prompts using Azure OpenAI.
     """
     logging.info("generate_prompt function invoked.")
+    timer = StageTimer(bool(req.headers.get("x-trace")) or random.random() < TRACE_SAMPLE_RATE)
     
     # Get parameters (genre, mood, preferences)
     genre = req.params.get("genre", "memoir").lower()
     mood_raw = req.params.get("mood")
     preferences = req.params.get("preferences")
-    mood_config = resolve_mood(mood_raw)
-    system_prompt = select_system_prompt(mood_config)
+    with timer.stage("mood"):
+        mood_config = resolve_mood(mood_raw)
     
-    # Build user instructions
-    user_parts = [f"Generate a writing prompt for the genre: {genre}."]
-    user_parts.append(f"Mood guidance: {mood_config['label']} — {mood_config['description']}")
-    if preferences:
-        user_parts.append(f"User preferences: {preferences}")
-    user_parts.append("Return only the prompt.")
-    user_prompt = " ".join(user_parts)
+    with timer.stage("template"):
+        system_prompt = select_system_prompt(mood_config)
+        
+        # Build user instructions
+        user_parts = [f"Generate a writing prompt for the genre: {genre}."]
+        user_parts.append(f"Mood guidance: {mood_config['label']} — {mood_config['description']}")
+        if preferences:
+            user_parts.append(f"User preferences: {preferences}")
+        user_parts.append("Return only the prompt.")
+        user_prompt = " ".join(user_parts)
     
     try:
         # Get OpenAI client
-        client, deployment = get_client()
+        with timer.stage("client"):
+            client, deployment = get_client()
         
         # Call Azure OpenAI
-        completion = client.chat.completions.create(
-            model=deployment,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=80,
-            temperature=0.7
-        )
+        with timer.stage("upstream"):
+            completion = client.chat.completions.create(
+                model=deployment,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                max_tokens=80,
+                temperature=0.7
+            )
         
         # Extract the generated prompt
         generated_prompt = completion.choices[0].message.content.strip()
@@ -149,12 +228,15 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 "total": completion.usage.total_tokens,
             },
         }
+        with timer.stage("serialize"):
+            body = json.dumps(result)
         
         logging.info(f"Successfully generated prompt for genre: {genre}")
         return func.HttpResponse(
-            json.dumps(result), 
+            body, 
             mimetype="application/json", 
-            status_code=200
+            status_code=200,
+            headers=timer.headers()
         )
         
     except Exception as e:
@@ -170,6 +252,6 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse(
             json.dumps(fallback_result), 
             mimetype="application/json", 
-            status_code=200
+            status_code=200,
+            headers=timer.headers()
         )
-    
\ No newline at end of file